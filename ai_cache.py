@@ -0,0 +1,163 @@
+"""
+ai_cache.py — Response cache for AI calls in CivicConnect
+=========================================================
+classify_report() is called on every "AI Auto-Fill" click, often with
+the same title/description. Responses are cached by a hash of the
+normalised input text (case, whitespace and punctuation folded):
+
+  • in-process LRU (OrderedDict) — repeat hits in microseconds
+  • SQLite table ai_cache (migration 013) — survives restarts and is
+    shared by every worker process
+
+Entries expire after a TTL; the table is kept under a row cap by
+evicting the least recently hit entries. A hit never writes: last_hit
+and hit counts are tallied in memory and written with the next store.
+Both tiers hold the JSON text, so every get() returns a fresh object
+that callers may modify. Error/fallback responses are never cached. Hit/miss counters are exposed via stats() and the
+admin-only /ai/cache/stats route.
+"""
+
+import re
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from database import get_db
+
+# ─────────────────────────────────────────────────────────────
+# CONFIG
+# ─────────────────────────────────────────────────────────────
+LRU_SIZE       = 512                  # entries kept in process per cache
+TTL_SECONDS    = 7 * 24 * 3600        # cached responses older than this are ignored/evicted
+MAX_ROWS       = 20000                # SQLite rows kept per cache kind
+EVICT_EVERY    = 100                  # run table eviction every N writes
+
+_PUNCT = re.compile(r"[^\w\s]+")
+_WS    = re.compile(r"\s+")
+
+
+def normalize_text(*parts) -> str:
+    """'Pothole  on MAIN St!!' → 'pothole on main st' — folds trivial differences within each part."""
+    return " | ".join(_WS.sub(" ", _PUNCT.sub(" ", unicodedata.normalize("NFKC", str(p or "")).lower())).strip()
+                      for p in parts)
+
+
+class ResponseCache:
+    """LRU in front of the ai_cache table for one kind of AI response."""
+
+    def __init__(self, kind: str, model: str, lru_size: int = LRU_SIZE,
+                 ttl: int = TTL_SECONDS, max_rows: int = MAX_ROWS):
+        self.kind     = kind
+        self.model    = model
+        self.lru_size = lru_size
+        self.ttl      = ttl
+        self.max_rows = max_rows
+        self._lru     = OrderedDict()          # key → (JSON text, stored_at)
+        self._hits    = {}                     # key → (last hit, hits) not yet written to ai_cache
+        self._lock    = threading.Lock()
+        self._writes  = 0
+        self._metrics = {"lru_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+    def key(self, *parts) -> str:
+        raw = f"{self.kind}\0{self.model}\0{normalize_text(*parts)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._metrics[name] += n
+
+    def _remember(self, key: str, text: str, stored_at: float):
+        with self._lock:
+            self._lru[key] = (text, stored_at)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _note_hit(self, key: str, now: float):
+        """Caller holds _lock."""
+        hits = self._hits.get(key, (now, 0))[1]
+        self._hits[key] = (now, hits + 1)
+
+    def _flush_hits(self, conn):
+        """Write the hits tallied since the last store (caller commits)."""
+        with self._lock:
+            pending, self._hits = self._hits, {}
+        if pending:
+            conn.executemany("UPDATE ai_cache SET last_hit = MAX(last_hit, ?), hits = hits + ? WHERE key = ?",
+                             [(last, hits, key) for key, (last, hits) in pending.items()])
+
+    # ─────────────────────────────────────────────────────────
+    def get(self, *parts, db=None):
+        """Cached value for these inputs, or None."""
+        key, now = self.key(*parts), time.time()
+        with self._lock:
+            hit = self._lru.get(key)
+            if hit and now - hit[1] < self.ttl:
+                self._lru.move_to_end(key)
+                self._metrics["lru_hits"] += 1
+                self._note_hit(key, now)
+                return json.loads(hit[0])
+            if hit:
+                del self._lru[key]
+
+        conn = db or get_db()
+        row  = conn.execute("SELECT value, created_at FROM ai_cache WHERE key = ? AND created_at >= ?",
+                            (key, now - self.ttl)).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        self._remember(key, row["value"], row["created_at"])
+        with self._lock:
+            self._metrics["db_hits"] += 1
+            self._note_hit(key, now)
+        return json.loads(row["value"])
+
+    def put(self, value, *parts, db=None):
+        """Store a response for these inputs."""
+        key, now = self.key(*parts), time.time()
+        text = json.dumps(value)
+        conn = db or get_db()
+        self._flush_hits(conn)
+        conn.execute("""
+            INSERT INTO ai_cache (key, kind, value, created_at, last_hit, hits) VALUES (?,?,?,?,?,0)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value,
+                created_at = excluded.created_at, last_hit = excluded.last_hit
+        """, (key, self.kind, text, now, now))
+        conn.commit()
+        self._remember(key, text, now)
+        self._count("stores")
+        with self._lock:
+            self._writes += 1
+            due = self._writes % EVICT_EVERY == 0
+        if due:
+            self.evict(conn)
+
+    def evict(self, db=None) -> int:
+        """Drop expired rows, then the least recently hit rows beyond max_rows."""
+        conn = db or get_db()
+        self._flush_hits(conn)
+        cur  = conn.execute("DELETE FROM ai_cache WHERE kind = ? AND created_at < ?",
+                            (self.kind, time.time() - self.ttl))
+        removed = cur.rowcount
+        cur = conn.execute("""
+            DELETE FROM ai_cache WHERE key IN (
+                SELECT key FROM ai_cache WHERE kind = ?
+                ORDER BY last_hit DESC LIMIT -1 OFFSET ?)
+        """, (self.kind, self.max_rows))
+        removed += cur.rowcount
+        conn.commit()
+        self._count("evicted", removed)
+        return removed
+
+    def stats(self, db=None) -> dict:
+        conn = db or get_db()
+        rows = conn.execute("SELECT COUNT(*) FROM ai_cache WHERE kind = ?", (self.kind,)).fetchone()[0]
+        with self._lock:
+            m = dict(self._metrics)
+            lru = len(self._lru)
+        hits = m["lru_hits"] + m["db_hits"]
+        total = hits + m["misses"]
+        return dict(m, kind=self.kind, hits=hits, hit_rate=round(hits / total, 3) if total else 0.0,
+                    lru_entries=lru, rows=rows, ttl_seconds=self.ttl, max_rows=self.max_rows)
@@ -1,38 +1,62 @@
 """CivicConnect — AI Features (Classifier, Sentiment, Chatbot)"""
 import anthropic, json
 from config import ANTHROPIC_API_KEY
+from ai_cache import ResponseCache
 
 client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
 MODEL  = "claude-opus-4-6"
+classify_cache = ResponseCache("classify", MODEL)
 
 # ── Feature 1: Classifier ────────────────────────────────────
-def classify_report(title, description):
-    prompt = (
+CATEGORIES = ("Roads","Infrastructure","Sanitation","Utilities","Parks & Recreation",
+              "Public Safety","Drainage","Street Lighting","Other")
+SEVERITIES = ("Low","Medium","High","Critical")
+
+def classify_prompt(title, description):
+    return (
         "You are a civic issue classifier. Analyze the report and respond ONLY with JSON.\n"
         f"Title: {title}\nDescription: {description}\n\n"
         "Return ONLY this JSON structure, no extra text:\n"
-        "{\"category\":\"<Roads|Infrastructure|Sanitation|Utilities|Parks & Recreation|Public Safety|Drainage|Street Lighting|Other>\","
-        "\"severity\":\"<Low|Medium|High|Critical>\","
+        f"{{\"category\":\"<{'|'.join(CATEGORIES)}>\","
+        f"\"severity\":\"<{'|'.join(SEVERITIES)}>\","
         "\"summary\":\"<one sentence>\","
         "\"keywords\":[\"kw1\",\"kw2\"],"
         "\"urgent\":false,"
         "\"reason\":\"<why this severity>\"}"
     )
+
+def parse_json(text):
+    t = text.strip()
+    if t.startswith("```"):
+        t = t.split("```")[1]
+        if t.startswith("json"): t = t[4:]
+    return json.loads(t.strip())
+
+def request_classification(title, description):
+    """The model's classification (cached per title/description). Raises on failure."""
+    cached = classify_cache.get(title, description)
+    if cached is not None:
+        return dict(cached, cached=True)
+    r = client.messages.create(model=MODEL, max_tokens=400,
+            messages=[{"role":"user","content":classify_prompt(title, description)}])
+    result = parse_json(r.content[0].text)
+    classify_cache.put(result, title, description)
+    return result
+
+def classify_report(title, description):
     try:
-        r = client.messages.create(model=MODEL, max_tokens=400,
-                messages=[{"role":"user","content":prompt}])
-        t = r.content[0].text.strip()
-        if t.startswith("```"):
-            t = t.split("```")[1]
-            if t.startswith("json"): t = t[4:]
-        return json.loads(t.strip())
+        return request_classification(title, description)
     except Exception as e:
         return {"category":"Other","severity":"Medium","summary":description[:100],
                 "keywords":[],"urgent":False,"reason":"AI unavailable","error":str(e)}
 
 # ── Feature 2: Sentiment ─────────────────────────────────────
-def analyze_sentiment(reports):
-    if not reports: return []
+SENTIMENT_DEFAULTS = {"sentiment_score":5,"sentiment_label":"Concerned","sentiment_color":"yellow",
+                      "sentiment_emoji":"😐","ai_priority":False,"ai_note":""}
+
+def score_sentiment(reports):
+    """{id: sentiment fields} for the reports the model scored — ids it left out are absent. Raises on failure."""
+    if not reports: return {}
     items = [{"id":r.get("id"),"title":r.get("title",""),
               "description":(r.get("description") or "")[:150],
               "severity":r.get("severity","Medium"),
@@ -45,25 +69,17 @@ def analyze_sentiment(reports):
         "Return a JSON array only. No extra text.\n"
         f"Reports: {json.dumps(items)}"
     )
+    r = client.messages.create(model=MODEL, max_tokens=2000,
+            messages=[{"role":"user","content":prompt}])
+    ids = {item["id"] for item in items}
+    return {s["id"]:{k: s.get(k, v) for k, v in SENTIMENT_DEFAULTS.items()}
+            for s in parse_json(r.content[0].text) if isinstance(s, dict) and s.get("id") in ids}
+
+def analyze_sentiment(reports):
+    if not reports: return []
     try:
-        r = client.messages.create(model=MODEL, max_tokens=2000,
-                messages=[{"role":"user","content":prompt}])
-        t = r.content[0].text.strip()
-        if t.startswith("```"):
-            t = t.split("```")[1]
-            if t.startswith("json"): t = t[4:]
-        smap = {s["id"]:s for s in json.loads(t.strip())}
-        enriched = []
-        for rep in reports:
-            rd = dict(rep)
-            s  = smap.get(rd.get("id"), {})
-            rd.update({"sentiment_score": s.get("sentiment_score",5),
-                       "sentiment_label": s.get("sentiment_label","Concerned"),
-                       "sentiment_color": s.get("sentiment_color","yellow"),
-                       "sentiment_emoji": s.get("sentiment_emoji","😐"),
-                       "ai_priority":     s.get("ai_priority",False),
-                       "ai_note":         s.get("ai_note","")})
-            enriched.append(rd)
+        smap = score_sentiment(reports)
+        enriched = [dict(rep, **smap.get(rep.get("id"), SENTIMENT_DEFAULTS)) for rep in reports]
         enriched.sort(key=lambda x: (not x["ai_priority"], -x["sentiment_score"]))
         return enriched
     except Exception as e:
@@ -75,7 +91,11 @@ def analyze_sentiment(reports):
         return [dict(r) for r in reports]
 
 # ── Feature 3: Chatbot ───────────────────────────────────────
-def chat_with_ai(user_message, chat_history, user_context):
+CHAT_FALLBACK = {"reply":"I am having trouble connecting. Please try the support form below.",
+                 "action":"none","action_label":"",
+                 "quick_replies":["Show my reports","How to escalate?","Contact city hall"]}
+
+def _chat_prompt(chat_history, user_context):
     rep_lines = "\n".join(
         [f"- {r['report_id']}: {r['title']} ({r['severity']}, {r['status']})"
          for r in user_context.get("reports",[])[:5]]
@@ -85,9 +105,13 @@ def chat_with_ai(user_message, chat_history, user_context):
         f"Citizen: {user_context.get('name','Citizen')}\n"
         f"Their reports:\n{rep_lines}\n\n"
         "Be empathetic, concise, professional. Max 3 sentences.\n"
-        "Always respond in JSON: {reply, action(none|escalate|redirect_community|redirect_support|show_reports), action_label, quick_replies[3]}"
     )
     msgs = [{"role":h["role"],"content":h["content"]} for h in chat_history[-10:]]
+    return system, msgs
+
+def chat_with_ai(user_message, chat_history, user_context):
+    system, msgs = _chat_prompt(chat_history, user_context)
+    system += "Always respond in JSON: {reply, action(none|escalate|redirect_community|redirect_support|show_reports), action_label, quick_replies[3]}"
     msgs.append({"role":"user","content":user_message})
     try:
         r = client.messages.create(model=MODEL, max_tokens=500, system=system, messages=msgs)
@@ -97,6 +121,59 @@ def chat_with_ai(user_message, chat_history, user_context):
             if t.startswith("json"): t = t[4:]
         return json.loads(t.strip())
     except Exception as e:
-        return {"reply":"I am having trouble connecting. Please try the support form below.",
-                "action":"none","action_label":"",
-                "quick_replies":["Show my reports","How to escalate?","Contact city hall"]}
+        return dict(CHAT_FALLBACK)
+
+# ── Feature 3b: Streaming chatbot ────────────────────────────
+# The reply streams as plain text; the structured fields follow a marker
+# line as JSON so they can be sent as one final event.
+STREAM_MARKER = "@@META@@"
+
+def stream_chat(user_message, chat_history, user_context):
+    """Yields ("token", text) as the reply arrives, then ("done", {reply, action, action_label, quick_replies})."""
+    system, msgs = _chat_prompt(chat_history, user_context)
+    system += ("Write the reply as plain text first. Then on a new line write "
+               f"{STREAM_MARKER} followed by JSON: {{action(none|escalate|redirect_community|redirect_support|show_reports), "
+               "action_label, quick_replies[3]}")
+    msgs.append({"role":"user","content":user_message})
+    reply, buf, meta = "", "", None
+    try:
+        with client.messages.stream(model=MODEL, max_tokens=500, system=system, messages=msgs) as stream:
+            for text in stream.text_stream:
+                if meta is not None:
+                    meta += text; continue
+                buf += text
+                if STREAM_MARKER in buf:
+                    out, meta = buf.split(STREAM_MARKER, 1)
+                    out, buf = out.rstrip(), ""
+                else:
+                    # hold back a possible partial marker at the end of the buffer
+                    keep = next((n for n in range(len(STREAM_MARKER) - 1, 0, -1)
+                                 if buf.endswith(STREAM_MARKER[:n])), 0)
+                    out, buf = buf[:len(buf) - keep], buf[len(buf) - keep:]
+                if out:
+                    reply += out
+                    yield "token", out
+        if buf:
+            reply += buf
+            yield "token", buf
+    except Exception as e:
+        print(f"⚠️  Chat stream failed after {len(reply)} chars: {e}")
+        if buf and meta is None:
+            # the held-back tail was reply text, not the start of the marker
+            reply += buf
+            yield "token", buf
+        if not reply:
+            yield "token", CHAT_FALLBACK["reply"]
+            yield "done", dict(CHAT_FALLBACK)
+            return
+    try:
+        t = (meta or "").strip().strip("`")
+        if t.startswith("json"): t = t[4:]
+        fields = json.loads(t.strip())
+        if not isinstance(fields, dict): fields = {}
+    except ValueError:
+        fields = {}
+    yield "done", {"reply": reply.strip(),
+                   "action": fields.get("action", "none"),
+                   "action_label": fields.get("action_label", ""),
+                   "quick_replies": fields.get("quick_replies", CHAT_FALLBACK["quick_replies"])}
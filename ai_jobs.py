@@ -0,0 +1,263 @@
+"""
+ai_jobs.py — Durable background queue for AI calls in CivicConnect
+===================================================================
+A slow model response used to pin a Flask worker thread for seconds.
+With async submission the route only inserts a row into ai_jobs
+(migration 014) and returns its id; a small pool of daemon threads
+claims queued jobs, runs the matching handler in JOB_HANDLERS and
+stores the JSON result. Clients poll /ai/jobs/<id>.
+
+  • durable — jobs live in SQLite, so a restart loses nothing. A worker
+    process refreshes heartbeat_at on its running jobs every
+    HEARTBEAT_SECONDS; a 'running' job whose heartbeat is older than
+    STALE_SECONDS belonged to a dead process and is re-queued, however
+    long a live job takes
+  • shared — any process may claim work; claiming is a single
+    UPDATE … RETURNING, so two workers never run the same job
+  • bounded — a failed job is retried up to MAX_ATTEMPTS times with
+    exponential backoff (run_after), and finished jobs are pruned after
+    RETAIN_HOURS
+
+Workers start lazily on the first enqueue (or via start_ai_workers()).
+"""
+
+import json
+import time
+import uuid
+import threading
+from database import get_db, close_thread_db
+
+# ─────────────────────────────────────────────────────────────
+# CONFIG
+# ─────────────────────────────────────────────────────────────
+WORKER_COUNT  = 4          # concurrent model calls per process
+POLL_SECONDS  = 2.0        # idle workers re-check the table this often (jobs from other processes)
+HEARTBEAT_SECONDS = 30     # running jobs' lease is renewed this often
+STALE_SECONDS = 120        # a 'running' job with no heartbeat for this long is assumed dead and re-queued
+MAX_ATTEMPTS  = 3
+RETRY_BASE_SECONDS = 5     # backoff before retry n is RETRY_BASE_SECONDS * 2**(n-1)...
+RETRY_MAX_SECONDS  = 300   # ...capped at this
+RETAIN_HOURS  = 24         # done/failed jobs kept this long for polling
+
+JOB_HANDLERS = {}          # kind → fn(payload dict) → JSON-able result
+
+_wake       = threading.Condition()
+_workers    = []
+_started    = threading.Lock()
+_last_sweep = 0.0
+_running    = set()        # ids of jobs this process is running (heartbeat)
+_running_lock = threading.Lock()
+
+
+def job_handler(kind: str):
+    """Register the function that runs jobs of this kind."""
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+# ─────────────────────────────────────────────────────────────
+# SUBMIT / POLL
+# ─────────────────────────────────────────────────────────────
+def enqueue(kind: str, payload: dict, user_id=None, db=None) -> str:
+    """Queue a job and return its id. Starts the worker pool if needed."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job_id = uuid.uuid4().hex
+    conn   = db or get_db()
+    conn.execute(
+        "INSERT INTO ai_jobs (id, kind, user_id, payload, status, created_at) VALUES (?,?,?,?, 'queued', ?)",
+        (job_id, kind, user_id, json.dumps(payload), time.time()))
+    conn.commit()
+    _notify()
+    return job_id
+
+
+def enqueue_once(kind: str, payload: dict, user_id=None, db=None) -> str:
+    """
+    Queue a job unless one of this kind is already queued or running, and
+    return the new or pending job's id. The check and the insert are a
+    single statement, so concurrent callers never queue two. Jobs left
+    'running' by a dead worker are re-queued first, so they never block.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    conn = db or get_db()
+    requeue_stale(conn)
+    while True:
+        job_id = uuid.uuid4().hex
+        cur = conn.execute("""
+            INSERT INTO ai_jobs (id, kind, user_id, payload, status, created_at)
+            SELECT ?, ?, ?, ?, 'queued', ?
+            WHERE NOT EXISTS (SELECT 1 FROM ai_jobs WHERE kind = ? AND status IN ('queued', 'running'))
+        """, (job_id, kind, user_id, json.dumps(payload), time.time(), kind))
+        conn.commit()
+        if cur.rowcount:
+            _notify()
+            return job_id
+        busy = conn.execute("SELECT id FROM ai_jobs WHERE kind = ? AND status IN ('queued', 'running') "
+                            "LIMIT 1", (kind,)).fetchone()
+        if busy:                          # else it finished in between — try again
+            return busy["id"]
+
+
+def _notify():
+    start_ai_workers()
+    with _wake:
+        _wake.notify()
+
+
+def get_job(job_id: str, db=None):
+    """
+    Returns:
+        {
+          "id", "kind", "user_id",
+          "status"  : 'queued' / 'running' / 'done' / 'failed',
+          "result"  : handler result once done (else None),
+          "error"   : last error message (or None),
+          "attempts": runs so far,
+          "created_at", "finished_at": unix seconds,
+        }
+        or None if no such job.
+    """
+    row = (db or get_db()).execute(
+        "SELECT id, kind, user_id, status, result, error, attempts, created_at, finished_at "
+        "FROM ai_jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def queue_stats(db=None) -> dict:
+    rows = (db or get_db()).execute("SELECT status, COUNT(*) AS n FROM ai_jobs GROUP BY status").fetchall()
+    return dict({"queued": 0, "running": 0, "done": 0, "failed": 0},
+                **{r["status"]: r["n"] for r in rows}, workers=len(_workers))
+
+
+# ─────────────────────────────────────────────────────────────
+# WORKERS
+# ─────────────────────────────────────────────────────────────
+def _claim(conn):
+    """Atomically move the oldest runnable queued job to 'running' and return it."""
+    now = time.time()
+    row = conn.execute("""
+        UPDATE ai_jobs SET status = 'running', started_at = ?, heartbeat_at = ?, attempts = attempts + 1
+        WHERE id = (SELECT id FROM ai_jobs WHERE status = 'queued' AND COALESCE(run_after, 0) <= ?
+                    ORDER BY created_at LIMIT 1)
+          AND status = 'queued'
+        RETURNING id, kind, payload, attempts
+    """, (now, now, now)).fetchone()
+    conn.commit()
+    return row
+
+
+def requeue_stale(db=None) -> int:
+    """
+    Re-queue jobs whose lease lapsed (worker died) and prune old finished
+    jobs. A lapsed job that has already used MAX_ATTEMPTS runs is failed
+    instead, so a job that kills its worker is not retried forever.
+    """
+    conn = db or get_db()
+    now  = time.time()
+    cur  = conn.execute("""
+        UPDATE ai_jobs
+        SET status      = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+            error       = CASE WHEN attempts >= ? THEN 'worker lost (lease expired)' ELSE error END,
+            finished_at = CASE WHEN attempts >= ? THEN ? ELSE finished_at END
+        WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < ?
+    """, (MAX_ATTEMPTS, MAX_ATTEMPTS, MAX_ATTEMPTS, now, now - STALE_SECONDS))
+    conn.execute("DELETE FROM ai_jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                 (now - RETAIN_HOURS * 3600,))
+    conn.commit()
+    return cur.rowcount
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait before re-running a job that has failed `attempts` times."""
+    return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+
+def run_job(conn, job) -> bool:
+    """Run one claimed job and record its outcome. Returns True on success."""
+    with _running_lock:
+        _running.add(job["id"])
+    try:
+        result = JOB_HANDLERS[job["kind"]](json.loads(job["payload"]))
+        conn.execute(
+            "UPDATE ai_jobs SET status = 'done', result = ?, error = NULL, finished_at = ? WHERE id = ?",
+            (json.dumps(result), time.time(), job["id"]))
+        conn.commit()
+        return True
+    except Exception as e:
+        now    = time.time()
+        status = "failed" if job["attempts"] >= MAX_ATTEMPTS else "queued"
+        conn.execute("UPDATE ai_jobs SET status = ?, error = ?, finished_at = ?, run_after = ? WHERE id = ?",
+                     (status, str(e), now, now + retry_delay(job["attempts"]), job["id"]))
+        conn.commit()
+        print(f"⚠️  AI job {job['id']} ({job['kind']}) attempt {job['attempts']} failed: {e}")
+        return False
+    finally:
+        with _running_lock:
+            _running.discard(job["id"])
+
+
+def _heartbeat_loop():
+    """Renew the lease on every job this process is running."""
+    conn = get_db()
+    try:
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            with _running_lock:
+                ids = list(_running)
+            if not ids:
+                continue
+            try:
+                conn.execute(f"UPDATE ai_jobs SET heartbeat_at = ? WHERE status = 'running' "
+                             f"AND id IN ({','.join('?' * len(ids))})", [time.time(), *ids])
+                conn.commit()
+            except Exception as e:
+                print(f"⚠️  AI job heartbeat failed: {e}")
+    finally:
+        close_thread_db()
+
+
+def _worker_loop():
+    global _last_sweep
+    conn = get_db()                       # one thread-local connection per worker
+    try:
+        while True:
+            try:
+                job = _claim(conn)
+                if job is None and time.time() - _last_sweep > STALE_SECONDS:
+                    _last_sweep = time.time()
+                    requeue_stale(conn)
+            except Exception as e:
+                print(f"⚠️  AI worker could not claim a job: {e}")
+                job = None
+            if job is None:
+                with _wake:
+                    _wake.wait(POLL_SECONDS)
+                continue
+            run_job(conn, job)
+    finally:
+        close_thread_db()                 # a worker that dies must not leak its connection
+
+
+def start_ai_workers(count: int = WORKER_COUNT) -> int:
+    """Start the worker pool once per process. Returns the number of workers running."""
+    global _last_sweep
+    with _started:
+        if _workers:
+            return len(_workers)
+        requeue_stale()
+        _last_sweep = time.time()
+        for n in range(count):
+            t = threading.Thread(target=_worker_loop, name=f"ai-worker-{n}", daemon=True)
+            t.start()
+            _workers.append(t)
+        threading.Thread(target=_heartbeat_loop, name="ai-heartbeat", daemon=True).start()
+        print(f"✅ AI job queue started with {count} worker(s)")
+        return count
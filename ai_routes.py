@@ -1,13 +1,52 @@
-from flask import Blueprint, request, jsonify, session
-from ai_features import classify_report, analyze_sentiment, chat_with_ai
-import sqlite3
+import json
+from flask import Blueprint, Response, request, jsonify, session, url_for, stream_with_context
+from ai_features import classify_report, request_classification, chat_with_ai, stream_chat, classify_cache
+from ai_jobs import enqueue, get_job, job_handler, queue_stats
+from database import get_db, get_read_db
+from sentiment_store import list_sentiment, request_refresh
+import classify_backfill                      # registers the 'classify_backfill' job
 
 ai_bp = Blueprint('ai', __name__)
 
-def get_db():
-    db = sqlite3.connect('civic_connect.db')
-    db.row_factory = sqlite3.Row
-    return db
+# ── Background jobs ────────────────────────────────────────────
+# /ai/classify and /ai/chat accept {"async": true} (or ?async=1): it then queues
+# the model call and answers 202 with a job id to poll at /ai/jobs/<id>.
+# /ai/sentiment?async=1 does the same for a sentiment refresh.
+# The classify job raises on a failed model call, so ai_jobs retries it with backoff;
+# the synchronous route answers with classify_report()'s fallback instead.
+@job_handler('classify')
+def _classify_job(p):
+    return dict(request_classification(p['title'], p['description']), success=True)
+
+@job_handler('chat')
+def _chat_job(p):
+    result = chat_with_ai(p['message'], p['history'], p['user_context'])
+    return {'reply': result.get('reply', ''), 'quick_replies': result.get('quick_replies', [])}
+
+def _wants_async(data=None):
+    return bool((data or {}).get('async')) or request.args.get('async') == '1'
+
+def _submit(kind, payload):
+    return _accepted(enqueue(kind, payload, session.get('user_id')))
+
+def _accepted(job_id):
+    return jsonify({'job_id': job_id, 'status': 'queued',
+                    'poll_url': url_for('ai.ai_job_status', job_id=job_id)}), 202
+
+@ai_bp.route('/ai/jobs/<job_id>')
+def ai_job_status(job_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    job = get_job(job_id)
+    if job is None or (job['user_id'] != session['user_id'] and session.get('role') != 'admin'):
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@ai_bp.route('/ai/jobs')
+def ai_job_queue():
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(queue_stats())
 
 # ── Route 1: AI Classifier ─────────────────────────────────────
 @ai_bp.route('/ai/classify', methods=['POST'])
@@ -19,22 +58,39 @@ def ai_classify():
     description = data.get('description', '').strip()
     if not title or not description:
         return jsonify({'error': 'Title and description required'}), 400
+    if _wants_async(data):
+        return _submit('classify', {'title': title, 'description': description})
     result = classify_report(title, description)
-    result['success'] = 'error' not in result
-    return jsonify(result)
+    return jsonify(dict(result, success='error' not in result))
+
+@ai_bp.route('/ai/cache/stats')
+def ai_cache_stats():
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({'classify': classify_cache.stats()})
+
+@ai_bp.route('/ai/classify/backfill', methods=['POST'])
+def ai_classify_backfill():
+    """Advance the bulk classification backfill (apply ended batches, submit the next) in the background."""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    limit = request.args.get('limit', classify_backfill.BATCH_LIMIT, type=int)
+    return _accepted(classify_backfill.request_backfill(user_id=session['user_id'], limit=limit))
 
 # ── Route 2: AI Sentiment ──────────────────────────────────────
+# Read-only: served from report_sentiment, with `pending` = reports awaiting a score.
+# Scoring runs on the sentiment scheduler; ?async=1 queues a refresh now and answers
+# 202 with its job id.
 @ai_bp.route('/ai/sentiment')
 def ai_sentiment():
     if 'user_id' not in session or session.get('role') != 'admin':
         return jsonify({'error': 'Unauthorized'}), 401
-    db = get_db()
-    reports = db.execute(
-        "SELECT id, title, description, status, severity FROM reports WHERE status != 'Resolved' ORDER BY created_at DESC LIMIT 20"
-    ).fetchall()
-    db.close()
-    reports_list = [dict(r) for r in reports]
-    result = analyze_sentiment(reports_list)
+    if _wants_async():
+        return _accepted(request_refresh(user_id=session['user_id']))
+    result = list_sentiment(sort=request.args.get('sort', 'priority'),
+                            cursor=request.args.get('cursor'),
+                            limit=request.args.get('limit', 25, type=int),
+                            db=get_read_db())
     return jsonify(result)
 
 # ── Route 3: AI Chatbot ────────────────────────────────────────
@@ -47,15 +103,40 @@ def ai_chat():
     history      = data.get('history', [])
     if not user_message:
         return jsonify({'error': 'Message required'}), 400
+    payload = {'message': user_message, 'history': history, 'user_context': _chat_context()}
+    if _wants_async(data):
+        return _submit('chat', payload)
+    return jsonify(_chat_job(payload))
+
+def _chat_context():
     db = get_db()
     reports = db.execute(
         'SELECT report_id, title, severity, status FROM reports WHERE user_id=? ORDER BY created_at DESC',
         (session['user_id'],)
     ).fetchall()
-    db.close()
-    user_context = {
+    return {
         'name'   : session.get('full_name', 'Citizen'),
         'reports': [dict(r) for r in reports]
     }
-    result = chat_with_ai(user_message, history, user_context)
-    return jsonify({'reply': result.get('reply', ''), 'quick_replies': result.get('quick_replies', [])})
+
+# ── Route 4: AI Chatbot, streamed ──────────────────────────────
+# Server-Sent Events: "token" events carry reply text as it is generated,
+# one final "done" event carries {reply, action, action_label, quick_replies}.
+@ai_bp.route('/ai/chat/stream', methods=['POST'])
+def ai_chat_stream():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    data         = request.get_json()
+    user_message = data.get('message', '').strip()
+    history      = data.get('history', [])
+    if not user_message:
+        return jsonify({'error': 'Message required'}), 400
+    user_context = _chat_context()
+
+    def events():
+        for kind, value in stream_chat(user_message, history, user_context):
+            body = {'text': value} if kind == 'token' else value
+            yield f"event: {kind}\ndata: {json.dumps(body)}\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -1,8 +1,19 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, abort
 from satellite_routes import sat_bp
-from image_hash_util import process_uploaded_image, save_image_hash
+from image_hash_util import process_uploaded_image
 from ai_routes import ai_bp
-import sqlite3, os, json, uuid, base64
+from database import get_db, get_read_db, init_app, pool_stats
+from query_log import query_stats
+from migrations import run_migrations
+from hash_index import rebuild_hash_index, nearest_reports, duplicate_cluster_reports
+from ai_jobs import enqueue_once, job_handler
+from thumbnails import DERIVATIVE_SIZES, CACHE_MAX_AGE, MUTABLE_MAX_AGE, is_servable, make_derivative
+from upload_store import MAX_UPLOAD_BYTES, is_content_path
+from upload_gc import sweep, start_gc_scheduler
+from sentiment_store import start_sentiment_scheduler
+from classify_backfill import start_backfill_scheduler
+from report_store import create_report, get_report_counters, get_user_summary, list_reports, listing_args
+import os, json, uuid, base64
 from datetime import datetime, timedelta
 from functools import wraps
 from werkzeug.utils import secure_filename
@@ -15,89 +26,22 @@ app.secret_key = 'civic_connect_secret_2024'
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES   # larger requests get 413 before the body is read
+app.config['IMAGE_DUP_THRESHOLD'] = 6   # max pHash bit difference treated as the same photo (0 = exact only)
+app.config['IMAGE_DUP_EXACT_THRESHOLD'] = 2   # copies this close are refused whatever the location
+app.config['IMAGE_DUP_RADIUS_M']  = 150 # looser geotagged matches only count against reports this close...
+app.config['IMAGE_DUP_DAYS']      = 30  # ...and this recent
+app.config['SCHEDULE_UPLOAD_GC']  = True   # nightly orphan sweep when run as `python app.py` (else cron upload_gc.py)
+app.config['SCHEDULE_SENTIMENT']  = True   # score new/changed reports every 15 min (else cron sentiment_store.py)
+app.config['SCHEDULE_CLASSIFY_BACKFILL'] = False  # opt-in: queue a paid batch classification step every 30 min (else admin job / CLI)
+init_app(app)
 
 # ─────────────────────────────────────────
 # DATABASE SETUP
 # ─────────────────────────────────────────
-def get_db():
-    db = sqlite3.connect('civic_connect.db')
-    db.row_factory = sqlite3.Row
-    return db
-
 def init_db():
     db = get_db()
-    db.executescript('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL DEFAULT 'citizen',
-            full_name TEXT,
-            email TEXT,
-            phone TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS reports (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            report_id TEXT UNIQUE NOT NULL,
-            user_id INTEGER NOT NULL,
-            title TEXT NOT NULL,
-            category TEXT NOT NULL,
-            description TEXT NOT NULL,
-            location_address TEXT,
-            latitude REAL,
-            longitude REAL,
-            image_path TEXT,
-            status TEXT DEFAULT 'Pending',
-            severity TEXT DEFAULT 'Medium',
-            admin_notes TEXT,
-            label TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS community_posts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            report_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            message TEXT,
-            likes INTEGER DEFAULT 0,
-            dislikes INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (report_id) REFERENCES reports(id),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS post_reactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            post_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            reaction TEXT NOT NULL,
-            UNIQUE(post_id, user_id)
-        );
-
-        CREATE TABLE IF NOT EXISTS surveys (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            q1 TEXT, q2 TEXT, q3 TEXT, q4 TEXT, q5 TEXT,
-            submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS consultations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            type TEXT NOT NULL,
-            department TEXT,
-            message TEXT,
-            status TEXT DEFAULT 'Open',
-            admin_reply TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-    ''')
+    run_migrations(db)
 
     # Seed default users
     try:
@@ -130,7 +74,8 @@ def init_db():
         db.commit()
     except Exception as e:
         print(f"Seed error (likely already seeded): {e}")
-    db.close()
+
+    rebuild_hash_index(db)
 
 # ─────────────────────────────────────────
 # AUTH DECORATORS
@@ -159,6 +104,11 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    flash(f'Upload too large — the limit is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.', 'error')
+    return redirect(request.referrer or url_for('index'))
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -179,7 +129,6 @@ def login():
         db = get_db()
         user = db.execute('SELECT * FROM users WHERE username=? AND password=? AND role=?',
                           (username, password, role)).fetchone()
-        db.close()
 
         if user:
             session['user_id']   = user['id']
@@ -206,11 +155,10 @@ def citizen_dashboard():
     db = get_db()
     reports = db.execute('SELECT * FROM reports WHERE user_id=? ORDER BY created_at DESC LIMIT 5',
                          (session['user_id'],)).fetchall()
-    total   = db.execute('SELECT COUNT(*) FROM reports WHERE user_id=?', (session['user_id'],)).fetchone()[0]
-    pending = db.execute("SELECT COUNT(*) FROM reports WHERE user_id=? AND status='Pending'", (session['user_id'],)).fetchone()[0]
-    resolved= db.execute("SELECT COUNT(*) FROM reports WHERE user_id=? AND status='Resolved'", (session['user_id'],)).fetchone()[0]
-    db.close()
-    return render_template('citizen/dashboard.html', reports=reports, total=total, pending=pending, resolved=resolved)
+    summary = get_user_summary(session['user_id'], db)
+    return render_template('citizen/dashboard.html', reports=reports, total=summary['total'],
+                           pending=summary['pending'], in_progress=summary['in_progress'],
+                           resolved=summary['resolved'], last_activity=summary['last_activity'])
 
 @app.route('/citizen/report', methods=['GET', 'POST'])
 @citizen_required
@@ -224,44 +172,35 @@ def report_issue():
         longitude   = request.form.get('longitude')
         severity    = request.form.get('severity', 'Medium')
         image_path  = None
+        hashes      = {}
 
         if 'image' in request.files:
             f = request.files['image']
             if f and f.filename and allowed_file(f.filename):
-                result = process_uploaded_image(f, app.config['UPLOAD_FOLDER'])
+                result = process_uploaded_image(f, app.config['UPLOAD_FOLDER'],
+                                                latitude=latitude, longitude=longitude)
+                if result['error']:
+                    flash(f"⚠️ {result['error']}", 'error')
+                    return redirect(url_for('report_issue'))
                 image_path = result['saved_path']
+                hashes     = result['hashes']
                 # ── Duplicate image detection ──
                 if result['is_duplicate']:
                     flash(
-                        f"⚠️ Duplicate image detected! This photo was already used in report "
+                        f"⚠️ Duplicate image detected! This photo{' (or a near-identical copy)' if result['distance'] else ''} was already used in report "
                         f"{result['report_id']} — '{result['title']}'. "
                         f"Please check that report or submit a new photo.",
                         'warning'
                     )
                     return redirect(url_for('report_issue'))
 
+        # Report and image hash go in with one INSERT and one commit
         report_id = f"RPT-{uuid.uuid4().hex[:6].upper()}"
-        db = get_db()
-        db.execute('''INSERT INTO reports (report_id,user_id,title,category,description,
-                      location_address,latitude,longitude,image_path,severity)
-                      VALUES (?,?,?,?,?,?,?,?,?,?)''',
-                   (report_id, session['user_id'], title, category, description,
-                    address, latitude, longitude, image_path, severity))
-        db.commit()
-        # Save image hash for duplicate detection
-        if image_path:
-            new_report = db.execute("SELECT id FROM reports WHERE report_id=?", (report_id,)).fetchone()
-            if new_report:
-                from image_hash_util import save_image_hash as _save_hash
-                try:
-                    from image_hash_util import get_image_hash as _get_hash
-                    import os as _os
-                    full_path = _os.path.join('static', image_path)
-                    _hash = _get_hash(full_path)
-                    _save_hash(new_report['id'], _hash)
-                except Exception:
-                    pass
-        db.close()
+        create_report(dict(report_id=report_id, user_id=session['user_id'], title=title,
+                           category=category, description=description, location_address=address,
+                           latitude=latitude, longitude=longitude, image_path=image_path,
+                           severity=severity, image_hash=hashes.get('phash'),
+                           image_dhash=hashes.get('dhash'), image_whash=hashes.get('whash')))
         flash(f'Report {report_id} submitted successfully!', 'success')
         return redirect(url_for('track_reports'))
     return render_template('citizen/report_issue.html')
@@ -269,11 +208,10 @@ def report_issue():
 @app.route('/citizen/track')
 @citizen_required
 def track_reports():
-    db = get_db()
-    reports = db.execute('SELECT * FROM reports WHERE user_id=? ORDER BY created_at DESC',
-                         (session['user_id'],)).fetchall()
-    db.close()
-    return render_template('citizen/track_reports.html', reports=reports)
+    args = listing_args(request.args)
+    page = list_reports(user_id=session['user_id'], **args)
+    return render_template('citizen/track_reports.html', reports=page['reports'],
+                           next_cursor=page['next_cursor'], filters=args['filters'], sort=args['sort'])
 
 @app.route('/citizen/survey', methods=['GET', 'POST'])
 @citizen_required
@@ -290,10 +228,8 @@ def survey():
         db.execute('INSERT INTO surveys (user_id,q1,q2,q3,q4,q5) VALUES (?,?,?,?,?,?)',
                    (session['user_id'], q1, q2, q3, q4, q5))
         db.commit()
-        db.close()
         flash('Thank you for completing the survey!', 'success')
         return redirect(url_for('citizen_dashboard'))
-    db.close()
     return render_template('citizen/survey.html', already=already)
 
 @app.route('/citizen/community')
@@ -311,7 +247,6 @@ def community():
     # Reports eligible to be forwarded (Pending > 3 days or In Progress with no update)
     eligible = db.execute('''SELECT * FROM reports WHERE user_id=? AND status != 'Resolved' ''',
                           (session['user_id'],)).fetchall()
-    db.close()
     return render_template('citizen/community.html', posts=posts, eligible_reports=eligible)
 
 @app.route('/citizen/community/forward', methods=['POST'])
@@ -327,7 +262,6 @@ def forward_report():
                    (report_id, session['user_id'], message))
         db.commit()
         flash('Report forwarded to community!', 'success')
-    db.close()
     return redirect(url_for('community'))
 
 @app.route('/citizen/community/react', methods=['POST'])
@@ -355,7 +289,6 @@ def react_post():
         col = 'likes' if reaction == 'like' else 'dislikes'
         db.execute(f'UPDATE community_posts SET {col}={col}+1 WHERE id=?', (post_id,))
     db.commit()
-    db.close()
     return redirect(url_for('community'))
 
 @app.route('/citizen/support', methods=['GET', 'POST'])
@@ -369,13 +302,11 @@ def get_support():
         db.execute('INSERT INTO consultations (user_id,type,department,message) VALUES (?,?,?,?)',
                    (session['user_id'], ctype, department, message))
         db.commit()
-        db.close()
         flash(f'Your {ctype} request has been submitted!', 'success')
         return redirect(url_for('get_support'))
     db = get_db()
     consultations = db.execute('SELECT * FROM consultations WHERE user_id=? ORDER BY created_at DESC',
                                (session['user_id'],)).fetchall()
-    db.close()
     return render_template('citizen/support_ai.html', consultations=consultations)
 
 # ─────────────────────────────────────────
@@ -384,18 +315,20 @@ def get_support():
 @app.route('/admin/dashboard')
 @admin_required
 def admin_dashboard():
-    db = get_db()
-    reports  = db.execute('SELECT r.*, u.full_name FROM reports r JOIN users u ON r.user_id=u.id ORDER BY r.created_at DESC').fetchall()
-    total    = db.execute('SELECT COUNT(*) FROM reports').fetchone()[0]
-    pending  = db.execute("SELECT COUNT(*) FROM reports WHERE status='Pending'").fetchone()[0]
-    progress = db.execute("SELECT COUNT(*) FROM reports WHERE status='In Progress'").fetchone()[0]
-    resolved = db.execute("SELECT COUNT(*) FROM reports WHERE status='Resolved'").fetchone()[0]
-    critical = db.execute("SELECT COUNT(*) FROM reports WHERE severity='Critical'").fetchone()[0]
+    db = get_read_db()
+    args     = listing_args(request.args)
+    page     = list_reports(db=db, **args)
+    counters = get_report_counters(db)
     citizens = db.execute("SELECT COUNT(*) FROM users WHERE role='citizen'").fetchone()[0]
-    db.close()
-    stats = dict(total=total, pending=pending, progress=progress, resolved=resolved,
-                 critical=critical, citizens=citizens)
-    return render_template('admin/dashboard.html', reports=reports, stats=stats)
+    stats = dict(total    = counters['total'],
+                 pending  = counters['status'].get('Pending', 0),
+                 progress = counters['status'].get('In Progress', 0),
+                 resolved = counters['status'].get('Resolved', 0),
+                 critical = counters['severity'].get('Critical', 0),
+                 citizens = citizens)
+    return render_template('admin/dashboard.html', reports=page['reports'], stats=stats,
+                           next_cursor=page['next_cursor'], filters=args['filters'], sort=args['sort'],
+                           categories=sorted(counters['category']), sources=sorted(counters['source']))
 
 @app.route('/admin/report/update', methods=['POST'])
 @admin_required
@@ -410,7 +343,6 @@ def update_report():
                   updated_at=CURRENT_TIMESTAMP WHERE id=?''',
                (status, severity, label, admin_notes, report_id))
     db.commit()
-    db.close()
     flash('Report updated successfully!', 'success')
     return redirect(url_for('admin_dashboard'))
 
@@ -436,38 +368,147 @@ def weather_alert():
             'wind':      random.randint(5, 40),
             'alert':     conditions[idx] in ['Heavy Rain', 'Thunderstorm']
         })
-    db = get_db()
+    db = get_read_db()
     critical_reports = db.execute(
         "SELECT r.*, u.full_name FROM reports r JOIN users u ON r.user_id=u.id WHERE r.severity IN ('Critical','High') AND r.status!='Resolved' ORDER BY r.created_at DESC"
     ).fetchall()
-    db.close()
     return render_template('admin/weather_alert.html', weather=weather_data, critical_reports=critical_reports)
 
 @app.route('/admin/map')
 @admin_required
 def map_view():
-    db = get_db()
+    db = get_read_db()
     reports = db.execute('''SELECT r.*, u.full_name FROM reports r JOIN users u ON r.user_id=u.id
                             WHERE r.latitude IS NOT NULL AND r.longitude IS NOT NULL''').fetchall()
-    reports_list = [dict(r) for r in reports]
-    db.close()
+    reports_list = [dict(r, thumb_url=image_url(r['image_path']) if r['image_path'] else None) for r in reports]
     return render_template('admin/map_view.html', reports=reports_list, reports_json=json.dumps(reports_list))
 
+# ─────────────────────────────────────────
+# MEDIA — resized WebP derivatives of report images
+# ─────────────────────────────────────────
+@app.template_global()
+def image_url(image_path, size='thumb'):
+    """URL of a report image's derivative (use size='medium' for larger previews)."""
+    return url_for('media', size=size, image_path=image_path.replace('\\', '/'))
+
+@app.route('/media/<size>/<path:image_path>')
+def media(size, image_path):
+    if size not in DERIVATIVE_SIZES or not is_servable(image_path) \
+            or not os.path.isfile(os.path.join('static', image_path)):
+        abort(404)
+    try:
+        path = make_derivative(image_path, size)
+    except Exception:
+        app.logger.exception("Derivative %s for %s failed; serving the original", size, image_path)
+        return redirect(url_for('static', filename=image_path))
+    if is_content_path(image_path):   # bytes can never change under this path
+        resp = send_file(path, mimetype='image/webp', max_age=CACHE_MAX_AGE, conditional=True)
+        resp.headers['Cache-Control'] = f'public, max-age={CACHE_MAX_AGE}, immutable'
+    else:
+        resp = send_file(path, mimetype='image/webp', max_age=MUTABLE_MAX_AGE, conditional=True)
+        resp.headers['Cache-Control'] = f'public, max-age={MUTABLE_MAX_AGE}'
+    return resp
+
 # ─────────────────────────────────────────
 # API ENDPOINTS
 # ─────────────────────────────────────────
+@app.route('/api/reports')
+@login_required
+def reports_api():
+    """Keyset-paginated report listing — all reports for admins, own reports for citizens."""
+    args    = listing_args(request.args)
+    if session.get('role') == 'admin':
+        page = list_reports(db=get_read_db(), **args)
+    else:
+        page = list_reports(user_id=session['user_id'], **args)
+    return jsonify({
+        'reports'    : [dict(r) for r in page['reports']],
+        'next_cursor': page['next_cursor'],
+        'sort'       : args['sort'],
+        'filters'    : args['filters'],
+    })
+
 @app.route('/api/reports/stats')
 @admin_required
 def report_stats_api():
-    db = get_db()
-    by_category = db.execute("SELECT category, COUNT(*) as count FROM reports GROUP BY category").fetchall()
-    by_severity = db.execute("SELECT severity, COUNT(*) as count FROM reports GROUP BY severity").fetchall()
-    db.close()
+    counters = get_report_counters(get_read_db())
     return jsonify({
-        'by_category': [dict(r) for r in by_category],
-        'by_severity': [dict(r) for r in by_severity]
+        'by_category': [{'category': k, 'count': v} for k, v in counters['category'].items()],
+        'by_severity': [{'severity': k, 'count': v} for k, v in counters['severity'].items()]
     })
 
+@app.route('/api/reports/<int:report_db_id>/similar')
+@admin_required
+def similar_reports_api(report_db_id):
+    """Top-k reports whose photos are closest to this report's (pHash Hamming distance)."""
+    db     = get_read_db()
+    report = db.execute('SELECT image_hash FROM reports WHERE id=?', (report_db_id,)).fetchone()
+    if not report or not report['image_hash']:
+        return jsonify({'error': 'Report has no image hash'}), 404
+    k       = min(request.args.get('k', 5, type=int), 50)
+    matches = [(d, rid) for d, rid in nearest_reports(report['image_hash'], k + 1, db=db) if rid != report_db_id][:k]
+    rows    = {r['id']: r for r in db.execute(
+        f"SELECT id, report_id, title, status FROM reports WHERE id IN ({','.join('?' * len(matches))})",
+        [rid for _, rid in matches])} if matches else {}
+    return jsonify({'similar': [dict(rows[rid], distance=d) for d, rid in matches if rid in rows]})
+
+@job_handler('duplicate_clusters')
+def _duplicate_clusters_job(p):
+    clusters = duplicate_cluster_reports(p['threshold'])
+    return {'threshold': p['threshold'], 'count': len(clusters), 'clusters': clusters}
+
+@app.route('/api/admin/images/duplicate-clusters', methods=['POST'])
+@admin_required
+def duplicate_clusters_api():
+    """
+    Queue the bulk job that groups reports whose photos are within `threshold`
+    bits of one another (O(n²) over every hash, so never in the request) and
+    answer 202 with the job to poll. Only one runs at a time.
+    """
+    threshold = request.args.get('threshold', app.config['IMAGE_DUP_THRESHOLD'], type=int)
+    threshold = min(max(threshold, 0), app.config['IMAGE_DUP_THRESHOLD'])
+    job_id    = enqueue_once('duplicate_clusters', {'threshold': threshold}, session['user_id'])
+    return jsonify({'job_id': job_id, 'status': 'queued',
+                    'poll_url': url_for('ai.ai_job_status', job_id=job_id)}), 202
+
+@app.route('/api/admin/storage/gc', methods=['POST'])
+@admin_required
+def storage_gc_api():
+    """Sweep orphaned uploads/crops — dry run unless ?apply=1 (quarantines; add &delete=1 to delete, &full=1 to walk the disk)."""
+    apply = request.args.get('apply') == '1'
+    stats = sweep(get_db(), delete=apply and request.args.get('delete') == '1', dry_run=not apply,
+                  full=request.args.get('full') == '1')
+    return jsonify(stats)
+
+@app.route('/api/admin/db/pools')
+@admin_required
+def db_pool_stats_api():
+    return jsonify(pool_stats())
+
+@app.route('/api/admin/db/queries')
+@admin_required
+def db_query_stats_api():
+    """Per-statement latency/row totals with calling endpoints, plus recent slow queries and their plans."""
+    limit    = request.args.get('limit', 50, type=int)
+    order_by = request.args.get('order', 'total_ms')
+    return jsonify(dict(query_stats(limit, order_by), pools=pool_stats()))
+
+# ─────────────────────────────────────────
+# BACKGROUND SCHEDULERS
+# ─────────────────────────────────────────
+def start_schedulers():
+    """Start the APScheduler jobs enabled in config. Returns the schedulers started."""
+    started = []
+    if app.config['SCHEDULE_UPLOAD_GC']:
+        started.append(start_gc_scheduler())
+    if app.config['SCHEDULE_SENTIMENT']:
+        started.append(start_sentiment_scheduler())
+    if app.config['SCHEDULE_CLASSIFY_BACKFILL']:
+        started.append(start_backfill_scheduler())
+    return [s for s in started if s]
+
 if __name__ == '__main__':
     init_db()
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':   # debug reloader: only the serving child runs jobs
+        start_schedulers()
     app.run(debug=True, port=5000)
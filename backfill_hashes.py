@@ -0,0 +1,170 @@
+"""
+backfill_hashes.py — Hash every stored image for CivicConnect
+=============================================================
+Reports created before image hashing existed have NULL hashes, and
+satellite crops were never hashed at all. This walks reports.image_path,
+static/uploads and static/satellite, hashes each image (pHash, dHash,
+wHash) in a process pool and writes the results back in batched
+transactions:
+
+  • image_files          — one row per file (path relative to static/,
+                           size, mtime, hashes); doubles as the resume log
+  • reports              — image_hash / image_hash_int / dHash / wHash
+                           for every report pointing at the file
+  • satellite_issues     — image_hash for every crop
+
+Interrupt it at any time: committed batches are kept, and files whose
+size and mtime are unchanged since they were hashed are skipped next run.
+Each written hash is logged in image_hash_changes, so a running app's
+duplicate index picks it up on its next lookup — no restart needed.
+
+Usage:
+    python backfill_hashes.py [--workers N] [--batch N] [--force]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from database import get_db
+from migrations import run_migrations
+from hash_index import hash_to_db_int
+from upload_store import STATIC_DIR, static_rel
+
+# ─────────────────────────────────────────────────────────────
+# CONFIG
+# ─────────────────────────────────────────────────────────────
+SCAN_DIRS    = ("uploads", "satellite")          # under STATIC_DIR
+IMAGE_EXTS   = {".png", ".jpg", ".jpeg", ".gif", ".webp"}
+BATCH_SIZE   = 200                               # files per write transaction
+WORKERS      = os.cpu_count() or 2
+
+
+# ─────────────────────────────────────────────────────────────
+# COLLECT — every image path, relative to static/
+# ─────────────────────────────────────────────────────────────
+def collect_paths(db) -> list:
+    """Report image paths plus every image file in SCAN_DIRS, de-duplicated."""
+    paths = {static_rel(r[0]) for r in db.execute(
+        "SELECT DISTINCT image_path FROM reports WHERE image_path IS NOT NULL AND image_path != ''")}
+    for sub in SCAN_DIRS:
+        folder = os.path.join(STATIC_DIR, sub)
+        if not os.path.isdir(folder):
+            continue
+        for root, _, files in os.walk(folder):          # uploads are sharded (upload_store)
+            for name in files:
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTS:
+                    paths.add(static_rel(os.path.relpath(os.path.join(root, name), STATIC_DIR)))
+    return sorted(paths)
+
+
+def pending_paths(db, paths: list, force: bool = False) -> list:
+    """Drop files already hashed with the same size and mtime (resume)."""
+    if force:
+        return paths
+    done = {r["path"]: (r["size"], r["mtime"]) for r in db.execute("SELECT path, size, mtime FROM image_files")}
+    todo = []
+    for rel in paths:
+        try:
+            st = os.stat(os.path.join(STATIC_DIR, rel))
+        except OSError:
+            continue
+        if done.get(rel) != (st.st_size, int(st.st_mtime)):
+            todo.append(rel)
+    return todo
+
+
+# ─────────────────────────────────────────────────────────────
+# WORKER — runs in the process pool, no database access
+# ─────────────────────────────────────────────────────────────
+def _hash_file(rel: str):
+    from image_hash_util import get_image_hashes
+    full = os.path.join(STATIC_DIR, rel)
+    try:
+        st     = os.stat(full)
+        hashes = get_image_hashes(full)
+    except Exception as e:
+        return rel, None, None, None, str(e)
+    return rel, st.st_size, int(st.st_mtime), hashes, None
+
+
+# ─────────────────────────────────────────────────────────────
+# WRITE — one transaction per batch
+# ─────────────────────────────────────────────────────────────
+def _crop_index(db) -> dict:
+    """Normalised crop path → satellite_issues ids (stored paths may use backslashes)."""
+    crops = {}
+    for row in db.execute("SELECT id, image_crop_path FROM satellite_issues WHERE image_crop_path IS NOT NULL"):
+        crops.setdefault(static_rel(row["image_crop_path"]), []).append(row["id"])
+    return crops
+
+
+def write_batch(db, results: list, crops: dict):
+    files, reports, issues = [], [], []
+    for rel, size, mtime, h in results:
+        files.append((rel, size, mtime, h["phash"], h["dhash"], h["whash"]))
+        reports.append((h["phash"], hash_to_db_int(h["phash"]), h["dhash"], h["whash"], rel))
+        issues.extend((h["phash"], issue_id) for issue_id in crops.get(rel, ()))
+
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.executemany("""
+            INSERT INTO image_files (path, size, mtime, phash, dhash, whash)
+            VALUES (?,?,?,?,?,?)
+            ON CONFLICT(path) DO UPDATE SET
+                size = excluded.size, mtime = excluded.mtime, phash = excluded.phash,
+                dhash = excluded.dhash, whash = excluded.whash, hashed_at = CURRENT_TIMESTAMP
+        """, files)
+        db.executemany("""
+            UPDATE reports SET image_hash = ?, image_hash_int = ?, image_dhash = ?, image_whash = ?
+            WHERE image_path = ?
+        """, reports)
+        db.executemany("UPDATE satellite_issues SET image_hash = ? WHERE id = ?", issues)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+# ─────────────────────────────────────────────────────────────
+# MAIN
+# ─────────────────────────────────────────────────────────────
+def backfill(workers: int = WORKERS, batch_size: int = BATCH_SIZE, force: bool = False) -> dict:
+    db = get_db()
+    run_migrations(db)
+    todo  = pending_paths(db, collect_paths(db), force)
+    crops = _crop_index(db)
+    total = len(todo)
+    print(f"🖼️  {total} image(s) to hash with {workers} worker(s)")
+
+    stats   = {"hashed": 0, "errors": 0, "seconds": 0.0}
+    started = time.perf_counter()
+    batch   = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for done, (rel, size, mtime, hashes, error) in enumerate(
+                pool.map(_hash_file, todo, chunksize=max(1, min(32, total // (workers * 4) or 1))), 1):
+            if error:
+                stats["errors"] += 1
+                print(f"  ⚠️  {rel}: {error}")
+            else:
+                batch.append((rel, size, mtime, hashes))
+            if len(batch) >= batch_size or done == total:
+                if batch:
+                    write_batch(db, batch, crops)
+                    stats["hashed"] += len(batch)
+                    batch = []
+                rate = done / max(time.perf_counter() - started, 1e-9)
+                print(f"  ⏳ {done}/{total} — {rate:.1f} images/s")
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    rate = stats["hashed"] / stats["seconds"] if stats["seconds"] else 0.0
+    print(f"✅ Hashed {stats['hashed']} image(s) in {stats['seconds']}s "
+          f"({rate:.1f} images/s, {stats['errors']} error(s))")
+    return stats
+
+
+if __name__ == "__main__":
+    args = sys.argv
+    workers    = int(args[args.index("--workers") + 1]) if "--workers" in args else WORKERS
+    batch_size = int(args[args.index("--batch") + 1]) if "--batch" in args else BATCH_SIZE
+    backfill(workers, batch_size, force="--force" in args)
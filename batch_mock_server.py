@@ -0,0 +1,149 @@
+"""
+batch_mock_server.py — Local stand-in for the Message Batches API
+=================================================================
+Lets classify_backfill.py run end to end without an API key or cost.
+Implements just what the anthropic client uses for batches:
+
+    POST /v1/messages/batches                 create (answers 'in_progress')
+    GET  /v1/messages/batches/<id>            retrieve ('ended' after MOCK_POLLS polls)
+    GET  /v1/messages/batches/<id>/results    JSONL of per-request results
+
+Each request is "classified" by keyword rules so results are
+deterministic. Requests whose prompt contains MOCK_ERROR_WORD come back
+errored, to exercise that path.
+
+Usage:
+    python batch_mock_server.py [--port 8765]
+    python classify_backfill.py --base-url http://127.0.0.1:8765
+"""
+
+import re
+import sys
+import json
+import uuid
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ─────────────────────────────────────────────────────────────
+# CONFIG
+# ─────────────────────────────────────────────────────────────
+MOCK_PORT       = 8765
+MOCK_POLLS      = 1             # retrieves answered 'in_progress' before the batch ends
+MOCK_ERROR_WORD = "MOCK_ERROR"
+
+KEYWORD_CATEGORIES = [
+    (("pothole", "road", "asphalt", "traffic"),        "Roads"),
+    (("street light", "streetlight", "lamp"),          "Street Lighting"),
+    (("garbage", "waste", "trash", "litter"),          "Sanitation"),
+    (("water", "pipe", "leak", "power", "electric"),   "Utilities"),
+    (("drain", "flood", "sewer"),                      "Drainage"),
+    (("park", "playground", "tree"),                   "Parks & Recreation"),
+    (("crime", "unsafe", "fire", "accident"),          "Public Safety"),
+    (("sidewalk", "bridge", "pavement", "building"),   "Infrastructure"),
+]
+KEYWORD_SEVERITY = [
+    (("burst", "danger", "fire", "flood", "injur"),    "Critical"),
+    (("large", "broken", "week", "unsafe"),            "High"),
+    (("minor", "small", "cosmetic"),                   "Low"),
+]
+
+_batches = {}
+_lock    = threading.Lock()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def mock_classify(prompt: str) -> dict:
+    # Only the report's own lines — the rest of the prompt lists every label
+    title = re.search(r"title: (.*)", prompt.lower())
+    desc  = re.search(r"description: (.*)", prompt.lower())
+    text  = " ".join(m.group(1) for m in (title, desc) if m) or prompt.lower()
+    category = next((c for words, c in KEYWORD_CATEGORIES if any(w in text for w in words)), "Other")
+    severity = next((s for words, s in KEYWORD_SEVERITY if any(w in text for w in words)), "Medium")
+    return {"category": category, "severity": severity,
+            "summary": (title.group(1) if title else text[:60]).strip().capitalize(),
+            "keywords": [], "urgent": severity == "Critical", "reason": "mock keyword rules"}
+
+
+def _batch_json(batch: dict, base: str) -> dict:
+    ended = batch["polls"] > MOCK_POLLS
+    n     = len(batch["requests"])
+    errs  = sum(MOCK_ERROR_WORD in json.dumps(r) for r in batch["requests"])
+    return {
+        "id": batch["id"], "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": {"processing": 0 if ended else n, "succeeded": n - errs if ended else 0,
+                           "errored": errs if ended else 0, "canceled": 0, "expired": 0},
+        "created_at": batch["created_at"], "expires_at": batch["created_at"],
+        "ended_at": _now() if ended else None, "archived_at": None, "cancel_initiated_at": None,
+        "results_url": f"{base}/v1/messages/batches/{batch['id']}/results" if ended else None,
+    }
+
+
+def _result(req: dict) -> dict:
+    params = req["params"]
+    prompt = params["messages"][-1]["content"]
+    if MOCK_ERROR_WORD in prompt:
+        return {"custom_id": req["custom_id"], "result": {"type": "errored", "error": {
+            "type": "error", "error": {"type": "invalid_request_error", "message": "mock error"}}}}
+    return {"custom_id": req["custom_id"], "result": {"type": "succeeded", "message": {
+        "id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant",
+        "model": params["model"], "stop_reason": "end_turn", "stop_sequence": None,
+        "content": [{"type": "text", "text": json.dumps(mock_classify(prompt))}],
+        "usage": {"input_tokens": len(prompt) // 4, "output_tokens": 60}}}}
+
+
+class MockBatchHandler(BaseHTTPRequestHandler):
+    def _send(self, status: int, body: str, content_type: str = "application/json"):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _base(self) -> str:
+        return f"http://{self.headers.get('Host', f'127.0.0.1:{self.server.server_port}')}"
+
+    def do_POST(self):
+        if self.path.split("?")[0].rstrip("/") != "/v1/messages/batches":
+            return self._send(404, json.dumps({"type": "error", "error": {"type": "not_found_error"}}))
+        body  = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        batch = {"id": f"msgbatch_{uuid.uuid4().hex[:24]}", "requests": body.get("requests", []),
+                 "created_at": _now(), "polls": 0}
+        with _lock:
+            _batches[batch["id"]] = batch
+        self._send(200, json.dumps(_batch_json(batch, self._base())))
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")      # v1 messages batches <id> [results]
+        with _lock:
+            batch = _batches.get(parts[3]) if len(parts) >= 4 and parts[:3] == ["v1", "messages", "batches"] else None
+            if batch and len(parts) == 4:
+                batch["polls"] += 1
+        if batch is None:
+            return self._send(404, json.dumps({"type": "error", "error": {"type": "not_found_error"}}))
+        if len(parts) == 5 and parts[4] == "results":
+            return self._send(200, "\n".join(json.dumps(_result(r)) for r in batch["requests"]) + "\n",
+                              "application/binary")
+        self._send(200, json.dumps(_batch_json(batch, self._base())))
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def start_mock_server(port: int = 0):
+    """Serve in a daemon thread; port 0 picks a free one. Returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockBatchHandler)
+    threading.Thread(target=server.serve_forever, name="batch-mock", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+if __name__ == "__main__":
+    args = sys.argv
+    port = int(args[args.index("--port") + 1]) if "--port" in args else MOCK_PORT
+    print(f"🧪 Mock Message Batches API on http://127.0.0.1:{port}")
+    ThreadingHTTPServer(("127.0.0.1", port), MockBatchHandler).serve_forever()
@@ -0,0 +1,112 @@
+"""
+bench_image_hash.py — Hashing speed and stability benchmark for CivicConnect
+===========================================================================
+Compares the full-resolution decode that hashing used to do against the
+reduced decode in image_hash_util.open_for_hashing(), on the same files:
+
+  • time per image (median of --repeat runs) for pHash + dHash + wHash
+  • Hamming distance between the old and new hash of each kind, i.e.
+    how far the fast path drifts from hashes already stored
+
+With no paths it uses every image under static/uploads and
+static/satellite plus a synthetic 12 MP phone-sized JPEG built from the
+sample photo, so there is always a large image in the run.
+
+Usage:
+    python bench_image_hash.py [paths or dirs ...] [--repeat N]
+"""
+
+import io
+import os
+import sys
+import time
+import statistics
+import imagehash
+from PIL import Image
+from image_hash_util import get_image_hashes
+from hash_index import hash_to_int, hamming
+
+SAMPLE_PHOTO = "damaged-asphalt-road-with-pothole-and-cracks-needs-repair-photo.webp"
+DEFAULT_DIRS = ("static/uploads", "static/satellite")
+IMAGE_EXTS   = {".png", ".jpg", ".jpeg", ".gif", ".webp"}
+PHONE_SIZE   = (4032, 3024)
+
+
+def legacy_hashes(source) -> dict:
+    """The previous implementation: full decode, whash at native scale."""
+    gray = Image.open(source).convert("L")
+    return {
+        "phash": str(imagehash.phash(gray)),
+        "dhash": str(imagehash.dhash(gray)),
+        "whash": str(imagehash.whash(gray)),
+    }
+
+
+def _inputs(args: list) -> list:
+    """(label, bytes) for every image to benchmark."""
+    paths = []
+    for target in args or DEFAULT_DIRS:
+        if os.path.isdir(target):
+            for root, _, files in os.walk(target):
+                paths += [os.path.join(root, f) for f in sorted(files)
+                          if os.path.splitext(f)[1].lower() in IMAGE_EXTS]
+        elif os.path.isfile(target):
+            paths.append(target)
+    inputs = []
+    for p in paths:
+        with open(p, "rb") as f:
+            inputs.append((p, f.read()))
+
+    if not args and os.path.exists(SAMPLE_PHOTO):
+        buf = io.BytesIO()
+        Image.open(SAMPLE_PHOTO).convert("RGB").resize(PHONE_SIZE, Image.LANCZOS).save(buf, "JPEG", quality=90)
+        inputs.append((f"synthetic {PHONE_SIZE[0]}x{PHONE_SIZE[1]} JPEG", buf.getvalue()))
+    return inputs
+
+
+def _time(fn, data: bytes, repeat: int):
+    runs, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result  = fn(io.BytesIO(data))
+        runs.append((time.perf_counter() - started) * 1000)
+    return statistics.median(runs), result
+
+
+def run(args: list, repeat: int = 5):
+    inputs = _inputs(args)
+    if not inputs:
+        print("No images found.")
+        return
+    print(f"{'image':<48} {'px':>11} {'full ms':>8} {'fast ms':>8} {'speedup':>8}  drift p/d/w")
+    total_old = total_new = 0.0
+    worst = {"phash": 0, "dhash": 0, "whash": 0}
+    for label, data in inputs:
+        try:
+            size = Image.open(io.BytesIO(data)).size
+            old_ms, old = _time(legacy_hashes, data, repeat)
+            new_ms, new = _time(get_image_hashes, data, repeat)
+        except Exception as e:
+            print(f"{label[-48:]:<48} skipped: {e}")
+            continue
+        drift = {k: hamming(hash_to_int(old[k]), hash_to_int(new[k])) for k in worst}
+        for k, d in drift.items():
+            worst[k] = max(worst[k], d)
+        total_old += old_ms
+        total_new += new_ms
+        print(f"{label[-48:]:<48} {size[0]:>5}x{size[1]:<5} {old_ms:>8.1f} {new_ms:>8.1f} "
+              f"{old_ms / new_ms:>7.1f}x  {drift['phash']}/{drift['dhash']}/{drift['whash']}")
+
+    if total_new:
+        print(f"\nTotal {total_old:.1f} ms → {total_new:.1f} ms ({total_old / total_new:.1f}x); "
+              f"worst drift in bits — pHash {worst['phash']}, dHash {worst['dhash']}, wHash {worst['whash']}")
+
+
+if __name__ == "__main__":
+    argv   = sys.argv[1:]
+    repeat = 5
+    if "--repeat" in argv:
+        i = argv.index("--repeat")
+        repeat = int(argv[i + 1])
+        del argv[i:i + 2]
+    run(argv, repeat)
@@ -0,0 +1,247 @@
+"""
+classify_backfill.py — Bulk AI classification of legacy reports for CivicConnect
+===============================================================================
+Many older reports still carry the form defaults — category "Other" or
+severity "Medium". Instead of one classify_report() call per report,
+this submits them as a single Message Batches API job (half the price,
+no per-request rate limits), waits for it to end, and applies the
+results in chunked transactions:
+
+  • select   — reports with a default category/severity that have never
+               been sent (report_classifications, migration 016), or
+               whose last request errored fewer than MAX_ATTEMPTS times
+  • submit   — one request per report, custom_id 'report-<id>', batch id
+               recorded in classify_batches so an interrupted run resumes
+  • apply    — APPLY_CHUNK reports per BEGIN IMMEDIATE transaction; only
+               fields still at their default are overwritten, so manual
+               edits made since submission win. Errored requests are
+               kept as status 'errored' with the error and attempt count;
+               a later run resubmits them until MAX_ATTEMPTS is reached.
+
+run_backfill(wait=False) does one non-blocking step (apply what has
+ended, submit the next batch) — that is what the 'classify_backfill'
+job runs. The admin route and the optional scheduler both queue it via
+request_backfill(), which never queues a second step while one is
+pending. The scheduler is off by default (SCHEDULE_CLASSIFY_BACKFILL in
+app.py): every run sends reports to the paid API and may rewrite their
+category and severity. To run it unattended under gunicorn use cron:
+    */30 * * * *  cd /path/to/civic_connect && python classify_backfill.py --no-wait
+The CLI waits for the batch by default.
+
+Usage:
+    python classify_backfill.py [--limit N] [--no-wait] [--poll SECONDS]
+                                [--mock | --base-url URL]
+"""
+
+import sys
+import time
+import anthropic
+from database import get_db
+from ai_features import MODEL, CATEGORIES, SEVERITIES, classify_prompt, parse_json, client
+from ai_jobs import enqueue_once, job_handler
+
+# ─────────────────────────────────────────────────────────────
+# CONFIG
+# ─────────────────────────────────────────────────────────────
+BATCH_LIMIT  = 10000       # reports per submitted batch (API allows up to 100,000)
+APPLY_CHUNK  = 200         # reports updated per transaction
+POLL_SECONDS = 30          # CLI wait between status checks
+MAX_TOKENS   = 400
+MAX_ATTEMPTS = 3           # submissions per report before an errored request is left alone
+DEFAULT_CATEGORY = "Other"
+DEFAULT_SEVERITY = "Medium"
+
+
+def _report_id(custom_id: str) -> int:
+    return int(custom_id.split("-", 1)[1])
+
+
+# ─────────────────────────────────────────────────────────────
+# SELECT / SUBMIT
+# ─────────────────────────────────────────────────────────────
+def select_reports(db=None, limit: int = BATCH_LIMIT) -> list:
+    """Reports still at a default category/severity that were never submitted, or errored and may be retried."""
+    return (db or get_db()).execute("""
+        SELECT r.id, r.title, r.description FROM reports r
+        WHERE (r.category = ? OR r.severity = ?)
+          AND NOT EXISTS (SELECT 1 FROM report_classifications c WHERE c.report_id = r.id
+                          AND (c.status != 'errored' OR c.attempts >= ?))
+        ORDER BY r.id LIMIT ?
+    """, (DEFAULT_CATEGORY, DEFAULT_SEVERITY, MAX_ATTEMPTS, limit)).fetchall()
+
+
+def submit_batch(rows: list, db=None, api=None) -> str:
+    """Create one batch for these reports and record it. Returns the batch id."""
+    conn  = db or get_db()
+    batch = (api or client).messages.batches.create(requests=[{
+        "custom_id": f"report-{r['id']}",
+        "params": {"model": MODEL, "max_tokens": MAX_TOKENS,
+                   "messages": [{"role": "user", "content": classify_prompt(r["title"], r["description"])}]},
+    } for r in rows])
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("INSERT INTO classify_batches (id, status, request_count, submitted_at) VALUES (?,?,?,?)",
+                     (batch.id, batch.processing_status, len(rows), now))
+        conn.executemany("""
+            INSERT INTO report_classifications (report_id, batch_id, status, updated_at) VALUES (?,?, 'submitted', ?)
+            ON CONFLICT(report_id) DO UPDATE SET batch_id = excluded.batch_id, status = 'submitted',
+                attempts = attempts + 1, updated_at = excluded.updated_at
+        """, [(r["id"], batch.id, now) for r in rows])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"📤 Submitted batch {batch.id} with {len(rows)} report(s)")
+    return batch.id
+
+
+# ─────────────────────────────────────────────────────────────
+# APPLY
+# ─────────────────────────────────────────────────────────────
+def _flush(conn, applied: list, errored: list):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany("""
+            UPDATE reports SET
+                category   = CASE WHEN category = ? THEN ? ELSE category END,
+                severity   = CASE WHEN severity = ? THEN ? ELSE severity END,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, [(DEFAULT_CATEGORY, cat, DEFAULT_SEVERITY, sev, rid) for rid, cat, sev, _ in applied])
+        conn.executemany("""
+            UPDATE report_classifications SET status = 'applied', category = ?, severity = ?,
+                summary = ?, updated_at = ? WHERE report_id = ?
+        """, [(cat, sev, summary, time.time(), rid) for rid, cat, sev, summary in applied])
+        conn.executemany("""
+            UPDATE report_classifications SET status = 'errored', error = ?, updated_at = ? WHERE report_id = ?
+        """, [(error, time.time(), rid) for rid, error in errored])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def apply_results(batch_id: str, db=None, api=None, chunk: int = APPLY_CHUNK) -> dict:
+    """Stream an ended batch's results into reports, chunk reports per transaction."""
+    conn  = db or get_db()
+    stats = {"applied": 0, "errored": 0}
+    applied, errored = [], []
+    for entry in (api or client).messages.batches.results(batch_id):
+        rid = _report_id(entry.custom_id)
+        try:
+            if entry.result.type != "succeeded":
+                raise ValueError(entry.result.type)
+            result = parse_json(entry.result.message.content[0].text)
+            cat, sev = result.get("category"), result.get("severity")
+            if cat not in CATEGORIES or sev not in SEVERITIES:
+                raise ValueError(f"unexpected labels {cat!r}/{sev!r}")
+            applied.append((rid, cat, sev, (result.get("summary") or "")[:300]))
+        except (ValueError, AttributeError, IndexError) as e:
+            errored.append((rid, str(e)[:300]))   # retried by a later run until MAX_ATTEMPTS
+        if len(applied) + len(errored) >= chunk:
+            _flush(conn, applied, errored)
+            stats["applied"] += len(applied)
+            stats["errored"] += len(errored)
+            applied, errored = [], []
+    _flush(conn, applied, errored)
+    stats["applied"] += len(applied)
+    stats["errored"] += len(errored)
+
+    conn.execute("UPDATE classify_batches SET status = 'applied', applied_at = ? WHERE id = ?",
+                 (time.time(), batch_id))
+    conn.commit()
+    print(f"✅ Batch {batch_id}: applied {stats['applied']}, {stats['errored']} errored")
+    return stats
+
+
+# ─────────────────────────────────────────────────────────────
+# RUN
+# ─────────────────────────────────────────────────────────────
+def run_backfill(db=None, api=None, limit: int = BATCH_LIMIT, wait: bool = False,
+                 poll_seconds: float = POLL_SECONDS) -> dict:
+    """
+    Apply every recorded batch that has ended, then submit the next one
+    if nothing is still in flight. With wait=True, poll until the batch
+    just submitted (or still in flight) has been applied.
+
+    Returns:
+        {"submitted": batch id or None, "in_flight": [batch ids], "applied": n, "errored": n}
+    """
+    conn  = db or get_db()
+    api   = api or client
+    stats = {"submitted": None, "in_flight": [], "applied": 0, "errored": 0}
+    while True:
+        stats["in_flight"] = []
+        for row in conn.execute("SELECT id FROM classify_batches WHERE status != 'applied' "
+                                "ORDER BY submitted_at").fetchall():
+            batch = api.messages.batches.retrieve(row["id"])
+            if batch.processing_status == "ended":
+                done = apply_results(batch.id, conn, api)
+                stats["applied"]  += done["applied"]
+                stats["errored"]  += done["errored"]
+            else:
+                conn.execute("UPDATE classify_batches SET status = ? WHERE id = ?",
+                             (batch.processing_status, batch.id))
+                conn.commit()
+                counts = batch.request_counts
+                print(f"⏳ Batch {batch.id}: {batch.processing_status} "
+                      f"({counts.processing} processing, {counts.succeeded} succeeded)")
+                stats["in_flight"].append(batch.id)
+
+        if not stats["in_flight"] and stats["submitted"] is None:
+            rows = select_reports(conn, limit)
+            if rows:
+                stats["submitted"] = submit_batch(rows, conn, api)
+                stats["in_flight"].append(stats["submitted"])
+        if not wait or not stats["in_flight"]:
+            return stats
+        time.sleep(poll_seconds)
+
+
+@job_handler("classify_backfill")
+def _backfill_job(payload):
+    return run_backfill(limit=payload.get("limit", BATCH_LIMIT))
+
+
+def request_backfill(db=None, user_id=None, limit: int = BATCH_LIMIT) -> str:
+    """
+    Queue a backfill step unless one is already queued or running, so the
+    scheduler and the admin route never run run_backfill() side by side
+    (both would see nothing in flight and submit the same reports).
+    Returns the new or already-pending job id.
+    """
+    return enqueue_once("classify_backfill", {"limit": limit}, user_id, db)
+
+
+def start_backfill_scheduler(minutes: int = 30):
+    """Queue a backfill step (apply ended batches, submit new ones) every `minutes` minutes."""
+    try:
+        from apscheduler.schedulers.background import BackgroundScheduler
+        scheduler = BackgroundScheduler()
+        scheduler.add_job(request_backfill, 'interval', minutes=minutes)
+        scheduler.start()
+        print(f"✅ Classification backfill scheduled — runs every {minutes} min")
+        return scheduler
+    except ImportError:
+        print("APScheduler not installed. Run: pip install APScheduler")
+        return None
+
+
+if __name__ == "__main__":
+    args  = sys.argv
+    limit = int(args[args.index("--limit") + 1]) if "--limit" in args else BATCH_LIMIT
+    poll  = float(args[args.index("--poll") + 1]) if "--poll" in args else POLL_SECONDS
+    api   = client
+    if "--mock" in args:
+        from batch_mock_server import start_mock_server
+        _, base_url = start_mock_server()
+        api, poll = anthropic.Anthropic(api_key="mock", base_url=base_url), min(poll, 0.5)
+        print(f"🧪 Using mock batch server at {base_url}")
+    elif "--base-url" in args:
+        api = anthropic.Anthropic(api_key="mock", base_url=args[args.index("--base-url") + 1])
+
+    from migrations import run_migrations
+    db = get_db()
+    run_migrations(db)
+    print(run_backfill(db, api, limit=limit, wait="--no-wait" not in args, poll_seconds=poll))
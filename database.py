@@ -0,0 +1,233 @@
+"""
+database.py — Shared SQLite data access for CivicConnect
+========================================================
+Every module gets its connection from here instead of opening its own.
+
+  • get_db() — read/write connection. Inside a Flask app context it is
+    cached on flask.g and closed by the teardown registered in
+    init_app(); outside one (scheduler threads, CLI scripts) each thread
+    reuses a single connection for its lifetime.
+  • get_read_db() — read-only connection for admin/analytics pages,
+    borrowed from a bounded pool (mode=ro, query_only) and holding one
+    snapshot for the whole request, so long reports never contend with
+    the citizen submit path.
+
+All connections run in WAL mode with the pragmas below, so readers never
+block the writer and the page cache survives across queries. They are
+opened as query_log.InstrumentedConnection, which times every statement
+and logs slow ones with their query plan.
+"""
+
+import time
+import queue
+import sqlite3
+import threading
+from flask import g, has_app_context, current_app
+from query_log import InstrumentedConnection, SLOW_QUERY_MS
+
+# ─────────────────────────────────────────────────────────────────────
+# CONFIG
+# ─────────────────────────────────────────────────────────────────────
+DB_PATH = "civic_connect.db"
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous" : "NORMAL",      # safe with WAL, one fsync per checkpoint
+    "cache_size"  : -16000,        # negative = KiB → 16 MB page cache
+    "mmap_size"   : 134217728,     # 128 MB memory-mapped reads
+    "busy_timeout": 5000,          # ms to wait on a locked database
+    "temp_store"  : "MEMORY",
+}
+
+# Read-only pool — override per app with DB_READ_POOL_SIZE / DB_READ_POOL_TIMEOUT
+READ_POOL_SIZE    = 4       # idle read-only connections kept open
+READ_POOL_TIMEOUT = 2.0     # seconds to wait for one before opening an overflow connection
+
+_local = threading.local()
+
+
+# ─────────────────────────────────────────────────────────────────────
+# CONNECTIONS
+# ─────────────────────────────────────────────────────────────────────
+def connect(db_path: str = DB_PATH) -> sqlite3.Connection:
+    """Open a new connection with row access by name and tuned pragmas."""
+    db = sqlite3.connect(db_path, timeout=PRAGMAS["busy_timeout"] / 1000,
+                         factory=InstrumentedConnection)
+    db.row_factory = sqlite3.Row
+    for name, value in PRAGMAS.items():
+        db.execute(f"PRAGMA {name} = {value}")
+    return db
+
+
+def get_db() -> sqlite3.Connection:
+    """
+    Return the connection for the current request, or for the current
+    thread when called outside Flask. Callers must not close it.
+    """
+    if has_app_context():
+        if "db" not in g:
+            g.db = connect()
+        return g.db
+
+    db = getattr(_local, "db", None)
+    if db is None:
+        db = _local.db = connect()
+    return db
+
+
+def close_db(exc=None):
+    """App-context teardown — close the request's connection and return its read connection."""
+    db = g.pop("db", None)
+    if db is not None:
+        db.close()
+    read_db = g.pop("read_db", None)
+    if read_db is not None:
+        get_read_pool().release(read_db)
+
+
+def close_thread_db():
+    """Close the calling thread's connection (for worker threads that exit)."""
+    db = getattr(_local, "db", None)
+    if db is not None:
+        db.close()
+        _local.db = None
+
+
+# ─────────────────────────────────────────────────────────────────────
+# READ-ONLY SNAPSHOT POOL
+# ─────────────────────────────────────────────────────────────────────
+def connect_readonly(db_path: str = DB_PATH) -> sqlite3.Connection:
+    """Open a read-only connection (mode=ro URI plus query_only)."""
+    db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True,
+                         timeout=PRAGMAS["busy_timeout"] / 1000, check_same_thread=False,
+                         factory=InstrumentedConnection)
+    db.row_factory = sqlite3.Row
+    for name in ("cache_size", "mmap_size", "busy_timeout", "temp_store"):
+        db.execute(f"PRAGMA {name} = {PRAGMAS[name]}")
+    db.execute("PRAGMA query_only = 1")
+    return db
+
+
+class ReadPool:
+    """
+    Bounded pool of read-only connections. Each checkout starts a read
+    transaction, so every query in a request sees the same snapshot;
+    release() ends it and parks the connection for reuse. When every
+    connection is busy for longer than `timeout`, an overflow connection
+    is opened for that request and closed afterwards.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, size: int = READ_POOL_SIZE,
+                 timeout: float = READ_POOL_TIMEOUT):
+        self.db_path = db_path
+        self.size    = size
+        self.timeout = timeout
+        self._idle   = queue.LifoQueue()
+        self._lock   = threading.Lock()
+        self._pooled = set()    # id() of connections owned by the pool
+        self._open   = 0
+        self._metrics = {"acquired": 0, "created": 0, "overflow": 0,
+                         "waits": 0, "wait_ms": 0.0, "in_use": 0, "max_in_use": 0}
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._metrics[key] += delta
+            self._metrics["max_in_use"] = max(self._metrics["max_in_use"], self._metrics["in_use"])
+
+    def acquire(self) -> sqlite3.Connection:
+        db = None
+        try:
+            db = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._open < self.size
+                if can_open:
+                    self._open += 1
+            if can_open:
+                try:
+                    db = connect_readonly(self.db_path)
+                except sqlite3.Error:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+                with self._lock:
+                    self._pooled.add(id(db))
+                self._count(created=1)
+            else:
+                started = time.perf_counter()
+                try:
+                    db = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    db = connect_readonly(self.db_path)
+                    self._count(overflow=1)
+                self._count(waits=1, wait_ms=(time.perf_counter() - started) * 1000)
+
+        db.execute("BEGIN")
+        self._count(acquired=1, in_use=1)
+        return db
+
+    def release(self, db: sqlite3.Connection):
+        self._count(in_use=-1)
+        try:
+            db.rollback()
+        except sqlite3.Error:
+            with self._lock:
+                if id(db) in self._pooled:
+                    self._pooled.discard(id(db))
+                    self._open -= 1
+            db.close()
+            return
+        if id(db) in self._pooled:
+            self._idle.put(db)
+        else:
+            db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._metrics, size=self.size, open=self._open,
+                        idle=self._idle.qsize())
+
+
+_read_pool      = None
+_read_pool_lock = threading.Lock()
+
+
+def get_read_pool() -> ReadPool:
+    """The process-wide read pool, sized from app config on first use."""
+    global _read_pool
+    if _read_pool is None:
+        with _read_pool_lock:
+            if _read_pool is None:
+                size, timeout = READ_POOL_SIZE, READ_POOL_TIMEOUT
+                if has_app_context():
+                    size    = current_app.config.get("DB_READ_POOL_SIZE", size)
+                    timeout = current_app.config.get("DB_READ_POOL_TIMEOUT", timeout)
+                _read_pool = ReadPool(DB_PATH, size, timeout)
+    return _read_pool
+
+
+def get_read_db() -> sqlite3.Connection:
+    """
+    Return a read-only snapshot connection for the current request,
+    checked out of the pool on first use and returned on teardown.
+    Outside an app context this falls back to get_db().
+    """
+    if not has_app_context():
+        return get_db()
+    if "read_db" not in g:
+        g.read_db = get_read_pool().acquire()
+    return g.read_db
+
+
+def pool_stats() -> dict:
+    """Metrics for the read-only pool (for the admin stats endpoint)."""
+    return {"read": get_read_pool().stats()}
+
+
+def init_app(app):
+    """Register connection teardown, pool defaults and the slow-query threshold."""
+    app.config.setdefault("DB_READ_POOL_SIZE", READ_POOL_SIZE)
+    app.config.setdefault("DB_READ_POOL_TIMEOUT", READ_POOL_TIMEOUT)
+    app.config.setdefault("DB_SLOW_QUERY_MS", SLOW_QUERY_MS)
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,21 @@
+"""
+geo_util.py — Distance helpers for CivicConnect
+===============================================
+Pure-Python geometry shared by the upload duplicate check
+(image_hash_util.py) and the satellite engine. Standard library only,
+so hashing uploads or running backfill workers never imports OpenCV,
+geopy or the imagery clients.
+"""
+
+import math
+
+EARTH_RADIUS_M = 6371000
+
+
+def haversine_distance(lat1, lon1, lat2, lon2) -> float:
+    """Returns distance in meters between two GPS coordinates."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi       = math.radians(lat2 - lat1)
+    dlambda    = math.radians(lon2 - lon1)
+    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
+    return EARTH_RADIUS_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
@@ -0,0 +1,354 @@
+"""
+hash_index.py — In-memory perceptual-hash index for CivicConnect
+================================================================
+Near-duplicate lookup for report images. pHash values are 64-bit; they
+are stored as 16-char hex in reports.image_hash and as a signed 64-bit
+integer in reports.image_hash_int (migration 009).
+
+Two in-memory structures are kept over the same hashes:
+  • BK-tree — "every report within N bits" (check_duplicate) visits only
+    a small slice of the tree instead of scanning the table.
+  • HashMatrix — a NumPy uint64 array compared against a candidate with
+    one vectorised XOR + popcount; backs top-k nearest reports and the
+    bulk duplicate-cluster job.
+
+Both are process-wide: rebuilt from the reports table at startup
+(rebuild_hash_index, called from init_db) and updated incrementally.
+Triggers log the id of every report whose hash is stored, changed or
+deleted in image_hash_changes (migration 008); each lookup first applies
+the log rows past the last sequence number it has seen — a primary-key
+range read joined to the reports they name — so new reports from any
+worker, backfill_hashes.py runs and deleted reports are picked up
+without a restart. Log rows only become visible once their transaction
+commits, so a rolled-back insert never reaches the index.
+
+CLI:
+    python hash_index.py --clusters [--threshold N]
+"""
+
+import sys
+import json
+import threading
+import numpy as np
+from database import get_db
+
+# ─────────────────────────────────────────────────────────────
+# CONFIG — override per app with IMAGE_DUP_THRESHOLD
+# ─────────────────────────────────────────────────────────────
+HAMMING_THRESHOLD = 6      # bits out of 64; ≤ 6 catches re-encodes, resizes and small crops
+
+
+def hash_to_int(image_hash) -> int:
+    """'f8e4c2a1b3d5e7f0' → 64-bit int. Returns None for empty/invalid values."""
+    if not image_hash:
+        return None
+    try:
+        return int(str(image_hash), 16)
+    except ValueError:
+        return None
+
+
+def hash_to_db_int(image_hash) -> int:
+    """Hex hash → signed 64-bit int as stored in reports.image_hash_int."""
+    h = hash_to_int(image_hash)
+    if h is None:
+        return None
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+# ─────────────────────────────────────────────────────────────
+# BK-TREE
+# ─────────────────────────────────────────────────────────────
+class BKTree:
+    """
+    Burkhard–Keller tree over integer hashes with Hamming distance.
+    Each node is [hash, [report ids], {distance: child}]; identical
+    hashes share a node. search() prunes any child whose edge distance
+    falls outside [d - radius, d + radius] (triangle inequality).
+    """
+
+    def __init__(self):
+        self.root  = None
+        self.size  = 0
+
+    def add(self, h: int, report_id: int):
+        self.size += 1
+        if self.root is None:
+            self.root = [h, [report_id], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(h, node[0])
+            if d == 0:
+                node[1].append(report_id)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, [report_id], {}]
+                return
+            node = child
+
+    def remove(self, h: int, report_id: int):
+        """Drop report_id from the node holding h (the node stays as a routing point)."""
+        node = self.root
+        while node is not None:
+            d = hamming(h, node[0])
+            if d == 0:
+                if report_id in node[1]:
+                    node[1].remove(report_id)
+                    self.size -= 1
+                return
+            node = node[2].get(d)
+
+    def search(self, h: int, radius: int) -> list:
+        """All (distance, report_id) within `radius` bits of h, closest first."""
+        if self.root is None:
+            return []
+        found, stack = [], [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(h, node[0])
+            if d <= radius:
+                found.extend((d, rid) for rid in node[1])
+            lo, hi = d - radius, d + radius
+            stack.extend(child for edge, child in node[2].items() if lo <= edge <= hi)
+        found.sort()
+        return found
+
+
+# ─────────────────────────────────────────────────────────────
+# NUMPY HASH MATRIX
+# ─────────────────────────────────────────────────────────────
+class HashMatrix:
+    """
+    All hashes in one contiguous uint64 array (ids alongside), grown by
+    doubling. distances() is a single XOR + popcount over the array.
+    """
+
+    def __init__(self, hashes=None, ids=None):
+        hashes = np.asarray(hashes if hashes is not None else [], dtype=np.uint64)
+        ids    = np.asarray(ids if ids is not None else [], dtype=np.int64)
+        self.size    = len(hashes)
+        self._hashes = np.zeros(max(1024, self.size * 2), dtype=np.uint64)
+        self._ids    = np.zeros(len(self._hashes), dtype=np.int64)
+        self._hashes[:self.size] = hashes
+        self._ids[:self.size]    = ids
+
+    def add(self, h: int, report_id: int):
+        if self.size == len(self._hashes):
+            self._hashes = np.concatenate([self._hashes, np.zeros_like(self._hashes)])
+            self._ids    = np.concatenate([self._ids, np.zeros_like(self._ids)])
+        self._hashes[self.size] = h
+        self._ids[self.size]    = report_id
+        self.size += 1
+
+    def remove(self, report_id: int):
+        """Drop report_id's entries, filling each gap with the last row."""
+        for i in np.flatnonzero(self.ids == report_id)[::-1].tolist():
+            last = self.size - 1
+            self._hashes[i] = self._hashes[last]
+            self._ids[i]    = self._ids[last]
+            self.size = last
+
+    @property
+    def hashes(self):
+        return self._hashes[:self.size]
+
+    @property
+    def ids(self):
+        return self._ids[:self.size]
+
+    def distances(self, h: int):
+        return np.bitwise_count(self.hashes ^ np.uint64(h))
+
+    def top_k(self, h: int, k: int = 5, max_distance: int = 64) -> list:
+        """The k closest (distance, report_id) pairs, closest first."""
+        if not self.size:
+            return []
+        dist = self.distances(h)
+        k    = min(k, self.size)
+        idx  = np.argpartition(dist, k - 1)[:k]
+        idx  = idx[np.lexsort((self.ids[idx], dist[idx]))]
+        return [(int(dist[i]), int(self.ids[i])) for i in idx if dist[i] <= max_distance]
+
+    def clusters(self, threshold: int, chunk_cells: int = 1 << 24) -> list:
+        """
+        Group report ids whose hashes are within `threshold` bits of
+        each other (single linkage, union-find). Compares rows in blocks
+        so at most `chunk_cells` distances are held in memory at once.
+        """
+        n = self.size
+        if n < 2:
+            return []
+        hashes, ids = self.hashes, self.ids
+        parent = list(range(n))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        step = max(1, chunk_cells // n)
+        for start in range(0, n, step):
+            block = hashes[start:start + step, None] ^ hashes[None, :]
+            rows, cols = np.nonzero(np.bitwise_count(block) <= threshold)
+            rows += start
+            upper = cols > rows
+            for r, c in zip(rows[upper].tolist(), cols[upper].tolist()):
+                a, b = find(r), find(c)
+                if a != b:
+                    parent[b] = a
+
+        groups = {}
+        for i in range(n):
+            groups.setdefault(find(i), []).append(int(ids[i]))
+        return sorted((sorted(set(g)) for g in groups.values() if len(set(g)) > 1),
+                      key=len, reverse=True)
+
+
+# ─────────────────────────────────────────────────────────────
+# PROCESS-WIDE INDEX
+# ─────────────────────────────────────────────────────────────
+_tree   = None
+_matrix = None
+_by_id  = {}       # report id → indexed hash, so changes replace the old entry
+_seq    = 0        # last image_hash_changes row applied
+_lock   = threading.Lock()
+
+_MASK = (1 << 64) - 1
+
+
+def rebuild_hash_index(db=None) -> int:
+    """Load every stored report hash into a fresh BK-tree and matrix. Returns the entry count."""
+    global _tree, _matrix, _by_id, _seq
+    conn = db or get_db()
+    # Log position first: changes committed while the table is read are replayed, harmlessly
+    seq  = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM image_hash_changes").fetchone()[0]
+    rows = conn.execute("SELECT id, image_hash_int FROM reports WHERE image_hash_int IS NOT NULL").fetchall()
+    ids    = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    hashes = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows)).view(np.uint64)
+    tree = BKTree()
+    for h, rid in zip(hashes.tolist(), ids.tolist()):
+        tree.add(h, rid)
+    matrix = HashMatrix(hashes, ids)
+    with _lock:
+        _tree, _matrix = tree, matrix
+        _by_id = dict(zip(ids.tolist(), hashes.tolist()))
+        _seq   = seq
+    print(f"🔎 Image hash index built — {tree.size} hashes")
+    return tree.size
+
+
+def _set(report_id: int, h):
+    """Point report_id at hash h (None removes it). Caller holds _lock."""
+    old = _by_id.pop(report_id, None)
+    if old == h:
+        _by_id[report_id] = h
+        return
+    if old is not None:
+        _tree.remove(old, report_id)
+        _matrix.remove(report_id)
+    if h is not None:
+        _tree.add(h, report_id)
+        _matrix.add(h, report_id)
+        _by_id[report_id] = h
+
+
+def _has_pending_writes(conn) -> bool:
+    # Log rows from this connection's uncommitted transaction may still roll back
+    # and have their seq reused, so they must not advance _seq
+    return conn.in_transaction and not conn.execute("PRAGMA query_only").fetchone()[0]
+
+
+def _refresh(conn):
+    """Apply image_hash_changes rows written since the last lookup, by any process."""
+    global _seq
+    if _has_pending_writes(conn):
+        return
+    # The report's current hash; NULL once it is deleted or its hash cleared
+    changes = conn.execute("""
+        SELECT c.seq, c.report_id, r.image_hash_int FROM image_hash_changes c
+        LEFT JOIN reports r ON r.id = c.report_id
+        WHERE c.seq > ? ORDER BY c.seq
+    """, (_seq,)).fetchall()
+    if not changes:
+        return
+    with _lock:
+        for seq, report_id, h in changes:
+            if seq <= _seq:
+                continue
+            _set(report_id, h & _MASK if h is not None else None)
+            _seq = seq
+
+
+def _ensure_index(db=None):
+    conn = db or get_db()
+    if _tree is None:
+        rebuild_hash_index(conn)
+    _refresh(conn)
+
+
+def find_similar(image_hash: str, threshold: int = HAMMING_THRESHOLD, db=None) -> list:
+    """(distance, report_id) pairs within `threshold` bits, closest first."""
+    h = hash_to_int(image_hash)
+    if h is None:
+        return []
+    _ensure_index(db)
+    with _lock:
+        return _tree.search(h, threshold)
+
+
+def nearest_reports(image_hash: str, k: int = 5, max_distance: int = 64, db=None) -> list:
+    """The k stored hashes closest to image_hash as (distance, report_id), via one vectorised scan."""
+    h = hash_to_int(image_hash)
+    if h is None:
+        return []
+    _ensure_index(db)
+    with _lock:
+        return _matrix.top_k(h, k, max_distance)
+
+
+def duplicate_clusters(threshold: int = HAMMING_THRESHOLD, db=None) -> list:
+    """Lists of report ids whose images are within `threshold` bits of one another, largest first."""
+    _ensure_index(db)
+    with _lock:
+        matrix = HashMatrix(_matrix.hashes.copy(), _matrix.ids.copy())
+    return matrix.clusters(threshold)
+
+
+def duplicate_cluster_reports(threshold: int = HAMMING_THRESHOLD, db=None) -> list:
+    """
+    duplicate_clusters() with each id replaced by its report row
+    {id, report_id, title, status, created_at}, oldest first. Every
+    member is fetched in one primary-key query.
+    """
+    conn     = db or get_db()
+    clusters = duplicate_clusters(threshold, conn)
+    members  = [rid for cluster in clusters for rid in cluster]
+    rows     = {r["id"]: dict(r) for r in conn.execute(
+        "SELECT id, report_id, title, status, created_at FROM reports "
+        "WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(members),))}
+    found    = ([rows[rid] for rid in cluster if rid in rows] for cluster in clusters)
+    return [sorted(c, key=lambda r: r["created_at"] or "") for c in found if len(c) > 1]
+
+
+def index_size() -> int:
+    return _tree.size if _tree is not None else 0
+
+
+if __name__ == "__main__":
+    if "--clusters" in sys.argv:
+        threshold = HAMMING_THRESHOLD
+        if "--threshold" in sys.argv:
+            threshold = int(sys.argv[sys.argv.index("--threshold") + 1])
+        clusters = duplicate_cluster_reports(threshold, get_db())
+        for rows in clusters:
+            print(f"🧩 {len(rows)} reports: " + ", ".join(f"{r['report_id']} ({r['title']})" for r in rows))
+        print(f"\n{len(clusters)} duplicate cluster(s) at ≤ {threshold} bits")
+    else:
+        print(__doc__)
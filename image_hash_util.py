@@ -3,36 +3,148 @@ image_hash_util.py — Image Duplicate Detection for CivicConnect
 ===============================================================
 Extracted and adapted from image_hash.py for integration with app.py
 Uses perceptual hashing (pHash) to detect duplicate/similar images.
+Near-duplicates (re-encoded, resized, slightly cropped copies) are found
+by Hamming distance through the BK-tree in hash_index.py.
+
+Uploads are hashed with pHash, dHash and wHash from one decode. Exact and
+near-exact copies (pHash within IMAGE_DUP_EXACT_THRESHOLD bits) are
+rejected wherever the original was reported. Looser matches need at least
+two of the three hashes to agree, and when the report has coordinates
+they are only looked for among reports within IMAGE_DUP_RADIUS_M metres
+and IMAGE_DUP_DAYS days — similar-looking streets elsewhere no longer
+trip the check.
 
 Install required packages:
-    pip install Pillow imagehash geopy
+    pip install Pillow imagehash
 """
 
-from PIL import Image
+from PIL import Image, ImageOps
 import imagehash
-import sqlite3
 import os
+import math
+from flask import has_app_context, current_app
+from database import get_db
+from hash_index import HAMMING_THRESHOLD, find_similar, hash_to_int, hamming
+from geo_util import haversine_distance
+from upload_store import inspect_image, store_upload
+
+# ─────────────────────────────────────────────────────────────
+# CONFIG — overridable with IMAGE_DUP_EXACT_THRESHOLD / IMAGE_DUP_RADIUS_M / IMAGE_DUP_DAYS
+# ─────────────────────────────────────────────────────────────
+EXACT_THRESHOLD   = 2       # pHash bits — always rejected, however far away the original is
+DUP_RADIUS_M      = 150     # looser matches: only reports this close to the new one are compared
+DUP_WINDOW_DAYS   = 30      # ... and only those submitted this recently
+ENSEMBLE_COLUMNS  = {"phash": "image_hash", "dhash": "image_dhash", "whash": "image_whash"}
+ENSEMBLE_SCALE    = {"phash": 5 / 3, "dhash": 5 / 3, "whash": 4 / 3}   # × IMAGE_DUP_THRESHOLD per vote (6 → 10/10/8)
+ENSEMBLE_MIN_VOTES  = 2
+HASH_DECODE_SIZE    = 256   # JPEG draft decode floor (px); hashes work on ≤ 64 px inputs
+WHASH_SCALE         = 64    # fixed wavelet input size
 
 
 # ─────────────────────────────────────────────────────────────
 # CORE FUNCTION — Generate hash from image file
 # ─────────────────────────────────────────────────────────────
-def get_image_hash(image_path: str) -> str:
+def open_for_hashing(image) -> Image.Image:
     """
-    Generate a perceptual hash string from an image file.
+    Decode an image just large enough to hash. JPEGs use draft mode, so
+    libjpeg decodes straight to greyscale at 1/2, 1/4 or 1/8 scale (never
+    below HASH_DECODE_SIZE) instead of expanding every megapixel; other
+    formats decode normally. EXIF orientation is applied so a rotated
+    phone photo hashes the way it is displayed.
+    """
+    img = Image.open(image)
+    img.draft("L", (HASH_DECODE_SIZE, HASH_DECODE_SIZE))
+    img = ImageOps.exif_transpose(img)
+    return img.convert("L")
+
+
+def get_image_hash(image) -> str:
+    """
+    Generate a perceptual hash string from an image file path or an open
+    binary stream (e.g. an upload that hasn't been written to disk).
     pHash is robust — similar images get similar hashes.
     Returns hash string like: 'f8e4c2a1b3d5e7f0'
     """
-    img = Image.open(image_path)
-    return str(imagehash.phash(img))
+    return str(imagehash.phash(open_for_hashing(image)))
+
+
+def get_image_hashes(image) -> dict:
+    """
+    pHash, dHash and wHash from a single reduced decode (path or binary
+    stream); the pHash is identical to get_image_hash() for the same image.
+    wHash runs at a fixed WHASH_SCALE rather than the largest power of two
+    that fits the photo, so it no longer depends on the source resolution.
+    Returns {"phash": ..., "dhash": ..., "whash": ...} as hex strings.
+    """
+    gray = open_for_hashing(image)
+    return {
+        "phash": str(imagehash.phash(gray)),
+        "dhash": str(imagehash.dhash(gray)),
+        "whash": str(imagehash.whash(gray, image_scale=WHASH_SCALE)),
+    }
 
 
 # ─────────────────────────────────────────────────────────────
 # CHECK DUPLICATE — Compare hash against existing reports
 # ─────────────────────────────────────────────────────────────
-def check_duplicate(image_hash: str, db_path: str = "civic_connect.db") -> dict:
+def dup_threshold() -> int:
+    """Hamming threshold from app config (IMAGE_DUP_THRESHOLD); 0 = exact match only."""
+    if has_app_context():
+        return current_app.config.get("IMAGE_DUP_THRESHOLD", HAMMING_THRESHOLD)
+    return HAMMING_THRESHOLD
+
+
+def exact_threshold() -> int:
+    """Near-exact pHash threshold from app config (IMAGE_DUP_EXACT_THRESHOLD), never above dup_threshold()."""
+    threshold = EXACT_THRESHOLD
+    if has_app_context():
+        threshold = current_app.config.get("IMAGE_DUP_EXACT_THRESHOLD", threshold)
+    return min(threshold, dup_threshold())
+
+
+def ensemble_thresholds() -> dict:
+    """Max bits per hash for it to count as a vote, scaled from dup_threshold()."""
+    threshold = dup_threshold()
+    return {kind: round(threshold * scale) for kind, scale in ENSEMBLE_SCALE.items()}
+
+
+def _ensemble_match(hashes: dict, row) -> bool:
+    """
+    True when enough of the upload's hashes are close to the stored
+    report's. Rows hashed before dHash/wHash were stored only have a
+    pHash, which must then be within dup_threshold() on its own.
+    """
+    dists = {}
+    for kind, col in ENSEMBLE_COLUMNS.items():
+        a, b = hash_to_int(hashes.get(kind)), hash_to_int(row[col])
+        if a is not None and b is not None:
+            dists[kind] = hamming(a, b)
+    if not dists:
+        return False
+    if list(dists) == ["phash"]:
+        return dists["phash"] <= dup_threshold()
+    limits = ensemble_thresholds()
+    votes  = sum(d <= limits[kind] for kind, d in dists.items())
+    return votes >= min(ENSEMBLE_MIN_VOTES, len(dists))
+
+
+def _no_duplicate() -> dict:
+    return {
+        "is_duplicate": False,
+        "existing_id" : None,
+        "report_id"   : None,
+        "title"       : None,
+        "distance"    : None,
+    }
+
+
+def check_duplicate(image_hash: str, db=None, threshold: int = None, hashes: dict = None) -> dict:
     """
-    Check if an image hash already exists in the reports table.
+    Check if an image hash matches an existing report, exactly or within
+    `threshold` bits of Hamming distance (default: dup_threshold()).
+    Candidates come from the in-memory BK-tree; the closest one that
+    still exists in the reports table wins. Pass `hashes` (from
+    get_image_hashes) to also require the dHash/wHash ensemble to agree.
 
     Returns:
         {
@@ -40,98 +152,145 @@ def check_duplicate(image_hash: str, db_path: str = "civic_connect.db") -> dict:
           "existing_id"  : report DB id (or None),
           "report_id"    : human-readable report id (or None),
           "title"        : title of original report (or None),
-          "report_count" : how many times this image was submitted
+          "distance"     : Hamming distance to the match (or None)
         }
     """
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    conn = db or get_db()
+    if threshold is None:
+        threshold = dup_threshold()
 
-    # Ensure image_hash column exists
-    try:
-        cursor.execute("ALTER TABLE reports ADD COLUMN image_hash TEXT")
-        conn.commit()
-    except Exception:
-        pass  # Column already exists
-
-    cursor.execute(
-        "SELECT id, report_id, title FROM reports WHERE image_hash = ?",
-        (image_hash,)
-    )
-    existing = cursor.fetchone()
-    conn.close()
-
-    if existing:
-        return {
-            "is_duplicate": True,
-            "existing_id" : existing["id"],
-            "report_id"   : existing["report_id"],
-            "title"       : existing["title"],
-        }
-    return {
-        "is_duplicate": False,
-        "existing_id" : None,
-        "report_id"   : None,
-        "title"       : None,
-    }
+    for distance, report_db_id in find_similar(image_hash, threshold, conn):
+        existing = conn.execute(
+            """SELECT id, report_id, title, image_hash, image_dhash, image_whash
+               FROM reports WHERE id = ? AND image_hash IS NOT NULL""",
+            (report_db_id,)
+        ).fetchone()
+        if existing and (hashes is None or _ensemble_match(hashes, existing)):
+            return {
+                "is_duplicate": True,
+                "existing_id" : existing["id"],
+                "report_id"   : existing["report_id"],
+                "title"       : existing["title"],
+                "distance"    : distance,
+            }
+    return _no_duplicate()
 
 
-# ─────────────────────────────────────────────────────────────
-# SAVE HASH — Store hash after a new report is created
-# ─────────────────────────────────────────────────────────────
-def save_image_hash(report_db_id: int, image_hash: str, db_path: str = "civic_connect.db"):
+def check_duplicate_nearby(hashes: dict, latitude: float, longitude: float, db=None) -> dict:
     """
-    Save the image hash to the reports table after a new report is created.
-    Call this right after inserting a new report row.
+    Ensemble duplicate check limited to reports within the configured
+    radius and time window of (latitude, longitude). The bounding box
+    is served by idx_reports_geo, so the candidate set stays small no
+    matter how many images are stored. Closest match (summed Hamming
+    distance over the hashes) wins; same result shape as check_duplicate.
     """
-    conn = sqlite3.connect(db_path)
-    conn.execute(
-        "UPDATE reports SET image_hash = ? WHERE id = ?",
-        (image_hash, report_db_id)
-    )
-    conn.commit()
-    conn.close()
+    conn = db or get_db()
+    radius, days = DUP_RADIUS_M, DUP_WINDOW_DAYS
+    if has_app_context():
+        radius = current_app.config.get("IMAGE_DUP_RADIUS_M", radius)
+        days   = current_app.config.get("IMAGE_DUP_DAYS", days)
+
+    dlat = radius / 111320
+    dlon = radius / (111320 * max(math.cos(math.radians(latitude)), 0.01))
+    candidates = conn.execute(
+        """SELECT id, report_id, title, latitude, longitude, image_hash, image_dhash, image_whash
+           FROM reports
+           WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?
+           AND image_hash IS NOT NULL
+           AND created_at >= datetime('now', ?)""",
+        (latitude - dlat, latitude + dlat, longitude - dlon, longitude + dlon, f"-{int(days)} days")
+    ).fetchall()
+
+    best, best_score = None, None
+    for row in candidates:
+        if haversine_distance(latitude, longitude, row["latitude"], row["longitude"]) > radius:
+            continue
+        if not _ensemble_match(hashes, row):
+            continue
+        score = sum(hamming(hash_to_int(hashes[k]), hash_to_int(row[c]))
+                    for k, c in ENSEMBLE_COLUMNS.items() if hash_to_int(row[c]) is not None)
+        if best is None or score < best_score:
+            best, best_score = row, score
+
+    if best is None:
+        return _no_duplicate()
+    return {
+        "is_duplicate": True,
+        "existing_id" : best["id"],
+        "report_id"   : best["report_id"],
+        "title"       : best["title"],
+        "distance"    : hamming(hash_to_int(hashes["phash"]), hash_to_int(best["image_hash"])),
+    }
 
 
 # ─────────────────────────────────────────────────────────────
 # FULL PIPELINE — Used directly in app.py report_issue route
 # ─────────────────────────────────────────────────────────────
-def process_uploaded_image(image_file, upload_folder: str, db_path: str = "civic_connect.db") -> dict:
+def _coord(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def process_uploaded_image(image_file, upload_folder: str, db=None,
+                           latitude=None, longitude=None) -> dict:
     """
-    Full pipeline:
-      1. Save image to upload folder
-      2. Generate pHash
-      3. Check if duplicate exists
-      4. Return result dict
+    Full pipeline — the upload is decoded and hashed exactly once, straight
+    from its in-memory/spooled stream, and only written to disk when accepted:
+      0. Validate format and dimensions from the header — refuse early
+      1. Generate pHash/dHash/wHash from the upload stream
+      2. Check if duplicate exists — exact/near-exact pHash copies anywhere,
+         then looser ensemble matches among nearby recent reports when the
+         coordinates are known, else in the global pHash index — if so,
+         return without saving
+      3. Save image to content-addressed storage (upload_store) — byte-identical
+         files are stored once
+      4. Return result dict (reuse image_hash when inserting the report)
 
     Returns:
         {
-          "saved_path"   : relative path like 'uploads/abc.jpg',
-          "image_hash"   : hash string,
+          "saved_path"   : relative path like 'uploads/3f/a2/3fa2….jpg' (None for duplicates),
+          "image_hash"   : pHash string,
+          "hashes"       : {"phash", "dhash", "whash"} hash strings,
           "is_duplicate" : True/False,
           "report_id"    : original report id if duplicate (or None),
           "title"        : original report title if duplicate (or None),
+          "distance"     : pHash bit difference to that report (or None),
+          "error"        : why the file was refused before hashing (or None),
         }
     """
-    import uuid
-    from werkzeug.utils import secure_filename
+    stream = image_file.stream
+    info   = inspect_image(stream)
+    if not info["ok"]:
+        return {"saved_path": None, "image_hash": None, "hashes": {}, "is_duplicate": False,
+                "report_id": None, "title": None, "distance": None, "error": info["error"]}
 
-    # Save file
-    filename  = secure_filename(f"{uuid.uuid4().hex}_{image_file.filename}")
-    save_path = os.path.join(upload_folder, filename)
-    os.makedirs(upload_folder, exist_ok=True)
-    image_file.save(save_path)
+    # Generate hashes from the stream — nothing on disk yet
+    hashes = get_image_hashes(stream)
 
-    # Generate hash
-    img_hash = get_image_hash(save_path)
+    # Check duplicate — a copy of an existing photo is refused wherever it was reported;
+    # the radius/time window only decides where looser matches are looked for
+    dup = check_duplicate(hashes["phash"], db, threshold=exact_threshold())
+    if not dup["is_duplicate"]:
+        lat, lon = _coord(latitude), _coord(longitude)
+        if lat is not None and lon is not None:
+            dup = check_duplicate_nearby(hashes, lat, lon, db)
+        else:
+            dup = check_duplicate(hashes["phash"], db, hashes=hashes)
 
-    # Check duplicate
-    dup = check_duplicate(img_hash, db_path)
+    # Save file only when accepted
+    saved_path = None
+    if not dup["is_duplicate"]:
+        saved_path = store_upload(stream, info["ext"], os.path.dirname(os.path.normpath(upload_folder)), db)
 
     return {
-        "saved_path"  : f"uploads/{filename}",
-        "image_hash"  : img_hash,
+        "saved_path"  : saved_path,
+        "image_hash"  : hashes["phash"],
+        "hashes"      : hashes,
         "is_duplicate": dup["is_duplicate"],
         "report_id"   : dup["report_id"],
         "title"       : dup["title"],
+        "distance"    : dup["distance"],
+        "error"       : None,
     }
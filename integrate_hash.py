@@ -74,13 +74,13 @@ if "image_hash_util" in content:
 else:
     # 1. Add import at top
     old_import = "from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify"
-    new_import  = old_import + "\nfrom image_hash_util import process_uploaded_image, save_image_hash"
+    new_import  = old_import + "\nfrom image_hash_util import process_uploaded_image"
 
     if old_import in content:
         content = content.replace(old_import, new_import)
         ok("Added image_hash_util import to app.py")
     else:
-        content = "from image_hash_util import process_uploaded_image, save_image_hash\n" + content
+        content = "from image_hash_util import process_uploaded_image\n" + content
         warn("Added import at top (fallback method)")
 
     # 2. Replace the image handling block inside report_issue route
@@ -114,7 +114,7 @@ else:
     else:
         warn("Could not find exact image block — will do manual patch below")
 
-    # 3. After db.execute INSERT for new report, add save_image_hash call
+    # 3. After db.execute INSERT for new report, store the image hash
     OLD_COMMIT = """        db.commit()
         db.close()
         flash(f'Report {report_id} submitted successfully!', 'success')
@@ -125,13 +125,15 @@ else:
         if image_path:
             new_report = db.execute("SELECT id FROM reports WHERE report_id=?", (report_id,)).fetchone()
             if new_report:
-                from image_hash_util import save_image_hash as _save_hash
                 try:
                     from image_hash_util import get_image_hash as _get_hash
+                    from hash_index import hash_to_db_int as _db_int
                     import os as _os
                     full_path = _os.path.join('static', image_path)
                     _hash = _get_hash(full_path)
-                    _save_hash(new_report['id'], _hash)
+                    db.execute("UPDATE reports SET image_hash = ?, image_hash_int = ? WHERE id = ?",
+                               (_hash, _db_int(_hash), new_report['id']))
+                    db.commit()
                 except Exception:
                     pass
         db.close()
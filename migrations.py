@@ -0,0 +1,707 @@
+"""
+migrations.py — Versioned schema migrations for CivicConnect
+============================================================
+All DDL lives here. Each migration runs once, in its own transaction,
+and is recorded in the `schema_version` table, so request handlers never
+issue CREATE/ALTER statements. A migration spells out its own DDL and
+never reads live application code, so replaying it later builds exactly
+the schema it built when it shipped.
+
+Apply pending migrations (also done by init_db() at app startup):
+    python migrations.py
+
+Show the applied version:
+    python migrations.py --status
+
+Route queries are checked against full scans of `reports` by
+tests/test_query_plans.py (run with pytest).
+"""
+
+import sys
+import sqlite3
+from database import connect, get_db
+
+
+def _columns(db, table: str) -> set:
+    return {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+
+
+# ─────────────────────────────────────────────────────────────────────
+# MIGRATIONS
+# ─────────────────────────────────────────────────────────────────────
+def _run_script(db, script: str):
+    """
+    Execute a multi-statement script inside the current transaction.
+    (executescript() would COMMIT first and break atomicity.)
+    """
+    stmt = ""
+    for line in script.splitlines(keepends=True):
+        stmt += line
+        if sqlite3.complete_statement(stmt):
+            db.execute(stmt)
+            stmt = ""
+    if stmt.strip():
+        db.execute(stmt)
+
+
+def _add_column(db, table: str, col: str, coltype: str):
+    if col not in _columns(db, table):
+        db.execute(f"ALTER TABLE {table} ADD COLUMN {col} {coltype}")
+
+
+def _m001_core_tables(db):
+    _run_script(db, """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'citizen',
+            full_name TEXT,
+            email TEXT,
+            phone TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_id TEXT UNIQUE NOT NULL,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT NOT NULL,
+            location_address TEXT,
+            latitude REAL,
+            longitude REAL,
+            image_path TEXT,
+            status TEXT DEFAULT 'Pending',
+            severity TEXT DEFAULT 'Medium',
+            admin_notes TEXT,
+            label TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS community_posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            message TEXT,
+            likes INTEGER DEFAULT 0,
+            dislikes INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (report_id) REFERENCES reports(id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS post_reactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            reaction TEXT NOT NULL,
+            UNIQUE(post_id, user_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS surveys (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            q1 TEXT, q2 TEXT, q3 TEXT, q4 TEXT, q5 TEXT,
+            submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS consultations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            department TEXT,
+            message TEXT,
+            status TEXT DEFAULT 'Open',
+            admin_reply TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+    """)
+
+
+def _m002_image_hash(db):
+    _add_column(db, "reports", "image_hash", "TEXT")
+
+
+def _m003_satellite_tables(db):
+    _run_script(db, """
+        CREATE TABLE IF NOT EXISTS satellite_scans (
+            id            INTEGER PRIMARY KEY AUTOINCREMENT,
+            scan_date     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            area_name     TEXT NOT NULL,
+            latitude      REAL NOT NULL,
+            longitude     REAL NOT NULL,
+            radius_km     REAL DEFAULT 5.0,
+            image_path    TEXT,
+            issues_found  INTEGER DEFAULT 0,
+            new_reports   INTEGER DEFAULT 0,
+            confirmed     INTEGER DEFAULT 0,
+            status        TEXT DEFAULT 'processing'
+        );
+
+        CREATE TABLE IF NOT EXISTS satellite_issues (
+            id                 INTEGER PRIMARY KEY AUTOINCREMENT,
+            scan_id            INTEGER NOT NULL,
+            issue_type         TEXT NOT NULL,
+            confidence         REAL DEFAULT 0.0,
+            latitude           REAL,
+            longitude          REAL,
+            bbox_coords        TEXT,
+            image_crop_path    TEXT,
+            matched_report_id  INTEGER,
+            action_taken       TEXT DEFAULT 'pending',
+            created_at         TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (scan_id)           REFERENCES satellite_scans(id),
+            FOREIGN KEY (matched_report_id) REFERENCES reports(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS report_satellite_links (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_id    INTEGER NOT NULL,
+            scan_id      INTEGER NOT NULL,
+            issue_id     INTEGER NOT NULL,
+            link_type    TEXT DEFAULT 'confirmed',
+            linked_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (report_id) REFERENCES reports(id),
+            FOREIGN KEY (scan_id)   REFERENCES satellite_scans(id)
+        );
+    """)
+    _add_column(db, "reports", "source", "TEXT DEFAULT 'citizen'")
+    _add_column(db, "reports", "satellite_confirmed", "INTEGER DEFAULT 0")
+    _add_column(db, "reports", "satellite_scan_id", "INTEGER")
+
+
+def _m004_indexes(db):
+    # Secondary indexes for the hot route and engine queries
+    _run_script(db, """
+        -- citizen_dashboard / track_reports / community eligible / ai_chat
+        CREATE INDEX IF NOT EXISTS idx_reports_user_created  ON reports(user_id, created_at);
+        -- admin_dashboard listing, keyset ordering
+        CREATE INDEX IF NOT EXISTS idx_reports_created       ON reports(created_at);
+        -- admin_dashboard COUNTs, weather_alert critical list
+        CREATE INDEX IF NOT EXISTS idx_reports_status        ON reports(status);
+        CREATE INDEX IF NOT EXISTS idx_reports_severity      ON reports(severity, status);
+        -- report_stats_api GROUP BY, find_matching_citizen_report
+        CREATE INDEX IF NOT EXISTS idx_reports_category      ON reports(category, created_at);
+        -- exact image_hash lookups
+        CREATE INDEX IF NOT EXISTS idx_reports_image_hash    ON reports(image_hash);
+        -- map_view / satellite map — only geotagged rows are indexed
+        CREATE INDEX IF NOT EXISTS idx_reports_geo           ON reports(latitude, longitude)
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
+        -- satellite_dashboard lists, get_satellite_stats
+        CREATE INDEX IF NOT EXISTS idx_reports_source        ON reports(source, created_at);
+        CREATE INDEX IF NOT EXISTS idx_reports_sat_confirmed ON reports(satellite_confirmed, updated_at);
+        CREATE INDEX IF NOT EXISTS idx_users_role            ON users(role);
+        CREATE INDEX IF NOT EXISTS idx_community_created     ON community_posts(created_at);
+        CREATE INDEX IF NOT EXISTS idx_community_report      ON community_posts(report_id);
+        CREATE INDEX IF NOT EXISTS idx_surveys_user          ON surveys(user_id);
+        CREATE INDEX IF NOT EXISTS idx_consultations_user    ON consultations(user_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_sat_scans_date        ON satellite_scans(scan_date);
+        CREATE INDEX IF NOT EXISTS idx_sat_scans_status      ON satellite_scans(status);
+        CREATE INDEX IF NOT EXISTS idx_sat_issues_scan       ON satellite_issues(scan_id);
+        CREATE INDEX IF NOT EXISTS idx_sat_issues_created    ON satellite_issues(created_at);
+        CREATE INDEX IF NOT EXISTS idx_sat_links_report      ON report_satellite_links(report_id);
+    """)
+
+
+# Dimensions tracked in report_counters — (name, SQL expression over a reports row)
+COUNTER_DIMENSIONS = [
+    ("status",              "COALESCE({row}.status, '')"),
+    ("severity",            "COALESCE({row}.severity, '')"),
+    ("category",            "COALESCE({row}.category, '')"),
+    ("source",              "COALESCE({row}.source, 'citizen')"),
+    ("satellite_confirmed", "CAST(COALESCE({row}.satellite_confirmed, 0) AS TEXT)"),
+]
+
+
+def _counter_upsert(row: str, delta: int) -> str:
+    values = [f"('total', '', {delta})"] + [
+        f"('{name}', {expr.format(row=row)}, {delta})" for name, expr in COUNTER_DIMENSIONS
+    ]
+    return (
+        "INSERT INTO report_counters (dimension, value, count) VALUES\n            "
+        + ",\n            ".join(values)
+        + "\n            ON CONFLICT(dimension, value) DO UPDATE SET count = count + excluded.count;"
+    )
+
+
+def _m005_report_counters(db):
+    columns = ", ".join(name for name, _ in COUNTER_DIMENSIONS)
+    _run_script(db, f"""
+        CREATE TABLE IF NOT EXISTS report_counters (
+            dimension  TEXT NOT NULL,
+            value      TEXT NOT NULL,
+            count      INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, value)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS trg_report_counters_insert
+        AFTER INSERT ON reports BEGIN
+            {_counter_upsert("NEW", 1)}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_report_counters_delete
+        AFTER DELETE ON reports BEGIN
+            {_counter_upsert("OLD", -1)}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_report_counters_update
+        AFTER UPDATE OF {columns} ON reports BEGIN
+            {_counter_upsert("OLD", -1)}
+            {_counter_upsert("NEW", 1)}
+        END;
+    """)
+
+    # Backfill from the existing rows
+    db.execute("DELETE FROM report_counters")
+    db.execute("INSERT INTO report_counters (dimension, value, count) SELECT 'total', '', COUNT(*) FROM reports")
+    for name, expr in COUNTER_DIMENSIONS:
+        db.execute(f"""
+            INSERT INTO report_counters (dimension, value, count)
+            SELECT '{name}', {expr.format(row="reports")}, COUNT(*) FROM reports GROUP BY 2
+        """)
+
+
+def _m006_keyset_indexes(db):
+    # list_reports() status/severity filters in keyset order.
+    # (status) alone can't serve ORDER BY created_at — superseded by (status, created_at)
+    _run_script(db, """
+        DROP INDEX IF EXISTS idx_reports_status;
+        CREATE INDEX IF NOT EXISTS idx_reports_status_created   ON reports(status, created_at);
+        CREATE INDEX IF NOT EXISTS idx_reports_severity_created ON reports(severity, created_at);
+    """)
+
+
+def _m007_user_report_summary(db):
+    _run_script(db, """
+        CREATE TABLE IF NOT EXISTS user_report_summary (
+            user_id        INTEGER PRIMARY KEY,
+            total          INTEGER NOT NULL DEFAULT 0,
+            pending        INTEGER NOT NULL DEFAULT 0,
+            in_progress    INTEGER NOT NULL DEFAULT 0,
+            resolved       INTEGER NOT NULL DEFAULT 0,
+            last_activity  TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+
+        CREATE TRIGGER IF NOT EXISTS trg_user_summary_insert
+        AFTER INSERT ON reports BEGIN
+            INSERT INTO user_report_summary (user_id, total, pending, in_progress, resolved, last_activity)
+            VALUES (NEW.user_id, 1,
+                    COALESCE(NEW.status = 'Pending', 0),
+                    COALESCE(NEW.status = 'In Progress', 0),
+                    COALESCE(NEW.status = 'Resolved', 0),
+                    COALESCE(NEW.created_at, CURRENT_TIMESTAMP))
+            ON CONFLICT(user_id) DO UPDATE SET
+                total         = total + 1,
+                pending       = pending + excluded.pending,
+                in_progress   = in_progress + excluded.in_progress,
+                resolved      = resolved + excluded.resolved,
+                last_activity = MAX(COALESCE(last_activity, ''), excluded.last_activity);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_user_summary_delete
+        AFTER DELETE ON reports BEGIN
+            UPDATE user_report_summary SET
+                total       = total - 1,
+                pending     = pending - COALESCE(OLD.status = 'Pending', 0),
+                in_progress = in_progress - COALESCE(OLD.status = 'In Progress', 0),
+                resolved    = resolved - COALESCE(OLD.status = 'Resolved', 0)
+            WHERE user_id = OLD.user_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_user_summary_update
+        AFTER UPDATE OF status, user_id ON reports BEGIN
+            UPDATE user_report_summary SET
+                total       = total - 1,
+                pending     = pending - COALESCE(OLD.status = 'Pending', 0),
+                in_progress = in_progress - COALESCE(OLD.status = 'In Progress', 0),
+                resolved    = resolved - COALESCE(OLD.status = 'Resolved', 0)
+            WHERE user_id = OLD.user_id;
+            INSERT INTO user_report_summary (user_id, total, pending, in_progress, resolved, last_activity)
+            VALUES (NEW.user_id, 1,
+                    COALESCE(NEW.status = 'Pending', 0),
+                    COALESCE(NEW.status = 'In Progress', 0),
+                    COALESCE(NEW.status = 'Resolved', 0),
+                    CURRENT_TIMESTAMP)
+            ON CONFLICT(user_id) DO UPDATE SET
+                total         = total + 1,
+                pending       = pending + excluded.pending,
+                in_progress   = in_progress + excluded.in_progress,
+                resolved      = resolved + excluded.resolved,
+                last_activity = excluded.last_activity;
+        END;
+    """)
+
+    # Backfill from the existing rows
+    db.execute("DELETE FROM user_report_summary")
+    db.execute("""
+        INSERT INTO user_report_summary (user_id, total, pending, in_progress, resolved, last_activity)
+        SELECT user_id, COUNT(*),
+               SUM(status = 'Pending'), SUM(status = 'In Progress'), SUM(status = 'Resolved'),
+               MAX(MAX(COALESCE(created_at, '')), MAX(COALESCE(updated_at, '')))
+        FROM reports GROUP BY user_id
+    """)
+
+
+def _m008_image_hash_changes(db):
+    # Id of every report whose pHash was stored, changed or removed, in commit
+    # order, so each process's in-memory hash index (hash_index.py) can catch up
+    # with writes made elsewhere
+    _run_script(db, """
+        CREATE TABLE IF NOT EXISTS image_hash_changes (
+            seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_id  INTEGER NOT NULL
+        );
+
+        CREATE TRIGGER IF NOT EXISTS trg_image_hash_insert
+        AFTER INSERT ON reports
+        WHEN NEW.image_hash IS NOT NULL BEGIN
+            INSERT INTO image_hash_changes (report_id) VALUES (NEW.id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_image_hash_update
+        AFTER UPDATE OF image_hash ON reports
+        WHEN OLD.image_hash IS NOT NEW.image_hash BEGIN
+            INSERT INTO image_hash_changes (report_id) VALUES (NEW.id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_image_hash_delete
+        AFTER DELETE ON reports
+        WHEN OLD.image_hash IS NOT NULL BEGIN
+            INSERT INTO image_hash_changes (report_id) VALUES (OLD.id);
+        END;
+    """)
+
+
+def _m009_image_hash_int(db):
+    # pHash as a signed 64-bit integer (SQLite INTEGER) for the NumPy hash index
+    _add_column(db, "reports", "image_hash_int", "INTEGER")
+    rows = db.execute("SELECT id, image_hash FROM reports WHERE image_hash IS NOT NULL").fetchall()
+    values = []
+    for row in rows:
+        try:
+            h = int(row["image_hash"], 16)
+        except ValueError:
+            continue
+        values.append((h - (1 << 64) if h >= (1 << 63) else h, row["id"]))
+    db.executemany("UPDATE reports SET image_hash_int = ? WHERE id = ?", values)
+    # hash index rebuild — covering, hashed rows only
+    db.execute("CREATE INDEX IF NOT EXISTS idx_reports_hash_int ON reports(image_hash_int) "
+               "WHERE image_hash_int IS NOT NULL")
+
+
+def _m010_ensemble_hashes(db):
+    # dHash / wHash alongside pHash for the ensemble duplicate check
+    _add_column(db, "reports", "image_dhash", "TEXT")
+    _add_column(db, "reports", "image_whash", "TEXT")
+
+
+def _m011_image_files(db):
+    # Per-file hash log written by backfill_hashes.py (path relative to static/)
+    _run_script(db, """
+        CREATE TABLE IF NOT EXISTS image_files (
+            path       TEXT PRIMARY KEY,
+            size       INTEGER,
+            mtime      INTEGER,
+            phash      TEXT,
+            dhash      TEXT,
+            whash      TEXT,
+            hashed_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID;
+    """)
+    _add_column(db, "satellite_issues", "image_hash", "TEXT")
+    # hash backfill write-back by file
+    db.execute("CREATE INDEX IF NOT EXISTS idx_reports_image_path ON reports(image_path) "
+               "WHERE image_path IS NOT NULL")
+
+
+def _static_rel(expr: str) -> str:
+    """SQL for a stored file path relative to static/ ('static\\satellite\\x.jpg' → 'satellite/x.jpg')."""
+    path = f"replace({expr}, '\\', '/')"
+    return f"(CASE WHEN {path} LIKE 'static/%' THEN substr({path}, 8) ELSE {path} END)"
+
+
+def _upload_ref_triggers(table: str, col: str) -> str:
+    """Triggers keeping upload_refs counts in step with one path column."""
+    new, old = _static_rel(f"NEW.{col}"), _static_rel(f"OLD.{col}")
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS trg_upload_refs_{table}_insert
+        AFTER INSERT ON {table}
+        WHEN NEW.{col} IS NOT NULL AND NEW.{col} != '' BEGIN
+            INSERT INTO upload_refs (path, refcount) VALUES ({new}, 1)
+            ON CONFLICT(path) DO UPDATE SET refcount = refcount + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_upload_refs_{table}_delete
+        AFTER DELETE ON {table}
+        WHEN OLD.{col} IS NOT NULL AND OLD.{col} != '' BEGIN
+            UPDATE upload_refs SET refcount = refcount - 1 WHERE path = {old};
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_upload_refs_{table}_update
+        AFTER UPDATE OF {col} ON {table}
+        WHEN OLD.{col} IS NOT NEW.{col} BEGIN
+            UPDATE upload_refs SET refcount = refcount - 1 WHERE path = {old};
+            INSERT INTO upload_refs (path, refcount)
+            SELECT {new}, 1 WHERE NEW.{col} IS NOT NULL AND NEW.{col} != ''
+            ON CONFLICT(path) DO UPDATE SET refcount = refcount + 1;
+        END;
+    """
+
+
+def _m012_upload_refs(db):
+    # How many rows point at each stored file — report uploads, satellite crops
+    # and scan images — so every refcount-0 file can be found straight from
+    # the table
+    _run_script(db, """
+        CREATE TABLE IF NOT EXISTS upload_refs (
+            path      TEXT PRIMARY KEY,
+            refcount  INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS idx_upload_refs_orphans ON upload_refs(path) WHERE refcount <= 0;
+
+        CREATE TRIGGER IF NOT EXISTS trg_upload_refs_insert
+        AFTER INSERT ON reports
+        WHEN NEW.image_path IS NOT NULL AND NEW.image_path != '' BEGIN
+            INSERT INTO upload_refs (path, refcount) VALUES (NEW.image_path, 1)
+            ON CONFLICT(path) DO UPDATE SET refcount = refcount + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_upload_refs_delete
+        AFTER DELETE ON reports
+        WHEN OLD.image_path IS NOT NULL AND OLD.image_path != '' BEGIN
+            UPDATE upload_refs SET refcount = refcount - 1 WHERE path = OLD.image_path;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_upload_refs_update
+        AFTER UPDATE OF image_path ON reports
+        WHEN OLD.image_path IS NOT NEW.image_path BEGIN
+            UPDATE upload_refs SET refcount = refcount - 1 WHERE path = OLD.image_path;
+            INSERT INTO upload_refs (path, refcount)
+            SELECT NEW.image_path, 1 WHERE NEW.image_path IS NOT NULL AND NEW.image_path != ''
+            ON CONFLICT(path) DO UPDATE SET refcount = refcount + 1;
+        END;
+    """ + _upload_ref_triggers("satellite_issues", "image_crop_path")
+        + _upload_ref_triggers("satellite_scans", "image_path"))
+
+    # Backfill from the existing rows
+    db.execute("DELETE FROM upload_refs")
+    db.execute(f"""
+        INSERT INTO upload_refs (path, refcount)
+        SELECT path, COUNT(*) FROM (
+            SELECT image_path AS path FROM reports WHERE image_path IS NOT NULL AND image_path != ''
+            UNION ALL
+            SELECT {_static_rel("image_crop_path")} FROM satellite_issues
+            WHERE image_crop_path IS NOT NULL AND image_crop_path != ''
+            UNION ALL
+            SELECT {_static_rel("image_path")} FROM satellite_scans
+            WHERE image_path IS NOT NULL AND image_path != ''
+        ) GROUP BY path
+    """)
+
+
+def _m013_ai_cache(db):
+    # Cached AI responses keyed by normalised input (ai_cache.py)
+    _run_script(db, """
+        CREATE TABLE IF NOT EXISTS ai_cache (
+            key         TEXT PRIMARY KEY,
+            kind        TEXT NOT NULL,
+            value       TEXT NOT NULL,
+            created_at  REAL NOT NULL,
+            last_hit    REAL NOT NULL,
+            hits        INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS idx_ai_cache_kind_hit     ON ai_cache(kind, last_hit);
+        CREATE INDEX IF NOT EXISTS idx_ai_cache_kind_created ON ai_cache(kind, created_at);
+    """)
+
+
+def _m014_ai_jobs(db):
+    # Durable queue for background AI calls (ai_jobs.py); heartbeat_at is the
+    # running worker's lease, run_after the retry backoff
+    _run_script(db, """
+        CREATE TABLE IF NOT EXISTS ai_jobs (
+            id           TEXT PRIMARY KEY,
+            kind         TEXT NOT NULL,
+            user_id      INTEGER,
+            payload      TEXT NOT NULL,
+            status       TEXT NOT NULL DEFAULT 'queued',
+            result       TEXT,
+            error        TEXT,
+            attempts     INTEGER NOT NULL DEFAULT 0,
+            created_at   REAL NOT NULL,
+            started_at   REAL,
+            heartbeat_at REAL,
+            run_after    REAL,
+            finished_at  REAL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_ai_jobs_status_created ON ai_jobs(status, created_at);
+    """)
+
+
+def _m015_report_sentiment(db):
+    # Stored sentiment per open report + the content hash it was computed from, and
+    # the queue of open reports whose sentiment needs (re)scoring, both kept by
+    # triggers (sentiment_store.py). version bumps on every change, so a refresh
+    # only clears the rows it actually scored.
+    _run_script(db, """
+        CREATE TABLE IF NOT EXISTS report_sentiment (
+            report_id        INTEGER PRIMARY KEY REFERENCES reports(id),
+            content_hash     TEXT NOT NULL,
+            sentiment_score  INTEGER NOT NULL,
+            sentiment_label  TEXT,
+            sentiment_color  TEXT,
+            sentiment_emoji  TEXT,
+            ai_priority      INTEGER NOT NULL DEFAULT 0,
+            ai_note          TEXT,
+            scored_at        REAL NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_report_sentiment_priority
+            ON report_sentiment(ai_priority, sentiment_score, report_id);
+        CREATE INDEX IF NOT EXISTS idx_report_sentiment_score
+            ON report_sentiment(sentiment_score, report_id);
+
+        CREATE TABLE IF NOT EXISTS sentiment_pending (
+            report_id  INTEGER PRIMARY KEY REFERENCES reports(id),
+            version    INTEGER NOT NULL DEFAULT 1
+        );
+
+        CREATE TRIGGER IF NOT EXISTS trg_sentiment_pending_insert
+        AFTER INSERT ON reports
+        WHEN NEW.status != 'Resolved' BEGIN
+            INSERT INTO sentiment_pending (report_id) VALUES (NEW.id)
+            ON CONFLICT(report_id) DO UPDATE SET version = version + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_sentiment_pending_update
+        AFTER UPDATE OF title, description, severity, status ON reports BEGIN
+            INSERT INTO sentiment_pending (report_id)
+            SELECT NEW.id WHERE NEW.status != 'Resolved'
+            ON CONFLICT(report_id) DO UPDATE SET version = version + 1;
+            DELETE FROM sentiment_pending WHERE report_id = NEW.id AND NEW.status = 'Resolved';
+            DELETE FROM report_sentiment  WHERE report_id = NEW.id AND NEW.status = 'Resolved';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_report_sentiment_delete
+        AFTER DELETE ON reports BEGIN
+            DELETE FROM report_sentiment  WHERE report_id = OLD.id;
+            DELETE FROM sentiment_pending WHERE report_id = OLD.id;
+        END;
+    """)
+
+    # Backfill — every open report; ones whose stored hash still matches are cleared without a model call
+    db.execute("""
+        INSERT OR IGNORE INTO sentiment_pending (report_id)
+        SELECT id FROM reports WHERE status != 'Resolved'
+    """)
+
+
+def _m016_classify_batches(db):
+    # Bulk classification via the Message Batches API (classify_backfill.py).
+    # Errored requests stay recorded with their attempt count.
+    _run_script(db, """
+        CREATE TABLE IF NOT EXISTS classify_batches (
+            id             TEXT PRIMARY KEY,
+            status         TEXT NOT NULL,
+            request_count  INTEGER NOT NULL,
+            submitted_at   REAL NOT NULL,
+            applied_at     REAL
+        );
+
+        CREATE TABLE IF NOT EXISTS report_classifications (
+            report_id   INTEGER PRIMARY KEY REFERENCES reports(id),
+            batch_id    TEXT NOT NULL,
+            status      TEXT NOT NULL DEFAULT 'submitted',
+            category    TEXT,
+            severity    TEXT,
+            summary     TEXT,
+            attempts    INTEGER NOT NULL DEFAULT 1,
+            error       TEXT,
+            updated_at  REAL NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_report_classifications_batch ON report_classifications(batch_id);
+        CREATE INDEX IF NOT EXISTS idx_classify_batches_status      ON classify_batches(status);
+
+        CREATE TRIGGER IF NOT EXISTS trg_report_classifications_delete
+        AFTER DELETE ON reports
+        BEGIN
+            DELETE FROM report_classifications WHERE report_id = OLD.id;
+        END;
+    """)
+
+
+# (version, name, apply function) — append only, never renumber
+MIGRATIONS = [
+    (1,  "core tables",                 _m001_core_tables),
+    (2,  "reports.image_hash column",   _m002_image_hash),
+    (3,  "satellite tables & columns",  _m003_satellite_tables),
+    (4,  "hot query indexes",           _m004_indexes),
+    (5,  "report_counters triggers",    _m005_report_counters),
+    (6,  "keyset pagination indexes",   _m006_keyset_indexes),
+    (7,  "user summary triggers",       _m007_user_report_summary),
+    (8,  "image_hash_changes log",      _m008_image_hash_changes),
+    (9,  "reports.image_hash_int",      _m009_image_hash_int),
+    (10, "reports dHash/wHash columns", _m010_ensemble_hashes),
+    (11, "image_files hash log",        _m011_image_files),
+    (12, "upload_refs triggers",        _m012_upload_refs),
+    (13, "ai_cache table",              _m013_ai_cache),
+    (14, "ai_jobs queue",               _m014_ai_jobs),
+    (15, "report_sentiment & queue",    _m015_report_sentiment),
+    (16, "classify batches",            _m016_classify_batches),
+]
+
+
+def current_version(db) -> int:
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version    INTEGER PRIMARY KEY,
+            name       TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def run_migrations(db=None) -> list:
+    """
+    Apply every migration newer than the recorded schema version.
+    Each one runs in its own transaction. Returns the versions applied.
+    """
+    db      = db or get_db()
+    version = current_version(db)
+    applied = []
+    for number, name, apply in MIGRATIONS:
+        if number <= version:
+            continue
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            apply(db)
+            db.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (number, name))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        print(f"  ✅ Migration {number:03d} applied: {name}")
+        applied.append(number)
+    return applied
+
+
+if __name__ == "__main__":
+    db = connect()
+    if "--status" in sys.argv:
+        print(f"Schema version {current_version(db)} of {MIGRATIONS[-1][0]}")
+        sys.exit(0)
+
+    applied = run_migrations(db)
+    print(f"✅ Schema at version {current_version(db)} ({len(applied)} migration(s) applied)")
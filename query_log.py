@@ -0,0 +1,230 @@
+"""
+query_log.py — SQL statement timing and slow-query log for CivicConnect
+=======================================================================
+Every connection opened by database.py uses InstrumentedConnection, so
+each db.execute() in the app is timed without touching the call sites.
+
+Per statement (whitespace-normalised SQL) it aggregates call count,
+total/max latency, rows returned or changed and the calling endpoints.
+Statements slower than SLOW_QUERY_MS are logged (app logger inside a
+request, else the "query_log" logger) with their EXPLAIN QUERY PLAN and
+kept in a short ring buffer. PRAGMAs and transaction control
+(BEGIN/COMMIT/ROLLBACK/SAVEPOINT/RELEASE) are not recorded. At most
+MAX_STATEMENTS distinct statements are tracked; the least recently run
+one is dropped to make room.
+
+Admin-only JSON view: GET /api/admin/db/queries
+"""
+
+import re
+import time
+import logging
+import threading
+from collections import Counter, OrderedDict, deque
+from flask import request, has_request_context, has_app_context, current_app
+import sqlite3
+
+# ─────────────────────────────────────────────────────────────────────
+# CONFIG — override per app with DB_SLOW_QUERY_MS
+# ─────────────────────────────────────────────────────────────────────
+SLOW_QUERY_MS   = 100      # statements slower than this are logged with their plan
+SLOW_LOG_SIZE   = 50       # recent slow statements kept for the admin endpoint
+TOP_ENDPOINTS   = 5        # callers listed per statement
+MAX_STATEMENTS  = 500      # distinct statements tracked (least recently run evicted)
+
+_lock    = threading.Lock()
+_stats   = OrderedDict()               # normalised sql → aggregate dict, least recently run first
+_slow    = deque(maxlen=SLOW_LOG_SIZE)
+_plans   = {}                          # normalised sql → plan lines (captured once)
+_WS      = re.compile(r"\s+")
+_SKIP    = re.compile(r"\s*(PRAGMA|BEGIN|COMMIT|END|ROLLBACK|SAVEPOINT|RELEASE)\b", re.IGNORECASE)
+_log     = logging.getLogger("query_log")
+
+
+def _normalise(sql: str) -> str:
+    return _WS.sub(" ", sql).strip()
+
+
+def _caller() -> str:
+    if has_request_context():
+        return request.endpoint or request.path
+    return threading.current_thread().name
+
+
+def _logger():
+    return current_app.logger if has_app_context() else _log
+
+
+def _threshold_ms() -> float:
+    if has_app_context():
+        return current_app.config.get("DB_SLOW_QUERY_MS", SLOW_QUERY_MS)
+    return SLOW_QUERY_MS
+
+
+# ─────────────────────────────────────────────────────────────────────
+# RECORDING
+# ─────────────────────────────────────────────────────────────────────
+def _record(conn, sql: str, params, elapsed_ms: float, rows: int):
+    if _SKIP.match(sql):
+        return
+    key    = _normalise(sql)
+    caller = _caller()
+    with _lock:
+        s = _stats.get(key)
+        if s is None:
+            s = _stats[key] = {"sql": key, "calls": 0, "total_ms": 0.0, "max_ms": 0.0,
+                               "rows": 0, "slow": 0, "endpoints": Counter()}
+            while len(_stats) > MAX_STATEMENTS:
+                evicted, _ = _stats.popitem(last=False)
+                _plans.pop(evicted, None)
+        else:
+            _stats.move_to_end(key)
+        s["calls"]    += 1
+        s["total_ms"] += elapsed_ms
+        s["max_ms"]    = max(s["max_ms"], elapsed_ms)
+        s["rows"]     += max(rows, 0)
+        s["endpoints"][caller] += 1
+
+    if elapsed_ms < _threshold_ms():
+        return
+
+    with _lock:
+        plan = _plans.get(key)
+    if plan is None and params is not None:
+        try:
+            plan = [r[3] for r in sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", params)]
+        except sqlite3.Error:
+            plan = []
+        with _lock:
+            plan = _plans.setdefault(key, plan)
+
+    entry = {"sql": key, "ms": round(elapsed_ms, 2), "rows": rows, "endpoint": caller,
+             "plan": plan or [], "at": time.strftime("%Y-%m-%d %H:%M:%S")}
+    with _lock:
+        s["slow"] += 1
+        _slow.append(entry)
+    _logger().warning("🐢 Slow query %s ms (%s rows) in %s: %s%s", entry["ms"], rows, caller, key[:200],
+                      "".join(f"\n     ↳ {line}" for line in entry["plan"]))
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Times a statement from execute() through its last fetch. The sample
+    is recorded when the statement returns no rows, when fetchone() has
+    been called, when the result is drained, or when the cursor is
+    reused or closed — always on the thread and in the request that ran
+    it. A result abandoned part-way through iteration is not recorded.
+    """
+    _sql     = None
+    _params  = None
+    _elapsed = 0.0
+    _rows    = 0
+
+    def _finish(self):
+        if self._sql is None:
+            return
+        sql, self._sql = self._sql, None
+        rows = self._rows if self._rows else self.rowcount
+        _record(self.connection, sql, self._params, self._elapsed * 1000, rows)
+
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def execute(self, sql, params=()):
+        self._finish()
+        self._sql, self._params, self._elapsed, self._rows = sql, params, 0.0, 0
+        self._timed(super().execute, sql, params)
+        if self.description is None:          # INSERT/UPDATE/DDL — already complete
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._finish()
+        self._sql, self._params, self._elapsed, self._rows = sql, None, 0.0, 0
+        self._timed(super().executemany, sql, seq_of_params)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is not None:
+            self._rows += 1
+        self._finish()                        # single-row lookups are rarely read further
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, size if size is not None else self.arraysize)
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose shortcut execute methods go through TimedCursor."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def executescript(self, script):
+        started = time.perf_counter()
+        cur = super().executescript(script)
+        _record(self, script, None, (time.perf_counter() - started) * 1000, 0)
+        return cur
+
+
+# ─────────────────────────────────────────────────────────────────────
+# REPORTING
+# ─────────────────────────────────────────────────────────────────────
+def query_stats(limit: int = 50, order_by: str = "total_ms") -> dict:
+    """Aggregated per-statement stats, heaviest first, plus the recent slow log."""
+    if order_by not in ("total_ms", "max_ms", "calls", "rows", "slow"):
+        order_by = "total_ms"
+    with _lock:
+        rows = sorted(_stats.values(), key=lambda s: s[order_by], reverse=True)[:limit]
+        statements = [
+            {**{k: v for k, v in s.items() if k != "endpoints"},
+             "total_ms" : round(s["total_ms"], 2),
+             "max_ms"   : round(s["max_ms"], 2),
+             "avg_ms"   : round(s["total_ms"] / s["calls"], 3),
+             "endpoints": dict(s["endpoints"].most_common(TOP_ENDPOINTS))}
+            for s in rows
+        ]
+        slow = list(_slow)
+    return {"threshold_ms": _threshold_ms(), "statements": statements, "slow_log": slow}
+
+
+def reset_query_stats():
+    with _lock:
+        _stats.clear()
+        _slow.clear()
+        _plans.clear()
@@ -0,0 +1,174 @@
+"""
+report_store.py — Shared report queries for CivicConnect
+========================================================
+Read helpers used by the citizen, admin and satellite views so the same
+SQL isn't repeated across app.py, ai_routes.py and satellite_engine.py.
+"""
+
+import base64
+from database import get_db
+from hash_index import hash_to_db_int
+
+
+# ─────────────────────────────────────────────────────────────
+# CREATE
+# ─────────────────────────────────────────────────────────────
+REPORT_FIELDS = {
+    "report_id", "user_id", "title", "category", "description",
+    "location_address", "latitude", "longitude", "image_path",
+    "status", "severity", "label", "image_hash", "image_hash_int",
+    "image_dhash", "image_whash",
+    "source", "satellite_confirmed", "satellite_scan_id",
+}
+
+
+def create_report(fields: dict, db=None, commit: bool = True) -> int:
+    """
+    Insert a report — image hash included — in a single statement.
+    Counter/summary triggers fire inside the same transaction.
+    Returns the new row id (cursor.lastrowid, no re-SELECT).
+    A stored image hash reaches the near-duplicate index through the
+    image_hash_changes trigger once the transaction commits.
+    """
+    unknown = set(fields) - REPORT_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown report field(s): {sorted(unknown)}")
+
+    if fields.get("image_hash") and "image_hash_int" not in fields:
+        fields = dict(fields, image_hash_int=hash_to_db_int(fields["image_hash"]))
+
+    db   = db or get_db()
+    cols = list(fields)
+    cur  = db.execute(
+        f"INSERT INTO reports ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+        [fields[c] for c in cols]
+    )
+    if commit:
+        db.commit()
+    return cur.lastrowid
+
+
+# ─────────────────────────────────────────────────────────────
+# COUNTERS — maintained by triggers on reports (migration 005)
+# ─────────────────────────────────────────────────────────────
+def get_report_counters(db=None) -> dict:
+    """
+    Read every aggregate in one pass over the small report_counters table.
+
+    Returns:
+        {
+          "total"              : 42,
+          "status"             : {"Pending": 20, "In Progress": 12, ...},
+          "severity"           : {"Critical": 5, ...},
+          "category"           : {"Roads": 9, ...},
+          "source"             : {"citizen": 40, "satellite": 2},
+          "satellite_confirmed": {"0": 39, "1": 3},
+        }
+    Dimension values whose count has dropped to zero are omitted.
+    """
+    db = db or get_db()
+    counters = {"total": 0, "status": {}, "severity": {}, "category": {},
+                "source": {}, "satellite_confirmed": {}}
+    for row in db.execute("SELECT dimension, value, count FROM report_counters WHERE count > 0"):
+        if row["dimension"] == "total":
+            counters["total"] = row["count"]
+        else:
+            counters.setdefault(row["dimension"], {})[row["value"]] = row["count"]
+    return counters
+
+
+def get_user_summary(user_id: int, db=None) -> dict:
+    """
+    A citizen's report totals from user_report_summary (migration 007) —
+    a single primary-key lookup. Users with no reports get zeros.
+    """
+    db  = db or get_db()
+    row = db.execute("SELECT * FROM user_report_summary WHERE user_id = ?", (user_id,)).fetchone()
+    if row:
+        return dict(row)
+    return {"user_id": user_id, "total": 0, "pending": 0, "in_progress": 0,
+            "resolved": 0, "last_activity": None}
+
+
+# ─────────────────────────────────────────────────────────────
+# KEYSET PAGINATION — (created_at, id) cursor
+# ─────────────────────────────────────────────────────────────
+PAGE_SIZE      = 25
+MAX_PAGE_SIZE  = 100
+FILTER_FIELDS  = ("status", "severity", "category", "source")
+SORT_ORDERS    = {"newest": "DESC", "oldest": "ASC"}
+
+
+def encode_cursor(row) -> str:
+    """Opaque cursor pointing just past `row`."""
+    raw = f"{row['created_at']}|{row['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Return (created_at, id) or None for a missing/malformed cursor."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return created_at, int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def listing_args(args) -> dict:
+    """Pull filters/sort/cursor/limit out of request.args with safe defaults."""
+    try:
+        limit = int(args.get("limit", PAGE_SIZE))
+    except ValueError:
+        limit = PAGE_SIZE
+    sort = args.get("sort", "newest")
+    return {
+        "filters": {f: args.get(f) for f in FILTER_FIELDS if args.get(f)},
+        "sort"   : sort if sort in SORT_ORDERS else "newest",
+        "cursor" : args.get("cursor") or None,
+        "limit"  : max(1, min(limit, MAX_PAGE_SIZE)),
+    }
+
+
+def list_reports(filters: dict = None, sort: str = "newest", cursor: str = None,
+                 limit: int = PAGE_SIZE, user_id: int = None, db=None) -> dict:
+    """
+    One page of reports (joined to the author's name), newest or oldest
+    first. Each page is a single indexed range scan of at most limit+1
+    rows, whatever the table size.
+
+    Returns:
+        {
+          "reports"    : [sqlite3.Row, ...],
+          "next_cursor": cursor for the following page (or None),
+        }
+    """
+    db     = db or get_db()
+    order  = SORT_ORDERS.get(sort, "DESC")
+    where  = []
+    params = []
+
+    if user_id is not None:
+        where.append("r.user_id = ?")
+        params.append(user_id)
+    for field, value in (filters or {}).items():
+        if field in FILTER_FIELDS:
+            where.append(f"r.{field} = ?")
+            params.append(value)
+
+    after = decode_cursor(cursor)
+    if after:
+        where.append(f"(r.created_at, r.id) {'<' if order == 'DESC' else '>'} (?, ?)")
+        params.extend(after)
+
+    sql = "SELECT r.*, u.full_name FROM reports r JOIN users u ON r.user_id = u.id"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY r.created_at {order}, r.id {order} LIMIT ?"
+    params.append(limit + 1)
+
+    rows = db.execute(sql, params).fetchall()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"reports": rows[:limit], "next_cursor": next_cursor}
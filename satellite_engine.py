@@ -16,17 +16,20 @@ import cv2
 import json
 import math
 import uuid
-import sqlite3
 import requests
 import numpy as np
 from PIL import Image
 from datetime import datetime, timedelta
 from geopy.geocoders import Nominatim
+from database import get_db
+from geo_util import haversine_distance
+from migrations import run_migrations
+from report_store import get_report_counters
+from upload_store import register_files
 
 # ─────────────────────────────────────────────────────────────────────
 # CONFIG
 # ─────────────────────────────────────────────────────────────────────
-DB_PATH          = "civic_connect.db"
 SATELLITE_FOLDER = "static/satellite"
 UPLOAD_FOLDER    = "static/uploads"
 
@@ -70,82 +73,12 @@ os.makedirs(UPLOAD_FOLDER,    exist_ok=True)
 # ─────────────────────────────────────────────────────────────────────
 # DATABASE HELPERS
 # ─────────────────────────────────────────────────────────────────────
-def get_db():
-    db = sqlite3.connect(DB_PATH)
-    db.row_factory = sqlite3.Row
-    return db
-
-
 def ensure_satellite_tables():
-    """Create satellite tables if they don't exist."""
-    db = get_db()
-    db.executescript("""
-        CREATE TABLE IF NOT EXISTS satellite_scans (
-            id            INTEGER PRIMARY KEY AUTOINCREMENT,
-            scan_date     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            area_name     TEXT NOT NULL,
-            latitude      REAL NOT NULL,
-            longitude     REAL NOT NULL,
-            radius_km     REAL DEFAULT 5.0,
-            image_path    TEXT,
-            issues_found  INTEGER DEFAULT 0,
-            new_reports   INTEGER DEFAULT 0,
-            confirmed     INTEGER DEFAULT 0,
-            status        TEXT DEFAULT 'processing'
-        );
-
-        CREATE TABLE IF NOT EXISTS satellite_issues (
-            id                 INTEGER PRIMARY KEY AUTOINCREMENT,
-            scan_id            INTEGER NOT NULL,
-            issue_type         TEXT NOT NULL,
-            confidence         REAL DEFAULT 0.0,
-            latitude           REAL,
-            longitude          REAL,
-            bbox_coords        TEXT,
-            image_crop_path    TEXT,
-            matched_report_id  INTEGER,
-            action_taken       TEXT DEFAULT 'pending',
-            created_at         TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (scan_id)           REFERENCES satellite_scans(id),
-            FOREIGN KEY (matched_report_id) REFERENCES reports(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS report_satellite_links (
-            id           INTEGER PRIMARY KEY AUTOINCREMENT,
-            report_id    INTEGER NOT NULL,
-            scan_id      INTEGER NOT NULL,
-            issue_id     INTEGER NOT NULL,
-            link_type    TEXT DEFAULT 'confirmed',
-            linked_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (report_id) REFERENCES reports(id),
-            FOREIGN KEY (scan_id)   REFERENCES satellite_scans(id)
-        );
-    """)
-
-    # Add satellite columns to existing reports table
-    for col, coltype in [("source", "TEXT DEFAULT 'citizen'"),
-                         ("satellite_confirmed", "INTEGER DEFAULT 0"),
-                         ("satellite_scan_id", "INTEGER")]:
-        try:
-            db.execute(f"ALTER TABLE reports ADD COLUMN {col} {coltype}")
-        except Exception:
-            pass
-
-    db.commit()
-    db.close()
-
-
-# ─────────────────────────────────────────────────────────────────────
-# HAVERSINE — Calculate distance between two GPS points
-# ─────────────────────────────────────────────────────────────────────
-def haversine_distance(lat1, lon1, lat2, lon2) -> float:
-    """Returns distance in meters between two GPS coordinates."""
-    R = 6371000  # Earth radius in meters
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi       = math.radians(lat2 - lat1)
-    dlambda    = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    """
+    Create satellite tables/columns if they don't exist. Kept for setup
+    scripts — the schema is owned by migrations.py and applied at startup.
+    """
+    run_migrations(get_db())
 
 
 # ─────────────────────────────────────────────────────────────────────
@@ -415,8 +348,21 @@ def find_matching_citizen_report(issue_lat: float, issue_lon: float,
 # ─────────────────────────────────────────────────────────────────────
 # AUTO REPORT CREATION
 # ─────────────────────────────────────────────────────────────────────
-def create_satellite_report(issue: dict, scan_id: int, db) -> str:
-    """Auto-create a new report from satellite detection."""
+SATELLITE_REPORT_SQL = """
+    INSERT INTO reports
+    (report_id, user_id, title, category, description,
+     location_address, latitude, longitude, image_path,
+     status, severity, label, source, satellite_scan_id)
+    VALUES (?,1,?,?,?,?,?,?,?,'Pending',?,'Satellite Detected','satellite',?)
+"""
+
+
+def build_satellite_report(issue: dict, scan_id: int) -> tuple:
+    """
+    Prepare the SATELLITE_REPORT_SQL parameters for a new report from a
+    satellite detection. Does the reverse-geocode lookup, so call it
+    before opening a write transaction.
+    """
     issue_type = issue['type']
     category   = ISSUE_CATEGORY_MAP.get(issue_type, "Other")
     severity   = ISSUE_SEVERITY_MAP.get(issue_type, "Medium")
@@ -463,52 +409,37 @@ def create_satellite_report(issue: dict, scan_id: int, db) -> str:
         address = f"Lat: {issue['latitude']}, Lng: {issue['longitude']}"
 
     # Admin user id = 1
-    db.execute("""
-        INSERT INTO reports
-        (report_id, user_id, title, category, description,
-         location_address, latitude, longitude, image_path,
-         status, severity, label, source, satellite_scan_id)
-        VALUES (?,1,?,?,?,?,?,?,?,'Pending',?,'Satellite Detected','satellite',?)
-    """, (report_id, title, category, description,
-          address, issue['latitude'], issue['longitude'],
-          image_path, severity, scan_id))
-    db.commit()
-
-    new_row = db.execute("SELECT id FROM reports WHERE report_id=?", (report_id,)).fetchone()
-    return report_id, new_row['id'] if new_row else None
+    return (report_id, title, category, description,
+            address, issue['latitude'], issue['longitude'],
+            image_path, severity, scan_id)
 
 
 # ─────────────────────────────────────────────────────────────────────
 # CONFIRM EXISTING CITIZEN REPORT WITH SATELLITE DATA
 # ─────────────────────────────────────────────────────────────────────
-def confirm_citizen_report(report: dict, issue: dict, scan_id: int, issue_db_id: int, db):
-    """
-    Mark an existing citizen report as satellite-confirmed.
-    Upgrades severity if satellite detects worse condition.
-    """
-    severity_rank = {"Low": 1, "Medium": 2, "High": 3, "Critical": 4}
-    sat_severity  = ISSUE_SEVERITY_MAP.get(issue['type'], "Medium")
-    cur_severity  = report['severity']
+CONFIRM_REPORT_SQL = """
+    UPDATE reports
+    SET satellite_confirmed = 1,
+        satellite_scan_id   = ?,
+        severity            = ?,
+        label               = 'Satellite Confirmed',
+        updated_at          = CURRENT_TIMESTAMP
+    WHERE id = ?
+"""
 
-    new_severity  = sat_severity if severity_rank.get(sat_severity, 0) > severity_rank.get(cur_severity, 0) else cur_severity
+LINK_REPORT_SQL = """
+    INSERT INTO report_satellite_links (report_id, scan_id, issue_id, link_type)
+    VALUES (?, ?, ?, 'confirmed')
+"""
 
-    db.execute("""
-        UPDATE reports
-        SET satellite_confirmed = 1,
-            satellite_scan_id   = ?,
-            severity            = ?,
-            label               = 'Satellite Confirmed',
-            updated_at          = CURRENT_TIMESTAMP
-        WHERE id = ?
-    """, (scan_id, new_severity, report['id']))
 
-    # Link satellite issue to citizen report
-    db.execute("""
-        INSERT INTO report_satellite_links (report_id, scan_id, issue_id, link_type)
-        VALUES (?, ?, ?, 'confirmed')
-    """, (report['id'], scan_id, issue_db_id))
+def upgraded_severity(report: dict, issue: dict) -> str:
+    """Satellite severity if it is worse than the report's current one."""
+    severity_rank = {"Low": 1, "Medium": 2, "High": 3, "Critical": 4}
+    sat_severity  = ISSUE_SEVERITY_MAP.get(issue['type'], "Medium")
+    cur_severity  = report['severity']
 
-    db.commit()
+    return sat_severity if severity_rank.get(sat_severity, 0) > severity_rank.get(cur_severity, 0) else cur_severity
 
 
 # ─────────────────────────────────────────────────────────────────────
@@ -519,21 +450,24 @@ def run_satellite_scan(area_name: str, latitude: float, longitude: float,
     """
     Full satellite scan pipeline for a given area.
     Returns summary of what was found and what actions were taken.
+
+    Image work and reverse geocoding happen before any write; every DB
+    change for the detected issues is then applied in one transaction,
+    so a scan costs a single commit however many issues it finds.
     """
-    ensure_satellite_tables()
-    db = get_db()
     if not(8<=latitude<=37 and 68<=longitude <=97.5):
         return{"error": "Coordinates are outside India. Use lat 8-37 and lon 68-97.5"}
+    db = get_db()
 
     print(f"\n🛰️  Starting satellite scan: {area_name} ({latitude}, {longitude})")
 
     # Create scan record
-    db.execute("""
+    cur = db.execute("""
         INSERT INTO satellite_scans (area_name, latitude, longitude, radius_km, status)
         VALUES (?, ?, ?, ?, 'processing')
     """, (area_name, latitude, longitude, radius_km))
     db.commit()
-    scan_id = db.execute("SELECT last_insert_rowid()").fetchone()[0]
+    scan_id = cur.lastrowid
 
     results = {
         "scan_id"       : scan_id,
@@ -557,42 +491,51 @@ def run_satellite_scan(area_name: str, latitude: float, longitude: float,
 
         results["total_detected"] = len(raw_issues)
 
-        # Step 3: Process each issue
+        # Step 3: Crop each issue and prepare reports for likely-new ones
+        # (network + disk work stays outside the write transaction)
+        issues = []
         for i, issue in enumerate(raw_issues):
             if issue['confidence'] < 0.5:
                 results["skipped"] += 1
                 continue
 
-            # Crop issue from satellite image
             crop_id   = f"{scan_id}_{i}"
-            crop_path = crop_issue_image(image_path, issue['bbox'], crop_id)
-            issue['crop_path'] = crop_path
+            issue['crop_path'] = crop_issue_image(image_path, issue['bbox'], crop_id)
+            if not find_matching_citizen_report(issue['latitude'], issue['longitude'], issue['type'], db):
+                issue['report_row'] = build_satellite_report(issue, scan_id)
+            issues.append(issue)
+        # registered up front, so crops of a scan that later fails stay at refcount 0
+        register_files([image_path] + [issue['crop_path'] for issue in issues], db)
+
+        # Step 4: Apply everything in one transaction
+        db.execute("BEGIN IMMEDIATE")
+        confirms = {}   # report db id → CONFIRM_REPORT_SQL params (last severity wins)
+        links    = []
+        for issue in issues:
+            # Check for duplicate citizen report — sees reports created earlier in this scan
+            match = find_matching_citizen_report(
+                issue['latitude'], issue['longitude'], issue['type'], db
+            )
+            action = "confirmed" if match else "new_report"
 
-            # Save satellite issue to DB
-            db.execute("""
+            cur = db.execute("""
                 INSERT INTO satellite_issues
                 (scan_id, issue_type, confidence, latitude, longitude,
-                 bbox_coords, image_crop_path, action_taken)
-                VALUES (?,?,?,?,?,?,?,'pending')
+                 bbox_coords, image_crop_path, matched_report_id, action_taken)
+                VALUES (?,?,?,?,?,?,?,?,?)
             """, (scan_id, issue['type'], issue['confidence'],
                   issue['latitude'], issue['longitude'],
-                  json.dumps(issue['bbox']), crop_path))
-            db.commit()
-            issue_db_id = db.execute("SELECT last_insert_rowid()").fetchone()[0]
-
-            # Step 4: Check for duplicate citizen report
-            match = find_matching_citizen_report(
-                issue['latitude'], issue['longitude'], issue['type'], db
-            )
+                  json.dumps(issue['bbox']), issue['crop_path'],
+                  match['id'] if match else None, action))
+            issue_db_id = cur.lastrowid
 
             if match:
                 # DUPLICATE — confirm existing citizen report
                 print(f"  ✅ Issue at ({issue['latitude']}, {issue['longitude']}) matches citizen report {match['report_id']}")
-                confirm_citizen_report(match, issue, scan_id, issue_db_id, db)
-
-                db.execute("UPDATE satellite_issues SET matched_report_id=?, action_taken='confirmed' WHERE id=?",
-                           (match['id'], issue_db_id))
-                db.commit()
+                if match['id'] in confirms:
+                    match['severity'] = confirms[match['id']][1]
+                confirms[match['id']] = (scan_id, upgraded_severity(match, issue), match['id'])
+                links.append((match['id'], scan_id, issue_db_id))
 
                 results["confirmed"] += 1
                 results["issues"].append({
@@ -606,20 +549,21 @@ def run_satellite_scan(area_name: str, latitude: float, longitude: float,
             else:
                 # NEW ISSUE — create satellite report
                 print(f"  🆕 New issue detected: {issue['type']} at ({issue['latitude']}, {issue['longitude']})")
-                new_report_id, new_db_id = create_satellite_report(issue, scan_id, db)
-
-                db.execute("UPDATE satellite_issues SET action_taken='new_report' WHERE id=?", (issue_db_id,))
-                db.commit()
+                row = issue.get('report_row') or build_satellite_report(issue, scan_id)
+                db.execute(SATELLITE_REPORT_SQL, row)
 
                 results["new_reports"] += 1
                 results["issues"].append({
                     "type"      : issue['type'],
                     "action"    : "new_report",
-                    "report_id" : new_report_id,
+                    "report_id" : row[0],
                     "lat"       : issue['latitude'],
                     "lon"       : issue['longitude'],
                 })
 
+        db.executemany(CONFIRM_REPORT_SQL, list(confirms.values()))
+        db.executemany(LINK_REPORT_SQL, links)
+
         # Update scan record
         db.execute("""
             UPDATE satellite_scans
@@ -636,12 +580,12 @@ def run_satellite_scan(area_name: str, latitude: float, longitude: float,
         print(f"  ✅ Confirmed      : {results['confirmed']}")
 
     except Exception as e:
+        db.rollback()
         db.execute("UPDATE satellite_scans SET status='failed' WHERE id=?", (scan_id,))
         db.commit()
         results["error"] = str(e)
         print(f"  ❌ Scan failed: {e}")
 
-    db.close()
     return results
 
 
@@ -676,18 +620,17 @@ def start_monthly_scheduler(areas: list):
 # ─────────────────────────────────────────────────────────────────────
 # STATS HELPER
 # ─────────────────────────────────────────────────────────────────────
-def get_satellite_stats() -> dict:
+def get_satellite_stats(db=None) -> dict:
     """Get summary stats for admin dashboard."""
-    ensure_satellite_tables()
-    db = get_db()
+    db = db or get_db()
 
     total_scans = db.execute("SELECT COUNT(*) FROM satellite_scans WHERE status='completed'").fetchone()[0]
-    total_auto  = db.execute("SELECT COUNT(*) FROM reports WHERE source='satellite'").fetchone()[0]
-    total_conf  = db.execute("SELECT COUNT(*) FROM reports WHERE satellite_confirmed=1").fetchone()[0]
+    counters    = get_report_counters(db)
+    total_auto  = counters["source"].get("satellite", 0)
+    total_conf  = counters["satellite_confirmed"].get("1", 0)
     last_scan   = db.execute("SELECT scan_date, area_name FROM satellite_scans ORDER BY scan_date DESC LIMIT 1").fetchone()
     next_scan   = (datetime.now().replace(day=1) + timedelta(days=32)).replace(day=1).strftime("%b %d, %Y")
 
-    db.close()
     return {
         "total_scans": total_scans,
         "auto_reports": total_auto,
@@ -5,10 +5,8 @@ Registers as a Blueprint — imported by app.py
 """
 
 from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash
-from satellite_engine import (
-    run_satellite_scan, get_satellite_stats,
-    ensure_satellite_tables, get_db
-)
+from satellite_engine import run_satellite_scan, get_satellite_stats
+from database import get_read_db
 import json
 
 sat_bp = Blueprint('satellite', __name__)
@@ -30,9 +28,8 @@ def admin_required_sat(f):
 @sat_bp.route('/admin/satellite')
 @admin_required_sat
 def satellite_dashboard():
-    ensure_satellite_tables()
-    db    = get_db()
-    stats = get_satellite_stats()
+    db    = get_read_db()
+    stats = get_satellite_stats(db)
 
     scans = db.execute("""
         SELECT * FROM satellite_scans
@@ -73,8 +70,6 @@ def satellite_dashboard():
         WHERE latitude IS NOT NULL AND longitude IS NOT NULL
     """).fetchall()
 
-    db.close()
-
     return render_template(
         'admin/satellite.html',
         stats       = stats,
@@ -120,14 +115,14 @@ def trigger_scan():
 @sat_bp.route('/api/satellite/stats')
 @admin_required_sat
 def satellite_stats_api():
-    stats = get_satellite_stats()
+    stats = get_satellite_stats(get_read_db())
     return jsonify(stats)
 
 
 @sat_bp.route('/api/satellite/scan/<int:scan_id>')
 @admin_required_sat
 def scan_detail_api(scan_id):
-    db     = get_db()
+    db     = get_read_db()
     scan   = db.execute("SELECT * FROM satellite_scans WHERE id=?", (scan_id,)).fetchone()
     issues = db.execute("""
         SELECT si.*, r.report_id, r.title as report_title
@@ -135,7 +130,6 @@ def scan_detail_api(scan_id):
         LEFT JOIN reports r ON si.matched_report_id = r.id
         WHERE si.scan_id = ?
     """, (scan_id,)).fetchall()
-    db.close()
 
     if not scan:
         return jsonify({'error': 'Scan not found'}), 404
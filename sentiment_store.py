@@ -0,0 +1,236 @@
+"""
+sentiment_store.py — Persisted per-report sentiment for CivicConnect
+====================================================================
+/ai/sentiment used to send the latest 20 open reports to the model on
+every admin page load. Scores now live in report_sentiment (migration
+015), one row per open report, together with the SHA-256 of exactly what
+the model was shown (title, description excerpt, severity, status):
+
+  • triggers on reports queue every open report that is inserted or
+    edited in sentiment_pending, so finding work — and the "pending"
+    count on each admin page — never scans the reports table; resolving
+    a report drops its queue entry and its stored score
+  • refresh_sentiment() scores only queued reports whose content hash
+    differs from the stored one, in batches of BATCH_SIZE per model call;
+    reports the model leaves out stay queued for the next run
+  • it runs in the background — as an ai_jobs job queued on an interval
+    by start_sentiment_scheduler() or on demand with /ai/sentiment?async=1
+    (at most one queued or running at a time), or from the CLI below
+  • list_sentiment() serves the table directly, sortable and keyset
+    paginated over all open reports
+
+The interval scheduler is started by app.py when SCHEDULE_SENTIMENT is set
+and it is run directly; under gunicorn use cron instead:
+    */15 * * * *  cd /path/to/civic_connect && python sentiment_store.py
+
+Usage:
+    python sentiment_store.py [--batch N]
+"""
+
+import sys
+import json
+import time
+import base64
+import hashlib
+from database import get_db
+from ai_features import score_sentiment
+from ai_jobs import enqueue_once, job_handler
+
+# ─────────────────────────────────────────────────────────────
+# CONFIG
+# ─────────────────────────────────────────────────────────────
+BATCH_SIZE    = 20          # reports per model call
+PAGE_SIZE     = 25
+MAX_PAGE_SIZE = 100
+
+# sort name → (columns, direction); every key ends in the unique report id
+SORT_KEYS = {
+    "priority": (("s.ai_priority", "s.sentiment_score", "r.id"), "DESC"),
+    "score"   : (("s.sentiment_score", "r.id"), "DESC"),
+    "newest"  : (("r.created_at", "r.id"), "DESC"),
+    "oldest"  : (("r.created_at", "r.id"), "ASC"),
+}
+
+
+def _prompt_item(row) -> dict:
+    """The per-report fields score_sentiment() sends to the model."""
+    return {"id": row["id"], "title": row["title"] or "",
+            "description": (row["description"] or "")[:150],
+            "severity": row["severity"] or "Medium", "status": row["status"] or "Pending"}
+
+
+def content_hash(row) -> str:
+    return hashlib.sha256(json.dumps(_prompt_item(row), sort_keys=True).encode()).hexdigest()
+
+
+# ─────────────────────────────────────────────────────────────
+# REFRESH — score new/changed open reports
+# ─────────────────────────────────────────────────────────────
+def stale_reports(db=None) -> list:
+    """
+    (report row, content hash, queue version) for queued reports whose stored
+    score is missing or outdated. Queued reports whose content is unchanged
+    (e.g. a status edit that was reverted) are dequeued on the way.
+    """
+    conn = db or get_db()
+    rows = conn.execute("""
+        SELECT r.id, r.title, r.description, r.severity, r.status, s.content_hash, p.version
+        FROM sentiment_pending p
+        JOIN reports r ON r.id = p.report_id
+        LEFT JOIN report_sentiment s ON s.report_id = r.id
+    """).fetchall()
+    stale, current = [], []
+    for row in rows:
+        digest = content_hash(row)
+        if digest != row["content_hash"]:
+            stale.append((row, digest, row["version"]))
+        else:
+            current.append((row["id"], row["version"]))
+    if current:
+        _dequeue(conn, current)
+        conn.commit()
+    return stale
+
+
+def _dequeue(conn, done: list):
+    """Drop (report id, version) queue rows — unless the report changed again since."""
+    conn.executemany("DELETE FROM sentiment_pending WHERE report_id = ? AND version = ?", done)
+
+
+def refresh_sentiment(db=None, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Score every stale open report and upsert the results, one model call
+    and one transaction per batch. Only ids present in the model output
+    are stored; the rest stay queued.
+
+    Returns:
+        {"stale": reports needing a score, "scored": rows written, "failed": reports left for next time}
+    """
+    conn  = db or get_db()
+    stale = stale_reports(conn)
+    stats = {"stale": len(stale), "scored": 0, "failed": 0}
+    for start in range(0, len(stale), batch_size):
+        batch = stale[start:start + batch_size]
+        try:
+            scores = score_sentiment([_prompt_item(row) for row, _, _ in batch])
+        except Exception as e:
+            print(f"⚠️  Sentiment batch failed: {e}")
+            scores = {}
+        scored = [(row, digest, version, scores[row["id"]])
+                  for row, digest, version in batch if row["id"] in scores]
+        now = time.time()
+        conn.executemany("""
+            INSERT INTO report_sentiment (report_id, content_hash, sentiment_score, sentiment_label,
+                sentiment_color, sentiment_emoji, ai_priority, ai_note, scored_at)
+            VALUES (?,?,?,?,?,?,?,?,?)
+            ON CONFLICT(report_id) DO UPDATE SET
+                content_hash = excluded.content_hash, sentiment_score = excluded.sentiment_score,
+                sentiment_label = excluded.sentiment_label, sentiment_color = excluded.sentiment_color,
+                sentiment_emoji = excluded.sentiment_emoji, ai_priority = excluded.ai_priority,
+                ai_note = excluded.ai_note, scored_at = excluded.scored_at
+        """, [(row["id"], digest, int(s["sentiment_score"]), s["sentiment_label"],
+               s["sentiment_color"], s["sentiment_emoji"], 1 if s["ai_priority"] else 0,
+               s["ai_note"], now) for row, digest, _, s in scored])
+        _dequeue(conn, [(row["id"], version) for row, _, version, _ in scored])
+        conn.commit()
+        stats["scored"] += len(scored)
+        stats["failed"] += len(batch) - len(scored)
+    if stats["stale"]:
+        print(f"✅ Sentiment: scored {stats['scored']}/{stats['stale']} new or changed report(s)")
+    return stats
+
+
+@job_handler("sentiment_refresh")
+def _refresh_job(payload):
+    return refresh_sentiment(batch_size=payload.get("batch_size", BATCH_SIZE))
+
+
+def request_refresh(db=None, user_id=None) -> str:
+    """Queue a background refresh unless one is already queued or running. Returns its job id."""
+    return enqueue_once("sentiment_refresh", {}, user_id, db)
+
+
+# ─────────────────────────────────────────────────────────────
+# READ — sortable, keyset paginated
+# ─────────────────────────────────────────────────────────────
+def _encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, n: int):
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        return None
+    return values if isinstance(values, list) and len(values) == n else None
+
+
+def list_sentiment(sort: str = "priority", cursor: str = None, limit: int = PAGE_SIZE, db=None) -> dict:
+    """
+    One page of scored open reports with their stored sentiment.
+
+    Returns:
+        {
+          "reports"    : [{id, report_id, title, description, status, severity, created_at,
+                           sentiment_score, sentiment_label, sentiment_color, sentiment_emoji,
+                           ai_priority, ai_note, scored_at}, ...],
+          "next_cursor": cursor for the following page (or None),
+          "sort"       : sort applied,
+          "pending"    : open reports queued for (re)scoring,
+        }
+    """
+    conn = db or get_db()
+    sort = sort if sort in SORT_KEYS else "priority"
+    cols, order = SORT_KEYS[sort]
+    limit  = max(1, min(limit, MAX_PAGE_SIZE))
+    where  = "r.status != 'Resolved'"     # a score written while its report was being resolved
+    params = []
+    after  = _decode_cursor(cursor, len(cols))
+    if after:
+        where += f" AND ({', '.join(cols)}) {'<' if order == 'DESC' else '>'} ({', '.join('?' * len(cols))})"
+        params.extend(after)
+
+    rows = conn.execute(f"""
+        SELECT r.id, r.report_id, r.title, r.description, r.status, r.severity, r.created_at,
+               s.sentiment_score, s.sentiment_label, s.sentiment_color, s.sentiment_emoji,
+               s.ai_priority, s.ai_note, s.scored_at
+        FROM report_sentiment s JOIN reports r ON r.id = s.report_id
+        WHERE {where}
+        ORDER BY {', '.join(f'{c} {order}' for c in cols)} LIMIT ?
+    """, params + [limit + 1]).fetchall()
+
+    reports = [dict(r, ai_priority=bool(r["ai_priority"])) for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = _encode_cursor([last[c.split(".")[1]] for c in cols])
+
+    return {"reports": reports, "next_cursor": next_cursor, "sort": sort,
+            "pending": conn.execute("SELECT COUNT(*) FROM sentiment_pending").fetchone()[0]}
+
+
+# ─────────────────────────────────────────────────────────────
+# SCHEDULER
+# ─────────────────────────────────────────────────────────────
+def start_sentiment_scheduler(minutes: int = 15):
+    """Queue a refresh of new/changed reports every `minutes` minutes."""
+    try:
+        from apscheduler.schedulers.background import BackgroundScheduler
+        scheduler = BackgroundScheduler()
+        scheduler.add_job(request_refresh, 'interval', minutes=minutes)
+        scheduler.start()
+        print(f"✅ Sentiment scorer scheduled — runs every {minutes} min")
+        return scheduler
+    except ImportError:
+        print("APScheduler not installed. Run: pip install APScheduler")
+        return None
+
+
+if __name__ == "__main__":
+    args  = sys.argv
+    batch = int(args[args.index("--batch") + 1]) if "--batch" in args else BATCH_SIZE
+    from migrations import run_migrations
+    run_migrations(get_db())
+    print(refresh_sentiment(batch_size=batch))
@@ -0,0 +1,56 @@
+"""
+Shared fixtures — a migrated SQLite database in a temp directory that every
+get_db() / get_read_db() call in the code under test opens instead of
+civic_connect.db.
+"""
+
+import pytest
+
+import database
+import hash_index
+from migrations import run_migrations
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Path of an empty database that database.connect()/connect_readonly() now open."""
+    path = str(tmp_path / "civic_connect.db")
+    connect, connect_readonly = database.connect, database.connect_readonly
+    monkeypatch.setattr(database, "DB_PATH", path)
+    monkeypatch.setattr(database, "_read_pool", None)
+    monkeypatch.setattr(database, "connect", lambda db_path=path: connect(db_path))
+    monkeypatch.setattr(database, "connect_readonly", lambda db_path=path: connect_readonly(db_path))
+    monkeypatch.setattr(database._local, "db", None, raising=False)
+    # The near-duplicate index is process-wide: start every test from an unbuilt one
+    monkeypatch.setattr(hash_index, "_tree", None)
+    monkeypatch.setattr(hash_index, "_matrix", None)
+    monkeypatch.setattr(hash_index, "_by_id", {})
+    monkeypatch.setattr(hash_index, "_seq", 0)
+    yield path
+    database.close_thread_db()
+    pool = database._read_pool
+    while pool is not None and not pool._idle.empty():
+        pool._idle.get_nowait().close()
+
+
+@pytest.fixture
+def db(db_path):
+    """This thread's connection to the migrated temp database, with two citizens and an admin."""
+    conn = database.get_db()
+    run_migrations(conn)
+    conn.executemany("INSERT INTO users (id, username, password, role, full_name) VALUES (?,?,?,?,?)",
+                     [(1, "admin", "x", "admin", "Admin"), (2, "citizen1", "x", "citizen", "John"),
+                      (3, "jane", "x", "citizen", "Jane")])
+    conn.commit()
+    return conn
+
+
+def insert_report(db, report_id: str, user_id: int = 2, commit: bool = True, **fields) -> int:
+    """Insert a report with sensible defaults for the NOT NULL columns. Returns its row id."""
+    row = dict({"report_id": report_id, "user_id": user_id, "title": f"Report {report_id}",
+                "category": "Roads", "description": "Test report"}, **fields)
+    cur = db.execute(f"INSERT INTO reports ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                     list(row.values()))
+    if commit:
+        db.commit()
+    return cur.lastrowid
@@ -0,0 +1,111 @@
+"""
+ai_cache.py — ResponseCache serves repeats from the LRU, then the ai_cache
+table, ignores entries past their TTL, keeps both tiers bounded, and never
+caches a failed classification.
+"""
+
+import pytest
+
+import ai_cache
+import ai_features
+from ai_cache import ResponseCache, normalize_text
+
+
+class _Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(ai_cache.time, "time", clock)
+    return clock
+
+
+def _rows(db) -> dict:
+    return {row["key"]: row["hits"] for row in db.execute("SELECT key, hits FROM ai_cache")}
+
+
+def test_normalize_folds_case_whitespace_and_punctuation():
+    assert normalize_text("Pothole  on MAIN St!!", None) == normalize_text("pothole on main st", "")
+    assert normalize_text("Pothole", "x") != normalize_text("Pothole x")
+
+
+def test_hit_from_lru_then_from_the_table(db, clock):
+    cache = ResponseCache("classify", "m1")
+    assert cache.get("Pothole", "Big hole", db=db) is None
+    cache.put({"category": "Roads"}, "Pothole", "Big hole", db=db)
+    assert cache.get("  POTHOLE ", "big hole!", db=db) == {"category": "Roads"}
+
+    fresh = ResponseCache("classify", "m1")                   # another worker: empty LRU, same table
+    assert fresh.get("Pothole", "Big hole", db=db) == {"category": "Roads"}
+    assert fresh.get("Pothole", "Big hole", db=db) == {"category": "Roads"}
+    assert ResponseCache("classify", "m2").get("Pothole", "Big hole", db=db) is None    # model is in the key
+
+    stats = fresh.stats(db)
+    assert (stats["db_hits"], stats["lru_hits"], stats["misses"], stats["rows"]) == (1, 1, 0, 1)
+    assert cache.stats(db)["hit_rate"] == 0.5
+
+
+def test_every_get_returns_a_fresh_object(db, clock):
+    cache = ResponseCache("classify", "m1")
+    cache.put({"keywords": ["a"]}, "t", db=db)
+    cache.get("t", db=db)["keywords"].append("b")
+    assert cache.get("t", db=db) == {"keywords": ["a"]}
+
+
+def test_entries_expire_after_the_ttl(db, clock):
+    cache = ResponseCache("classify", "m1", ttl=60)
+    cache.put("v", "t", db=db)
+    clock.now += 59
+    assert cache.get("t", db=db) == "v"
+    clock.now += 2
+    assert cache.get("t", db=db) is None
+    assert ResponseCache("classify", "m1", ttl=60).get("t", db=db) is None
+    assert cache.evict(db) == 1 and _rows(db) == {}
+
+
+def test_lru_keeps_only_the_most_recent_entries(db, clock, monkeypatch):
+    cache = ResponseCache("classify", "m1", lru_size=2)
+    for text in ("a", "b", "c"):
+        cache.put(text, text, db=db)
+    cache.get("b", db=db)
+    assert list(cache._lru) == [cache.key("c"), cache.key("b")]
+
+    monkeypatch.setattr(cache, "_remember", lambda *a: None)   # "a" must now come from the table
+    assert cache.get("a", db=db) == "a"
+    assert cache.stats(db)["db_hits"] == 1
+
+
+def test_hits_are_written_with_the_next_store_and_drive_eviction(db, clock):
+    cache = ResponseCache("classify", "m1", max_rows=2)
+    for text in ("a", "b", "c"):
+        clock.now += 1
+        cache.put(text, text, db=db)
+    clock.now += 1
+    cache.get("a", db=db)
+    assert set(_rows(db).values()) == {0}                    # a hit never writes
+
+    assert cache.evict(db) == 1                              # "b" was hit least recently
+    assert _rows(db) == {cache.key("a"): 1, cache.key("c"): 0}
+
+
+def test_failed_classification_is_not_cached(db, monkeypatch):
+    class _Messages:
+        calls = 0
+
+        def create(self, **kwargs):
+            self.calls += 1
+            raise RuntimeError("overloaded")
+
+    messages = _Messages()
+    monkeypatch.setattr(ai_features, "client", type("Client", (), {"messages": messages})())
+    monkeypatch.setattr(ai_features, "classify_cache", ResponseCache("classify", "test"))
+    for _ in range(2):
+        result = ai_features.classify_report("Pothole", "Big hole")
+        assert result["reason"] == "AI unavailable" and result["error"] == "overloaded"
+    assert messages.calls == 2 and _rows(db) == {}
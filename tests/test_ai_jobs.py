@@ -0,0 +1,184 @@
+"""
+ai_jobs.py — jobs are claimed once, oldest first; a failure is retried after
+a growing backoff and failed for good after MAX_ATTEMPTS; a lapsed lease is
+re-queued (or failed once out of attempts); enqueue_once never queues a
+second job of a kind. No worker threads are started: tests claim and run.
+"""
+
+import json
+
+import pytest
+
+import ai_features
+import ai_jobs
+from ai_jobs import _claim, enqueue, enqueue_once, get_job, requeue_stale, retry_delay, run_job
+from conftest import insert_report
+from hash_index import hash_to_db_int
+
+
+class _Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(ai_jobs.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def jobs(db, clock, monkeypatch):
+    """Test handlers 'echo' and 'boom'; enqueueing wakes nobody."""
+    calls = []
+    monkeypatch.setattr(ai_jobs, "_notify", lambda: calls.append("notify"))
+    monkeypatch.setitem(ai_jobs.JOB_HANDLERS, "echo", lambda p: {"echo": p})
+    monkeypatch.setitem(ai_jobs.JOB_HANDLERS, "boom", lambda p: 1 / 0)
+    return calls
+
+
+def _status(db, job_id) -> tuple:
+    row = db.execute("SELECT status, attempts FROM ai_jobs WHERE id = ?", (job_id,)).fetchone()
+    return row["status"], row["attempts"]
+
+
+# ─────────────────────────────────────────────────────────────
+# SUBMIT / CLAIM / RUN
+# ─────────────────────────────────────────────────────────────
+def test_unknown_kind_is_refused(db, jobs):
+    with pytest.raises(ValueError):
+        enqueue("nope", {}, db=db)
+    with pytest.raises(ValueError):
+        enqueue_once("nope", {}, db=db)
+
+
+def test_jobs_are_claimed_once_oldest_first(db, jobs, clock):
+    first = enqueue("echo", {"n": 1}, user_id=2, db=db)
+    clock.now += 1
+    second = enqueue("echo", {"n": 2}, db=db)
+    assert jobs == ["notify", "notify"]
+
+    a, b = _claim(db), _claim(db)
+    assert (a["id"], a["attempts"], b["id"]) == (first, 1, second)
+    assert _claim(db) is None
+    row = db.execute("SELECT status, started_at, heartbeat_at FROM ai_jobs WHERE id = ?", (first,)).fetchone()
+    assert tuple(row) == ("running", clock.now, clock.now)
+
+    assert run_job(db, a) is True
+    job = get_job(first, db)
+    assert (job["status"], job["result"], job["user_id"], job["error"]) == ("done", {"echo": {"n": 1}}, 2, None)
+    assert get_job("missing", db) is None
+
+
+def test_failures_back_off_then_fail_after_max_attempts(db, jobs, clock):
+    job_id = enqueue("boom", {}, db=db)
+    for attempt in range(1, ai_jobs.MAX_ATTEMPTS):
+        job = _claim(db)
+        assert run_job(db, job) is False
+        assert _status(db, job_id) == ("queued", attempt)
+        clock.now += retry_delay(attempt) - 1
+        assert _claim(db) is None                             # still backing off
+        clock.now += 1
+
+    assert run_job(db, _claim(db)) is False
+    job = get_job(job_id, db)
+    assert (job["status"], job["attempts"]) == ("failed", ai_jobs.MAX_ATTEMPTS)
+    assert "division by zero" in job["error"]
+    assert [retry_delay(n) for n in (1, 2, 3, 20)] == [5, 10, 20, ai_jobs.RETRY_MAX_SECONDS]
+
+
+# ─────────────────────────────────────────────────────────────
+# LEASES
+# ─────────────────────────────────────────────────────────────
+def test_lapsed_lease_is_requeued_until_out_of_attempts(db, jobs, clock):
+    live, lost, spent = (enqueue("echo", {}, db=db) for _ in range(3))
+    for _ in range(3):
+        _claim(db)
+    db.execute("UPDATE ai_jobs SET attempts = ? WHERE id = ?", (ai_jobs.MAX_ATTEMPTS, spent))
+    clock.now += ai_jobs.STALE_SECONDS + 1
+    db.execute("UPDATE ai_jobs SET heartbeat_at = ? WHERE id = ?", (clock.now, live))   # still beating
+    db.commit()
+
+    assert requeue_stale(db) == 2
+    assert _status(db, live) == ("running", 1)
+    assert _status(db, lost) == ("queued", 1)
+    job = get_job(spent, db)
+    assert (job["status"], job["error"], job["finished_at"]) == ("failed", "worker lost (lease expired)", clock.now)
+
+
+def test_old_finished_jobs_are_pruned(db, jobs, clock):
+    job_id = enqueue("echo", {}, db=db)
+    run_job(db, _claim(db))
+    clock.now += ai_jobs.RETAIN_HOURS * 3600 + 1
+    requeue_stale(db)
+    assert get_job(job_id, db) is None
+
+
+# ─────────────────────────────────────────────────────────────
+# ENQUEUE ONCE
+# ─────────────────────────────────────────────────────────────
+def test_enqueue_once_returns_the_pending_job(db, jobs, clock):
+    job_id = enqueue_once("echo", {"n": 1}, db=db)
+    assert enqueue_once("echo", {"n": 2}, db=db) == job_id
+    assert enqueue_once("boom", {}, db=db) != job_id          # per kind
+    _claim(db)
+    assert enqueue_once("echo", {}, db=db) == job_id          # running counts too
+    run_job(db, {"id": job_id, "kind": "echo", "payload": "{}", "attempts": 1})
+    assert enqueue_once("echo", {}, db=db) != job_id
+    assert jobs == ["notify"] * 3
+
+
+def test_enqueue_once_is_not_blocked_by_a_dead_workers_job(db, jobs, clock):
+    job_id = enqueue_once("echo", {}, db=db)
+    _claim(db)
+    db.execute("UPDATE ai_jobs SET attempts = ? WHERE id = ?", (ai_jobs.MAX_ATTEMPTS, job_id))
+    db.commit()
+    clock.now += ai_jobs.STALE_SECONDS + 1
+    assert enqueue_once("echo", {}, db=db) != job_id
+    assert _status(db, job_id)[0] == "failed"
+
+
+# ─────────────────────────────────────────────────────────────
+# HANDLERS
+# ─────────────────────────────────────────────────────────────
+def test_classify_job_raises_so_the_queue_retries(db, jobs, monkeypatch):
+    import ai_routes  # noqa: F401 — registers the 'classify' handler
+    from ai_cache import ResponseCache
+
+    class _Messages:
+        def create(self, **kwargs):
+            raise RuntimeError("overloaded")
+
+    monkeypatch.setattr(ai_features, "client", type("Client", (), {"messages": _Messages()})())
+    monkeypatch.setattr(ai_features, "classify_cache", ResponseCache("classify", "test"))
+    job_id = enqueue("classify", {"title": "Pothole", "description": "Big hole"}, db=db)
+    assert run_job(db, _claim(db)) is False
+    job = get_job(job_id, db)
+    assert (job["status"], job["error"]) == ("queued", "overloaded")
+
+
+def test_duplicate_clusters_runs_as_one_queued_job(db, jobs):
+    from app import app
+    for i, h in enumerate(("ffff0000ffff0000", "ffff0000ffff0001", "0000ffff0000ffff")):
+        insert_report(db, f"R-{i}", image_hash=h, image_hash_int=hash_to_db_int(h),
+                      created_at=f"2025-01-0{i + 1} 00:00:00")
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(user_id=1, role="admin")
+
+    resp = client.post("/api/admin/images/duplicate-clusters?threshold=50")
+    assert resp.status_code == 202
+    job_id = resp.get_json()["job_id"]
+    assert client.post("/api/admin/images/duplicate-clusters?threshold=1").get_json()["job_id"] == job_id
+    job = _claim(db)
+    assert json.loads(job["payload"]) == {"threshold": app.config["IMAGE_DUP_THRESHOLD"]}    # clamped
+
+    assert run_job(db, job) is True
+    result = client.get(resp.get_json()["poll_url"]).get_json()
+    assert result["status"] == "done"
+    assert result["result"]["count"] == 1
+    assert [r["report_id"] for r in result["result"]["clusters"][0]] == ["R-0", "R-1"]
@@ -0,0 +1,96 @@
+"""
+classify_backfill.py — run_backfill against the local batch mock server:
+default-labelled reports are submitted once, results only overwrite fields
+still at their default, errored requests are retried until MAX_ATTEMPTS,
+and the scheduler and admin route can never queue two steps at once.
+"""
+
+import anthropic
+import pytest
+
+import ai_jobs
+import classify_backfill
+from batch_mock_server import MOCK_ERROR_WORD, start_mock_server
+from classify_backfill import request_backfill, run_backfill, select_reports
+from conftest import insert_report
+
+
+@pytest.fixture(scope="module")
+def api():
+    server, base_url = start_mock_server()
+    yield anthropic.Anthropic(api_key="mock", base_url=base_url)
+    server.shutdown()
+
+
+def _labels(db, rid: int) -> tuple:
+    row = db.execute("SELECT category, severity FROM reports WHERE id = ?", (rid,)).fetchone()
+    return row["category"], row["severity"]
+
+
+def _classification(db, rid: int) -> tuple:
+    row = db.execute("SELECT status, attempts FROM report_classifications WHERE report_id = ?", (rid,)).fetchone()
+    return tuple(row) if row else None
+
+
+def test_backfill_applies_results_but_keeps_manual_edits(db, api):
+    pothole = insert_report(db, "R-1", title="Large pothole", description="Road damage", category="Other",
+                            severity="Medium")
+    pipe    = insert_report(db, "R-2", title="Burst pipe", description="Water everywhere", category="Other",
+                            severity="Medium")
+    edited  = insert_report(db, "R-3", title="Broken lamp", description="Street light out", category="Other",
+                            severity="Medium")
+    done    = insert_report(db, "R-4", title="Pothole", description="Road", category="Roads", severity="High")
+    assert [r["id"] for r in select_reports(db)] == [pothole, pipe, edited]
+
+    step = run_backfill(db, api)                              # submit only: the batch is still in progress
+    assert step["submitted"] and step["in_flight"] == [step["submitted"]]
+    assert select_reports(db) == []
+    db.execute("UPDATE reports SET category = 'Public Safety' WHERE id = ?", (edited,))
+    db.commit()
+
+    stats = run_backfill(db, api, wait=True, poll_seconds=0)
+    assert (stats["submitted"], stats["applied"], stats["errored"]) == (None, 3, 0)
+    assert _labels(db, pothole) == ("Roads", "High")
+    assert _labels(db, pipe) == ("Utilities", "Critical")
+    assert _labels(db, edited) == ("Public Safety", "High")   # the admin's category wins
+    assert _labels(db, done) == ("Roads", "High") and _classification(db, done) is None
+    assert db.execute("SELECT status FROM classify_batches").fetchone()[0] == "applied"
+    assert run_backfill(db, api)["submitted"] is None
+
+
+def test_errored_requests_are_retried_until_max_attempts(db, api):
+    bad  = insert_report(db, "R-1", title="Odd", description=MOCK_ERROR_WORD, category="Other")
+    good = insert_report(db, "R-2", title="Trash", description="Garbage pile", category="Other")
+
+    stats = run_backfill(db, api, wait=True, poll_seconds=0)
+    assert (stats["applied"], stats["errored"]) == (1, 1)
+    assert _classification(db, good) == ("applied", 1)
+    assert _classification(db, bad) == ("errored", 1)
+    error = db.execute("SELECT error FROM report_classifications WHERE report_id = ?", (bad,)).fetchone()[0]
+    assert error == "errored"
+
+    for attempt in range(2, classify_backfill.MAX_ATTEMPTS + 1):
+        stats = run_backfill(db, api, wait=True, poll_seconds=0)
+        assert (stats["applied"], stats["errored"]) == (0, 1)
+        assert _classification(db, bad) == ("errored", attempt)
+    assert select_reports(db) == []
+    assert run_backfill(db, api)["submitted"] is None
+    assert _labels(db, bad) == ("Other", "Medium")
+
+
+def test_request_backfill_never_queues_a_second_step(db, monkeypatch):
+    monkeypatch.setattr(ai_jobs, "_notify", lambda: None)
+    job_id = request_backfill(db, user_id=1, limit=50)
+    assert request_backfill(db) == job_id
+    assert ai_jobs.get_job(job_id, db)["status"] == "queued"
+    assert db.execute("SELECT payload FROM ai_jobs").fetchall()[0][0] == '{"limit": 50}'
+
+
+def test_backfill_scheduler_is_opt_in(monkeypatch):
+    import app as app_module
+    started = []
+    for name in ("start_gc_scheduler", "start_sentiment_scheduler", "start_backfill_scheduler"):
+        monkeypatch.setattr(app_module, name, lambda name=name: started.append(name) or name)
+    assert app_module.app.config["SCHEDULE_CLASSIFY_BACKFILL"] is False
+    app_module.start_schedulers()
+    assert "start_backfill_scheduler" not in started
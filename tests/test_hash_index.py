@@ -0,0 +1,193 @@
+"""
+hash_index.py — the BK-tree and the NumPy hash matrix return exactly what
+a brute-force Hamming scan would, and the process-wide index follows
+inserts, edits and deletes committed through any connection.
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+import database
+import hash_index
+from conftest import insert_report
+from hash_index import (BKTree, HashMatrix, hamming, hash_to_db_int, hash_to_int, find_similar,
+                        nearest_reports, duplicate_clusters, duplicate_cluster_reports)
+
+
+def _hashes(n: int, seed: int = 7) -> list:
+    """n random 64-bit hashes plus a few near copies of the first ones, so searches find something."""
+    rng    = random.Random(seed)
+    hashes = [rng.getrandbits(64) for _ in range(n)]
+    for i in range(n // 10):
+        flips = rng.sample(range(64), rng.randint(0, 4))
+        hashes.append(hashes[i] ^ sum(1 << b for b in flips))
+    return hashes
+
+
+def _brute(hashes: list, h: int, radius: int) -> list:
+    return sorted((hamming(h, x), rid) for rid, x in enumerate(hashes, start=1) if hamming(h, x) <= radius)
+
+
+def _store(db, report_id: str, image_hash: str, **fields) -> int:
+    return insert_report(db, report_id, image_hash=image_hash, image_hash_int=hash_to_db_int(image_hash),
+                         **fields)
+
+
+# ─────────────────────────────────────────────────────────────
+# BK-TREE
+# ─────────────────────────────────────────────────────────────
+@pytest.mark.parametrize("radius", [0, 3, 6, 12])
+def test_bktree_search_matches_brute_force(radius):
+    hashes = _hashes(400)
+    tree   = BKTree()
+    for rid, h in enumerate(hashes, start=1):
+        tree.add(h, rid)
+    assert tree.size == len(hashes)
+    for h in hashes[:20] + [hashes[0] ^ 0b111, random.Random(1).getrandbits(64)]:
+        assert tree.search(h, radius) == _brute(hashes, h, radius)
+
+
+def test_bktree_identical_hashes_share_a_node_and_remove_one_id():
+    tree = BKTree()
+    tree.add(0xF0F0, 1)
+    tree.add(0xF0F0, 2)
+    tree.add(0xF0F1, 3)
+    assert tree.search(0xF0F0, 0) == [(0, 1), (0, 2)]
+    tree.remove(0xF0F0, 1)
+    tree.remove(0xF0F0, 99)                   # unknown id: no-op
+    assert tree.size == 2
+    assert tree.search(0xF0F0, 1) == [(0, 2), (1, 3)]
+
+
+def test_empty_tree_finds_nothing():
+    assert BKTree().search(123, 64) == []
+
+
+# ─────────────────────────────────────────────────────────────
+# PROCESS-WIDE INDEX
+# ─────────────────────────────────────────────────────────────
+def test_find_similar_ranks_stored_reports_by_distance(db):
+    a = _store(db, "R-1", "ffff0000ffff0000")
+    b = _store(db, "R-2", "ffff0000ffff0003")
+    _store(db, "R-3", "0000ffff0000ffff")
+    assert find_similar("ffff0000ffff0001", threshold=6, db=db) == [(1, a), (1, b)]
+    assert find_similar("ffff0000ffff0000", threshold=0, db=db) == [(0, a)]
+    assert find_similar("not-a-hash", db=db) == []
+
+
+def test_index_follows_writes_from_other_connections(db, db_path):
+    a = _store(db, "R-1", "ffff0000ffff0000")
+    assert find_similar("ffff0000ffff0000", 0, db) == [(0, a)]
+
+    other = database.connect(db_path)         # another worker / backfill_hashes.py
+    b = _store(other, "R-2", "ffff0000ffff0001")
+    other.execute("UPDATE reports SET image_hash = '00000000000000ff', image_hash_int = 255 WHERE id = ?", (a,))
+    other.commit()
+    assert find_similar("ffff0000ffff0000", 2, db) == [(1, b)]
+    assert find_similar("00000000000000ff", 0, db) == [(0, a)]
+
+    other.execute("DELETE FROM reports WHERE id = ?", (b,))
+    other.commit()
+    assert find_similar("ffff0000ffff0000", 2, db) == []
+    other.close()
+
+
+def test_uncommitted_and_rolled_back_inserts_never_reach_the_index(db, db_path):
+    _store(db, "R-1", "ffff0000ffff0000")
+    assert len(find_similar("ffff0000ffff0000", 0, db)) == 1
+
+    other = database.connect(db_path)
+    _store(other, "R-2", "ffff0000ffff0000", commit=False)
+    assert len(find_similar("ffff0000ffff0000", 0, db)) == 1      # not committed yet
+    other.rollback()
+    _store(other, "R-3", "0f0f0f0f0f0f0f0f")                      # reuses the rolled-back log seq
+    assert [rid for _, rid in find_similar("ffff0000ffff0000", 0, db)] == [1]
+    assert len(find_similar("0f0f0f0f0f0f0f0f", 0, db)) == 1
+    other.close()
+
+
+def test_lookup_inside_own_write_transaction_does_not_skip_its_changes(db):
+    _store(db, "R-1", "ffff0000ffff0000")
+    find_similar("ffff0000ffff0000", 0, db)
+    rid = _store(db, "R-2", "ffff0000ffff0000", commit=False)
+    find_similar("ffff0000ffff0000", 0, db)                       # pending write: log not applied yet
+    db.commit()
+    assert (0, rid) in find_similar("ffff0000ffff0000", 0, db)
+
+
+# ─────────────────────────────────────────────────────────────
+# 64-BIT INTEGERS + NUMPY MATRIX
+# ─────────────────────────────────────────────────────────────
+@pytest.mark.parametrize("hex_hash", ["0000000000000000", "7fffffffffffffff", "8000000000000000",
+                                      "ffffffffffffffff", "c3a5e1f00f1e5a3c"])
+def test_db_int_is_signed_64_bit_and_round_trips(hex_hash):
+    value = hash_to_db_int(hex_hash)
+    assert -(1 << 63) <= value < (1 << 63)
+    assert value & ((1 << 64) - 1) == hash_to_int(hex_hash)
+    assert int(np.array([value], dtype=np.int64).view(np.uint64)[0]) == hash_to_int(hex_hash)
+
+
+def test_matrix_distances_and_top_k_match_brute_force():
+    hashes = _hashes(3000)                    # past the initial 1024 slots, so add() has grown it
+    matrix = HashMatrix()
+    for rid, h in enumerate(hashes, start=1):
+        matrix.add(h, rid)
+    assert matrix.size == len(hashes)
+    for h in hashes[:10]:
+        expected = sorted((hamming(h, x), rid) for rid, x in enumerate(hashes, start=1))
+        assert matrix.distances(h).tolist() == [hamming(h, x) for x in hashes]
+        top = matrix.top_k(h, 5)
+        assert top == sorted(top) and set(top) <= set(expected)      # ties at the cut may pick either id
+        assert [d for d, _ in top] == [d for d, _ in expected[:5]]
+        assert matrix.top_k(h, 5, max_distance=4) == [p for p in top if p[0] <= 4]
+
+
+def test_matrix_remove_keeps_other_rows():
+    matrix = HashMatrix([1, 2, 3, 2], [10, 20, 30, 20])
+    matrix.remove(20)
+    assert sorted(zip(matrix.ids.tolist(), matrix.hashes.tolist())) == [(10, 1), (30, 3)]
+    assert matrix.top_k(3, 1) == [(0, 30)]
+
+
+def test_clusters_are_single_linkage_groups():
+    base = 0xAAAA_AAAA_AAAA_AAAA
+    chain = [base, base ^ 0b111, base ^ 0b111111]            # 3 bits apart step by step
+    other = 0x0F0F_0F0F_0F0F_0F0F
+    matrix = HashMatrix(chain + [other, other ^ 1, 0xFFFF_0000_FFFF_0000], [1, 2, 3, 4, 5, 6])
+    assert matrix.clusters(3) == [[1, 2, 3], [4, 5]]
+    assert matrix.clusters(2) == [[4, 5]]
+    assert matrix.clusters(3, chunk_cells=7) == matrix.clusters(3)   # row blocks of one
+
+
+def test_clusters_match_brute_force_pairs():
+    hashes = _hashes(500, seed=3)
+    groups = HashMatrix(hashes, list(range(1, len(hashes) + 1))).clusters(4, chunk_cells=5000)
+    member = {rid: i for i, g in enumerate(groups) for rid in g}
+    for i, a in enumerate(hashes, start=1):
+        for j, b in enumerate(hashes[i:], start=i + 1):
+            if hamming(a, b) <= 4:
+                assert member.get(i) is not None and member.get(i) == member.get(j)
+
+
+def test_nearest_reports_and_clusters_through_the_index(db):
+    a = _store(db, "R-1", "ffff0000ffff0000", created_at="2025-01-02 00:00:00")
+    b = _store(db, "R-2", "ffff0000ffff0001", created_at="2025-01-01 00:00:00")
+    c = _store(db, "R-3", "0000ffff0000ffff")
+    assert nearest_reports("ffff0000ffff0000", k=2, db=db) == [(0, a), (1, b)]
+    assert duplicate_clusters(2, db) == [[a, b]]
+    assert [r["report_id"] for r in duplicate_cluster_reports(2, db)[0]] == ["R-2", "R-1"]
+    assert duplicate_clusters(64, db) == [[a, b, c]]
+
+
+def test_cluster_reports_fetches_every_member_in_one_query(db):
+    for i in range(6):
+        _store(db, f"R-{i}", f"{0xffff0000ffff0000 ^ (i % 2):016x}" if i < 4 else f"{0x0f0f0f0f0f0f0f0f ^ i:016x}")
+    hash_index.rebuild_hash_index(db)
+    statements = []
+    db.set_trace_callback(statements.append)
+    clusters = duplicate_cluster_reports(3, db)
+    db.set_trace_callback(None)
+    assert sorted(len(c) for c in clusters) == [2, 4]
+    assert sum("FROM reports" in sql for sql in statements) == 1
@@ -0,0 +1,152 @@
+"""
+image_hash_util.py — process_uploaded_image hashes the upload once from its
+stream, refuses copies of stored photos without writing anything, and only
+compares looser matches against nearby, recent reports.
+"""
+
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+import image_hash_util
+from conftest import insert_report
+from hash_index import hash_to_db_int, hash_to_int
+from image_hash_util import get_image_hashes, process_uploaded_image
+
+LAT, LON = 12.9716, 77.5946
+
+
+def _jpeg(seed: int = 1, size: int = 256) -> bytes:
+    """A blocky colour photo whose hashes differ from every other seed's."""
+    blocks = np.random.default_rng(seed).integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(blocks).resize((size, size), Image.BILINEAR).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def _upload(data: bytes, filename: str = "photo.jpg") -> FileStorage:
+    return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def _flip(hex_hash: str, bits: int) -> str:
+    """The hash with its lowest `bits` bits inverted."""
+    return f"{hash_to_int(hex_hash) ^ ((1 << bits) - 1):016x}"
+
+
+def _store(db, report_id: str, hashes: dict, **fields) -> int:
+    return insert_report(db, report_id, image_hash=hashes["phash"], image_dhash=hashes.get("dhash"),
+                         image_whash=hashes.get("whash"), image_hash_int=hash_to_db_int(hashes["phash"]),
+                         **fields)
+
+
+def _near(hashes: dict, bits: int = 4) -> dict:
+    """Past the exact-copy cut-off on every hash, but inside the ensemble thresholds."""
+    return {kind: _flip(h, bits) for kind, h in hashes.items()}
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    """The upload folder; accepted files land under its parent (the static dir)."""
+    return str(tmp_path / "static" / "uploads")
+
+
+def _files(uploads: str) -> list:
+    static = os.path.dirname(uploads)
+    return [os.path.join(d, f) for d, _, names in os.walk(static) for f in names]
+
+
+# ─────────────────────────────────────────────────────────────
+# ACCEPT / REJECT
+# ─────────────────────────────────────────────────────────────
+def test_new_photo_is_hashed_once_and_saved(db, uploads, monkeypatch):
+    opened = []
+    open_for_hashing = image_hash_util.open_for_hashing
+    monkeypatch.setattr(image_hash_util, "open_for_hashing", lambda img: opened.append(1) or open_for_hashing(img))
+
+    data   = _jpeg(1)
+    result = process_uploaded_image(_upload(data), uploads, db, LAT, LON)
+    assert len(opened) == 1
+    assert result["is_duplicate"] is False and result["error"] is None
+    assert result["hashes"] == get_image_hashes(io.BytesIO(data))
+    assert result["image_hash"] == result["hashes"]["phash"]
+    with open(os.path.join(os.path.dirname(uploads), result["saved_path"]), "rb") as f:
+        assert f.read() == data
+
+
+def test_duplicate_is_refused_without_writing_a_file(db, uploads):
+    data = _jpeg(1)
+    _store(db, "R-1", get_image_hashes(io.BytesIO(data)), title="Pothole on MG Road")
+    result = process_uploaded_image(_upload(data), uploads, db)
+    assert result["is_duplicate"] is True
+    assert (result["report_id"], result["title"], result["distance"]) == ("R-1", "Pothole on MG Road", 0)
+    assert result["saved_path"] is None
+    assert _files(uploads) == []
+
+
+def test_different_photo_is_accepted_next_to_a_stored_one(db, uploads):
+    _store(db, "R-1", get_image_hashes(io.BytesIO(_jpeg(1))), latitude=LAT, longitude=LON)
+    result = process_uploaded_image(_upload(_jpeg(2)), uploads, db, LAT, LON)
+    assert result["is_duplicate"] is False
+    assert len(_files(uploads)) == 1
+
+
+# ─────────────────────────────────────────────────────────────
+# EXACT COPIES ANYWHERE, LOOSER MATCHES NEARBY
+# ─────────────────────────────────────────────────────────────
+def test_exact_copy_is_refused_however_far_away_it_was_reported(db, uploads):
+    data   = _jpeg(1)
+    hashes = get_image_hashes(io.BytesIO(data))
+    _store(db, "FAR-1", dict(hashes, phash=_flip(hashes["phash"], 1)), latitude=LAT + 1, longitude=LON)
+    result = process_uploaded_image(_upload(data), uploads, db, LAT, LON)
+    assert (result["is_duplicate"], result["report_id"], result["distance"]) == (True, "FAR-1", 1)
+
+
+def test_near_copy_is_refused_only_within_radius_and_window(db, uploads):
+    data = _jpeg(1)
+    near = _near(get_image_hashes(io.BytesIO(data)))
+    _store(db, "FAR-1", near, latitude=LAT + 0.01, longitude=LON)                  # ~1.1 km north
+    _store(db, "OLD-1", near, latitude=LAT, longitude=LON, created_at="2020-01-01 00:00:00")
+    assert process_uploaded_image(_upload(data), uploads, db, LAT, LON)["is_duplicate"] is False
+
+    _store(db, "NEAR-1", near, latitude=LAT + 0.0005, longitude=LON)               # ~55 m north
+    result = process_uploaded_image(_upload(data), uploads, db, LAT, LON)
+    assert (result["is_duplicate"], result["report_id"], result["distance"]) == (True, "NEAR-1", 4)
+
+
+def test_radius_and_window_come_from_app_config(db, uploads):
+    from flask import Flask
+    data = _jpeg(1)
+    _store(db, "R-1", _near(get_image_hashes(io.BytesIO(data))), latitude=LAT + 0.01, longitude=LON)
+    app = Flask(__name__)
+    app.config.update(IMAGE_DUP_RADIUS_M=2000, IMAGE_DUP_DAYS=1)
+    with app.app_context():
+        assert process_uploaded_image(_upload(data), uploads, db, LAT, LON)["is_duplicate"] is True
+
+
+def test_without_coordinates_the_global_index_needs_the_ensemble_to_agree(db, uploads):
+    data   = _jpeg(1)
+    hashes = get_image_hashes(io.BytesIO(data))
+    _store(db, "R-1", dict(_near(hashes), dhash=_flip(hashes["dhash"], 30), whash=_flip(hashes["whash"], 30)))
+    assert process_uploaded_image(_upload(data), uploads, db, "", None)["is_duplicate"] is False
+
+    _store(db, "R-2", _near(hashes))
+    assert process_uploaded_image(_upload(data), uploads, db)["report_id"] == "R-2"
+
+
+@pytest.mark.parametrize("stored, expected", [
+    ({"phash": 4, "dhash": 4, "whash": 4}, True),
+    ({"phash": 4, "dhash": 30, "whash": 4}, True),        # two of three votes
+    ({"phash": 4, "dhash": 30, "whash": 30}, False),
+    ({"phash": 6}, True),                                 # pHash-only legacy row: dup_threshold() alone
+    ({"phash": 7}, False),
+])
+def test_ensemble_votes(stored, expected):
+    hashes = get_image_hashes(io.BytesIO(_jpeg(1)))
+    row    = {col: None for col in image_hash_util.ENSEMBLE_COLUMNS.values()}
+    for kind, bits in stored.items():
+        row[image_hash_util.ENSEMBLE_COLUMNS[kind]] = _flip(hashes[kind], bits)
+    assert image_hash_util._ensemble_match(hashes, row) is expected
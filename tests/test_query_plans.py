@@ -0,0 +1,248 @@
+"""
+test_query_plans.py — No route query may fall back to a full scan of `reports`
+==============================================================================
+Drives the real routes and query helpers against a migrated, seeded
+database, captures every statement they send to SQLite (with parameters
+expanded) and runs EXPLAIN QUERY PLAN on each SELECT that touches
+`reports`. A `SCAN` of `reports` only passes when it is
+
+  • a covering index scan (never touches the table rows), or
+  • a rowid range (INTEGER PRIMARY KEY), or
+  • an index walk that already delivers the ORDER BY of a LIMIT query
+    (no temp B-tree), so SQLite stops after the page it returns.
+
+Run from the repository root:
+    python -m pytest -q tests
+"""
+
+import re
+import random
+import sqlite3
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import database
+from migrations import run_migrations
+from hash_index import hash_to_db_int, rebuild_hash_index
+
+SEED_ROWS = 5000
+
+_SCAN      = re.compile(r"^SCAN (\w+)\b(.*)$")
+_ALIAS     = re.compile(r"\breports\s+(?:AS\s+)?(\w+)", re.IGNORECASE)
+_LIMIT     = re.compile(r"\bLIMIT\s+\d+\s*$", re.IGNORECASE)
+_NOT_ALIAS = {"where", "join", "left", "inner", "on", "order", "group", "limit", "set", "values"}
+
+
+# ─────────────────────────────────────────────────────────────
+# FIXTURES
+# ─────────────────────────────────────────────────────────────
+def _seed(db, rows: int):
+    """Users, `rows` reports spread over every filter value, some posts and stored sentiment."""
+    db.executemany("INSERT INTO users (username, password, role, full_name) VALUES (?,?,?,?)",
+                   [("admin", "x", "admin", "Admin"), ("citizen1", "x", "citizen", "John"),
+                    ("jane", "x", "citizen", "Jane")])
+    rng   = random.Random(42)
+    batch = []
+    for i in range(rows):
+        image_hash = f"{rng.getrandbits(64):016x}" if i % 3 else None
+        batch.append((
+            f"SEED-{i:07d}", rng.choice([2, 3]), f"Seeded report {i}",
+            rng.choice(["Roads", "Infrastructure", "Sanitation", "Utilities", "Drainage", "Other"]),
+            "Seeded for the query plan test",
+            40.7 + rng.random() / 10 if i % 4 else None,
+            -74.0 + rng.random() / 10 if i % 4 else None,
+            rng.choice(["Pending", "In Progress", "Resolved"]),
+            rng.choice(["Low", "Medium", "High", "Critical"]),
+            image_hash, hash_to_db_int(image_hash) if image_hash else None,
+            "satellite" if i % 10 == 0 else "citizen", 1 if i % 25 == 0 else 0,
+            f"2025-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:00:00",
+        ))
+    db.executemany("""
+        INSERT INTO reports (report_id, user_id, title, category, description, latitude, longitude,
+                             status, severity, image_hash, image_hash_int, source,
+                             satellite_confirmed, created_at)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+    """, batch)
+    db.execute("""
+        INSERT INTO community_posts (report_id, user_id, message)
+        SELECT id, user_id, 'Seeded post' FROM reports WHERE id % 50 = 0
+    """)
+    db.execute("""
+        INSERT INTO report_sentiment (report_id, content_hash, sentiment_score, sentiment_label,
+                                      ai_priority, scored_at)
+        SELECT id, 'seed', (id * 37) % 100, 'Neutral', id % 5 = 0, 0 FROM reports WHERE id % 3 = 0
+    """)
+    db.commit()
+
+
+@pytest.fixture(scope="module")
+def db_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("plans") / "civic_connect.db")
+    db = database.connect(path)
+    run_migrations(db)
+    _seed(db, SEED_ROWS)
+    db.close()
+    return path
+
+
+@pytest.fixture
+def captured(db_path, monkeypatch):
+    """Point every connection the app opens at the seeded database and record its statements."""
+    statements = []
+    connect, connect_readonly = database.connect, database.connect_readonly
+
+    def traced(db):
+        db.set_trace_callback(statements.append)
+        return db
+
+    monkeypatch.setattr(database, "DB_PATH", db_path)
+    monkeypatch.setattr(database, "_read_pool", None)
+    monkeypatch.setattr(database, "connect", lambda path=db_path: traced(connect(path)))
+    monkeypatch.setattr(database, "connect_readonly", lambda path=db_path: traced(connect_readonly(path)))
+    monkeypatch.setattr(database._local, "db", None, raising=False)
+    yield statements
+    thread_db = getattr(database._local, "db", None)
+    if thread_db is not None:
+        thread_db.close()
+    pool = database._read_pool
+    while pool is not None and not pool._idle.empty():
+        pool._idle.get_nowait().close()
+
+
+@pytest.fixture
+def client():
+    from app import app
+    app.config["TESTING"] = True
+    return app.test_client()
+
+
+def _login(client, user_id: int, role: str):
+    with client.session_transaction() as session:
+        session.update(user_id=user_id, role=role, full_name="Test")
+
+
+# ─────────────────────────────────────────────────────────────
+# PLAN CHECK
+# ─────────────────────────────────────────────────────────────
+def full_scans(db_path: str, statements: list) -> list:
+    """(statement, plan detail) for every disallowed SCAN of reports among `statements`."""
+    conn = sqlite3.connect(db_path)
+    failures, seen = [], set()
+    for sql in statements:
+        sql = " ".join(sql.split())
+        if sql in seen or not sql.upper().startswith(("SELECT", "WITH")) or "reports" not in sql:
+            continue
+        seen.add(sql)
+        names = {"reports"} | {a for a in _ALIAS.findall(sql) if a.lower() not in _NOT_ALIAS}
+        plan  = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        ordered_limit = _LIMIT.search(sql) and not any("TEMP B-TREE" in d for d in plan)
+        for detail in plan:
+            m = _SCAN.match(detail)
+            if not m or m.group(1) not in names:
+                continue
+            how = m.group(2)
+            if "COVERING INDEX" in how or "INTEGER PRIMARY KEY" in how:
+                continue
+            if "USING INDEX" in how and ordered_limit:
+                continue
+            failures.append((sql, detail))
+    conn.close()
+    return failures
+
+
+def _queried_reports(statements: list) -> bool:
+    return any("reports" in sql and sql.lstrip().upper().startswith("SELECT") for sql in statements)
+
+
+# ─────────────────────────────────────────────────────────────
+# ROUTES
+# ─────────────────────────────────────────────────────────────
+@pytest.mark.parametrize("user_id, role, url", [
+    (2, "citizen", "/citizen/dashboard"),
+    (2, "citizen", "/citizen/track"),
+    (2, "citizen", "/citizen/track?status=Pending&sort=oldest"),
+    (2, "citizen", "/citizen/community"),
+    (1, "admin",   "/admin/dashboard"),
+    (1, "admin",   "/admin/dashboard?sort=oldest"),
+    (1, "admin",   "/admin/dashboard?status=In+Progress"),
+    (1, "admin",   "/admin/dashboard?severity=Critical"),
+    (1, "admin",   "/admin/dashboard?category=Roads"),
+    (1, "admin",   "/admin/dashboard?source=satellite"),
+    (1, "admin",   "/admin/weather"),
+    (1, "admin",   "/admin/map"),
+    (1, "admin",   "/admin/satellite"),
+    (1, "admin",   "/api/reports"),
+])
+def test_route_queries_avoid_full_scans(captured, db_path, client, user_id, role, url):
+    _login(client, user_id, role)
+    assert client.get(url).status_code == 200
+    assert _queried_reports(captured)
+    assert full_scans(db_path, captured) == []
+
+
+def test_chat_context_avoids_full_scans(captured, db_path, client):
+    from flask import session
+    from ai_routes import _chat_context
+    with client.application.test_request_context():
+        session["user_id"] = 2
+        assert _chat_context()["reports"]
+    assert full_scans(db_path, captured) == []
+
+
+# ─────────────────────────────────────────────────────────────
+# QUERY HELPERS
+# ─────────────────────────────────────────────────────────────
+@pytest.mark.parametrize("args, user_id", [
+    ({}, None),
+    ({"sort": "oldest"}, None),
+    ({"status": "Pending"}, None),
+    ({"severity": "High", "sort": "oldest"}, None),
+    ({"category": "Drainage"}, None),
+    ({"source": "citizen"}, None),
+    ({}, 2),
+    ({"status": "Resolved"}, 3),
+])
+def test_list_reports_pages_avoid_full_scans(captured, db_path, args, user_id):
+    from report_store import list_reports, listing_args
+    db   = database.get_db()
+    page = list_reports(db=db, user_id=user_id, **listing_args(MultiDict(args)))
+    assert page["next_cursor"]
+    list_reports(db=db, user_id=user_id, **listing_args(MultiDict(dict(args, cursor=page["next_cursor"]))))
+    assert full_scans(db_path, captured) == []
+
+
+@pytest.mark.parametrize("sort", ["priority", "score", "newest", "oldest"])
+def test_list_sentiment_pages_avoid_full_scans(captured, db_path, sort):
+    from sentiment_store import list_sentiment
+    db   = database.get_db()
+    page = list_sentiment(sort=sort, db=db)
+    assert page["next_cursor"]
+    list_sentiment(sort=sort, cursor=page["next_cursor"], db=db)
+    assert full_scans(db_path, captured) == []
+
+
+def test_background_queries_avoid_full_scans(captured, db_path):
+    from sentiment_store import stale_reports
+    from classify_backfill import select_reports
+    from satellite_engine import find_matching_citizen_report
+    from image_hash_util import check_duplicate, check_duplicate_nearby
+    db     = database.get_db()
+    hashes = {"phash": "0" * 16, "dhash": "0" * 16, "whash": "0" * 16}
+    stale_reports(db)
+    select_reports(db, limit=100)
+    find_matching_citizen_report(40.75, -73.95, "pothole", db)
+    check_duplicate_nearby(hashes, 40.75, -73.95, db)
+    rebuild_hash_index(db)
+    stored = db.execute("SELECT image_hash FROM reports WHERE image_hash IS NOT NULL LIMIT 1").fetchone()[0]
+    assert check_duplicate(stored, db)["is_duplicate"]
+    assert full_scans(db_path, captured) == []
+
+
+def test_rule_rejects_unbounded_index_scan(db_path):
+    """The check itself: an index walk without a LIMIT is a full scan."""
+    sql = "SELECT * FROM reports r ORDER BY r.created_at DESC"
+    assert full_scans(db_path, [sql]) == [(sql, "SCAN r USING INDEX idx_reports_created")]
+    assert full_scans(db_path, [sql + " LIMIT 26"]) == []
+    assert full_scans(db_path, ["SELECT * FROM reports WHERE description LIKE '%x%'"]) \
+        == [("SELECT * FROM reports WHERE description LIKE '%x%'", "SCAN reports")]
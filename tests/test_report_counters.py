@@ -0,0 +1,100 @@
+"""
+report_counters (migration 005) — the triggers keep every dashboard
+aggregate equal to a GROUP BY over reports through inserts, edits and
+deletes, and the migration backfills rows that already existed.
+"""
+
+import database
+import migrations
+from conftest import insert_report
+from report_store import get_report_counters
+
+
+def _recount(db) -> dict:
+    """The same shape as get_report_counters(), computed from the reports table."""
+    counters = {"total": db.execute("SELECT COUNT(*) FROM reports").fetchone()[0]}
+    for name, expr in migrations.COUNTER_DIMENSIONS:
+        counters[name] = {row[0]: row[1] for row in db.execute(
+            f"SELECT {expr.format(row='reports')}, COUNT(*) FROM reports GROUP BY 1")}
+    return counters
+
+
+def test_insert_counts_every_dimension(db):
+    insert_report(db, "R-1", status="Pending", severity="High", category="Roads")
+    insert_report(db, "R-2", status="Pending", severity="Low", category="Drainage", source="satellite")
+    counters = get_report_counters(db)
+    assert counters["total"] == 2
+    assert counters["status"] == {"Pending": 2}
+    assert counters["severity"] == {"High": 1, "Low": 1}
+    assert counters["category"] == {"Roads": 1, "Drainage": 1}
+    assert counters["source"] == {"citizen": 1, "satellite": 1}
+    assert counters["satellite_confirmed"] == {"0": 2}
+
+
+def test_update_moves_counts_between_values(db):
+    rid = insert_report(db, "R-1", status="Pending", severity="High")
+    insert_report(db, "R-2", status="Pending", severity="High")
+    db.execute("UPDATE reports SET status = 'Resolved', severity = 'Critical', satellite_confirmed = 1 "
+               "WHERE id = ?", (rid,))
+    db.commit()
+    counters = get_report_counters(db)
+    assert counters["total"] == 2
+    assert counters["status"] == {"Pending": 1, "Resolved": 1}
+    assert counters["severity"] == {"High": 1, "Critical": 1}
+    assert counters["satellite_confirmed"] == {"0": 1, "1": 1}
+
+
+def test_untracked_column_update_leaves_counters_alone(db):
+    rid = insert_report(db, "R-1", status="Pending")
+    before = db.execute("SELECT * FROM report_counters ORDER BY dimension, value").fetchall()
+    db.execute("UPDATE reports SET title = 'Renamed', admin_notes = 'seen' WHERE id = ?", (rid,))
+    db.commit()
+    assert db.execute("SELECT * FROM report_counters ORDER BY dimension, value").fetchall() == before
+
+
+def test_delete_drops_zero_counts_from_the_result(db):
+    rid = insert_report(db, "R-1", status="In Progress", category="Utilities")
+    insert_report(db, "R-2", status="Pending")
+    db.execute("DELETE FROM reports WHERE id = ?", (rid,))
+    db.commit()
+    counters = get_report_counters(db)
+    assert counters["total"] == 1
+    assert counters["status"] == {"Pending": 1}
+    assert "Utilities" not in counters["category"]
+
+
+def test_counters_match_a_full_recount_after_mixed_writes(db):
+    for i in range(30):
+        insert_report(db, f"R-{i}", status=["Pending", "In Progress", "Resolved"][i % 3],
+                      severity=["Low", "Medium", "High", "Critical"][i % 4],
+                      category=["Roads", "Drainage", "Other"][i % 3],
+                      commit=False)
+    db.execute("UPDATE reports SET status = 'Resolved' WHERE id % 4 = 0")
+    db.execute("UPDATE reports SET category = 'Sanitation', source = 'satellite' WHERE id % 5 = 0")
+    db.execute("DELETE FROM reports WHERE id % 7 = 0")
+    db.commit()
+    counters = get_report_counters(db)
+    assert counters == _recount(db)
+
+
+def test_rolled_back_insert_is_not_counted(db):
+    insert_report(db, "R-1")
+    insert_report(db, "R-2", commit=False)
+    db.rollback()
+    assert get_report_counters(db)["total"] == 1
+
+
+def test_migration_backfills_existing_reports(db_path, monkeypatch):
+    db = database.get_db()
+    with monkeypatch.context() as m:          # schema as it was just before migration 005
+        m.setattr(migrations, "MIGRATIONS", [mig for mig in migrations.MIGRATIONS if mig[0] < 5])
+        migrations.run_migrations(db)
+    db.execute("INSERT INTO users (id, username, password) VALUES (2, 'citizen1', 'x')")
+    insert_report(db, "OLD-1", status="Pending", severity="High")
+    insert_report(db, "OLD-2", status="Resolved", severity="High")
+
+    migrations.run_migrations(db)
+    counters = get_report_counters(db)
+    assert counters["total"] == 2
+    assert counters["status"] == {"Pending": 1, "Resolved": 1}
+    assert counters["severity"] == {"High": 2}
@@ -0,0 +1,166 @@
+"""
+sentiment_store.py — triggers queue open reports in sentiment_pending when
+they are written, resolving drops the queue row and the stored score, a
+refresh only scores changed content and only clears what it scored, and
+the admin GET serves the table without queueing model work.
+"""
+
+import pytest
+
+import ai_jobs
+import database
+import sentiment_store
+from conftest import insert_report
+from sentiment_store import list_sentiment, refresh_sentiment
+
+
+def _pending(db) -> dict:
+    return {row[0]: row[1] for row in db.execute("SELECT report_id, version FROM sentiment_pending")}
+
+
+def _scored(db) -> dict:
+    return {row[0]: row[1] for row in db.execute("SELECT report_id, sentiment_score FROM report_sentiment")}
+
+
+def _score(report_id: int, score: int = 7, priority: bool = False) -> dict:
+    return {"sentiment_score": score, "sentiment_label": "Frustrated", "sentiment_color": "orange",
+            "sentiment_emoji": "😤", "ai_priority": priority, "ai_note": f"note {report_id}"}
+
+
+@pytest.fixture
+def model(monkeypatch):
+    """score_sentiment stand-in: scores every report it is shown unless told to skip or fail."""
+    class Model:
+        calls, skip, fail, during = [], set(), False, None
+
+        def __call__(self, items):
+            self.calls.append([item["id"] for item in items])
+            if self.during:
+                self.during()
+            if self.fail:
+                raise RuntimeError("overloaded")
+            return {item["id"]: _score(item["id"], 10 - item["id"] % 10) for item in items
+                    if item["id"] not in self.skip}
+
+    model = Model()
+    monkeypatch.setattr(sentiment_store, "score_sentiment", model)
+    return model
+
+
+# ─────────────────────────────────────────────────────────────
+# QUEUE TRIGGERS
+# ─────────────────────────────────────────────────────────────
+def test_open_reports_are_queued_and_edits_bump_the_version(db):
+    a = insert_report(db, "R-1", status="Pending")
+    insert_report(db, "R-2", status="Resolved")
+    assert _pending(db) == {a: 1}
+
+    db.execute("UPDATE reports SET title = 'Deeper pothole' WHERE id = ?", (a,))
+    db.execute("UPDATE reports SET admin_notes = 'crew booked' WHERE id = ?", (a,))     # not sent to the model
+    db.commit()
+    assert _pending(db) == {a: 2}
+
+
+def test_resolving_drops_the_queue_row_and_the_score(db, model):
+    a = insert_report(db, "R-1")
+    b = insert_report(db, "R-2")
+    refresh_sentiment(db)
+    db.execute("UPDATE reports SET title = 'Edited' WHERE id = ?", (a,))
+    db.execute("UPDATE reports SET status = 'Resolved' WHERE id IN (?, ?)", (a, b))
+    db.commit()
+    assert _pending(db) == {} and _scored(db) == {}
+
+    db.execute("UPDATE reports SET status = 'In Progress' WHERE id = ?", (a,))      # re-opened
+    db.commit()
+    assert list(_pending(db)) == [a]
+
+
+def test_delete_drops_both_rows(db, model):
+    a = insert_report(db, "R-1")
+    refresh_sentiment(db)
+    db.execute("UPDATE reports SET severity = 'Critical' WHERE id = ?", (a,))
+    db.execute("DELETE FROM reports WHERE id = ?", (a,))
+    db.commit()
+    assert _pending(db) == {} and _scored(db) == {}
+
+
+# ─────────────────────────────────────────────────────────────
+# REFRESH
+# ─────────────────────────────────────────────────────────────
+def test_refresh_scores_in_batches_and_leaves_skipped_reports_queued(db, model):
+    ids = [insert_report(db, f"R-{i}") for i in range(5)]
+    model.skip = {ids[1]}
+    assert refresh_sentiment(db, batch_size=2) == {"stale": 5, "scored": 4, "failed": 1}
+    assert model.calls == [ids[0:2], ids[2:4], ids[4:]]
+    assert set(_scored(db)) == set(ids) - {ids[1]}
+    assert list(_pending(db)) == [ids[1]]
+
+
+def test_unchanged_content_is_dequeued_without_a_model_call(db, model):
+    a = insert_report(db, "R-1", status="Pending")
+    refresh_sentiment(db)
+    db.execute("UPDATE reports SET status = 'In Progress' WHERE id = ?", (a,))
+    db.execute("UPDATE reports SET status = 'Pending' WHERE id = ?", (a,))              # reverted
+    db.commit()
+    assert _pending(db) == {a: 2}
+
+    model.calls.clear()
+    assert refresh_sentiment(db) == {"stale": 0, "scored": 0, "failed": 0}
+    assert model.calls == [] and _pending(db) == {}
+
+
+def test_edit_during_scoring_stays_queued(db, model):
+    a = insert_report(db, "R-1")
+
+    def edit():
+        other = database.connect()                            # the citizen edits while the model runs
+        other.execute("UPDATE reports SET description = 'Now flooding' WHERE id = ?", (a,))
+        other.commit()
+        other.close()
+
+    model.during = edit
+    refresh_sentiment(db)
+    assert a in _scored(db)
+    assert _pending(db) == {a: 2}                             # the new text still needs a score
+
+
+def test_failed_batch_stores_nothing(db, model):
+    insert_report(db, "R-1")
+    model.fail = True
+    assert refresh_sentiment(db) == {"stale": 1, "scored": 0, "failed": 1}
+    assert _scored(db) == {} and len(_pending(db)) == 1
+
+
+# ─────────────────────────────────────────────────────────────
+# READ
+# ─────────────────────────────────────────────────────────────
+def test_list_sentiment_pages_by_keyset(db, model):
+    ids = [insert_report(db, f"R-{i}") for i in range(1, 6)]            # scores 9, 8, 7, 6, 5
+    refresh_sentiment(db)
+    insert_report(db, "R-NEW")
+
+    first = list_sentiment("score", limit=2, db=db)
+    assert [r["id"] for r in first["reports"]] == ids[:2]
+    assert first["pending"] == 1 and first["sort"] == "score"
+    rest = list_sentiment("score", cursor=first["next_cursor"], limit=10, db=db)
+    assert [r["id"] for r in rest["reports"]] == ids[2:] and rest["next_cursor"] is None
+    assert list_sentiment("bogus", cursor="not-a-cursor", db=db)["sort"] == "priority"
+
+
+def test_get_serves_the_table_without_queueing_a_refresh(db, model, monkeypatch):
+    from app import app
+    monkeypatch.setattr(ai_jobs, "_notify", lambda: None)
+    insert_report(db, "R-1")
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(user_id=1, role="admin")
+
+    body = client.get("/ai/sentiment").get_json()
+    assert (body["reports"], body["pending"]) == ([], 1)
+    assert db.execute("SELECT COUNT(*) FROM ai_jobs").fetchone()[0] == 0
+    assert model.calls == []
+
+    job = client.get("/ai/sentiment?async=1")
+    assert job.status_code == 202
+    assert client.get("/ai/sentiment?async=1").get_json()["job_id"] == job.get_json()["job_id"]
+    assert db.execute("SELECT COUNT(*) FROM ai_jobs").fetchone()[0] == 1
@@ -0,0 +1,109 @@
+"""
+ai_features.stream_chat — reply text streams as tokens, a marker split
+across chunks is held back and never shown, text that only looked like the
+start of the marker is released, and the fields after it arrive as one
+"done" event (also over the /ai/chat/stream SSE route).
+"""
+
+import json
+
+import pytest
+
+import ai_features
+from ai_features import CHAT_FALLBACK, STREAM_MARKER, stream_chat
+
+META = json.dumps({"action": "escalate", "action_label": "Escalate", "quick_replies": ["a", "b", "c"]})
+
+
+class _Stream:
+    def __init__(self, chunks, fail_after=None):
+        self.chunks, self.fail_after = chunks, fail_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        for n, chunk in enumerate(self.chunks):
+            if n == self.fail_after:
+                raise RuntimeError("connection reset")
+            yield chunk
+
+
+@pytest.fixture
+def model(monkeypatch):
+    """Replaces the client: set model.chunks (and model.fail_after) before calling stream_chat."""
+    class Messages:
+        chunks, fail_after = [], None
+
+        def stream(self, **kwargs):
+            return _Stream(self.chunks, self.fail_after)
+
+    messages = Messages()
+    monkeypatch.setattr(ai_features, "client", type("Client", (), {"messages": messages})())
+    return messages
+
+
+def _run() -> tuple:
+    events = list(stream_chat("Hi", [], {"name": "Jane", "reports": []}))
+    tokens = [value for kind, value in events if kind == "token"]
+    assert [kind for kind, _ in events].count("done") == 1 and events[-1][0] == "done"
+    return tokens, events[-1][1]
+
+
+def test_marker_split_across_chunks_is_never_streamed(model):
+    model.chunks = ["Your report ", "is queued.\n@", "@ME", "TA@@", META[:10], META[10:]]
+    tokens, done = _run()
+    assert "".join(tokens) == "Your report is queued.\n"                 # the reply is stripped in "done"
+    assert all("@" not in t for t in tokens)
+    assert done == {"reply": "Your report is queued.", "action": "escalate", "action_label": "Escalate",
+                    "quick_replies": ["a", "b", "c"]}
+
+
+@pytest.mark.parametrize("chunks", [
+    ["Email help@", "city.gov for ", "more."],                # a lone '@' that is not the marker
+    ["Totals @@", "ME are fine"],                              # a longer false start
+    ["Ends with @@MET"],                                       # held to the very end
+])
+def test_text_that_only_looks_like_the_marker_is_released(model, chunks):
+    model.chunks = chunks
+    tokens, done = _run()
+    assert "".join(tokens) == "".join(chunks)
+    assert done["reply"] == "".join(chunks).strip()
+    assert (done["action"], done["quick_replies"]) == ("none", CHAT_FALLBACK["quick_replies"])
+
+
+def test_bad_metadata_falls_back_to_defaults(model):
+    model.chunks = ["Hello.", f"\n{STREAM_MARKER}", "```json\n[1, 2]\n```"]
+    tokens, done = _run()
+    assert tokens == ["Hello."] and (done["action"], done["action_label"]) == ("none", "")
+
+
+def test_failure_mid_stream_keeps_what_was_said(model):
+    model.chunks, model.fail_after = ["Checking your re", "ports @", "never sent"], 2
+    tokens, done = _run()
+    assert "".join(tokens) == "Checking your reports @"
+    assert done["reply"] == "Checking your reports @"
+
+
+def test_failure_before_any_text_sends_the_fallback(model):
+    model.chunks, model.fail_after = ["never sent"], 0
+    tokens, done = _run()
+    assert tokens == [CHAT_FALLBACK["reply"]] and done == CHAT_FALLBACK
+
+
+def test_sse_route_streams_token_events_then_done(db, model):
+    from app import app
+    model.chunks = ["Hel", "lo!", f"\n{STREAM_MARKER}{META}"]
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(user_id=2, role="citizen", full_name="John")
+    resp = client.post("/ai/chat/stream", json={"message": "Hi"})
+    assert resp.mimetype == "text/event-stream"
+    events = [block.split("\n", 1) for block in resp.get_data(as_text=True).strip().split("\n\n")]
+    assert [e[0] for e in events] == ["event: token", "event: token", "event: done"]
+    assert json.loads(events[-1][1][len("data: "):])["action"] == "escalate"
+    assert "".join(json.loads(e[1][len("data: "):])["text"] for e in events[:-1]) == "Hello!"
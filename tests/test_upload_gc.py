@@ -0,0 +1,106 @@
+"""
+upload_gc.py — the sweeper finds refcount-0 files (and their derivatives)
+older than the age floor, leaves referenced or freshly re-used files alone,
+and reports what a dry run, a quarantine or a delete reclaims.
+"""
+
+import os
+import time
+
+import pytest
+
+import upload_gc
+from conftest import insert_report
+from thumbnails import derivative_path
+from upload_gc import find_orphans, sweep
+from upload_store import register_files
+
+OLD = time.time() - 48 * 3600
+
+
+@pytest.fixture
+def static(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_gc, "QUARANTINE_DIR", str(tmp_path / "quarantine"))
+    return str(tmp_path / "static")
+
+
+def _write(static: str, rel: str, data: bytes = b"x" * 100, mtime: float = OLD) -> str:
+    full = os.path.join(static, rel)
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+    with open(full, "wb") as f:
+        f.write(data)
+    os.utime(full, (mtime, mtime))
+    return rel
+
+
+def _exists(static: str, rel: str) -> bool:
+    return os.path.exists(os.path.join(static, rel))
+
+
+@pytest.fixture
+def files(db, static):
+    """One used upload, one orphan with a thumbnail, one orphan too young to touch, one orphan crop."""
+    used, orphan = _write(static, "uploads/aa/bb/used.jpg"), _write(static, "uploads/cc/dd/orphan.jpg")
+    thumb = _write(static, derivative_path(orphan, "thumb"), b"t" * 10)
+    young = _write(static, "uploads/ee/ff/young.jpg", mtime=time.time())
+    crop  = _write(static, "satellite/crop_1.jpg", b"c" * 50)
+    register_files([used, orphan, young, "static/" + crop], db)
+    insert_report(db, "R-1", image_path=used)
+    return {"used": used, "orphan": orphan, "thumb": thumb, "young": young, "crop": crop}
+
+
+def test_find_orphans_reads_refcounts_not_the_disk(db, static, files):
+    found = {rel: (size, src) for rel, size, src in find_orphans(db, static_dir=static)}
+    assert found == {files["orphan"]: (100, files["orphan"]), files["thumb"]: (10, files["orphan"]),
+                     files["crop"]: (50, files["crop"])}
+
+
+def test_dry_run_reports_without_touching_anything(db, static, files):
+    stats = sweep(db, dry_run=True, static_dir=static)
+    assert (stats["orphans"], stats["removed"], stats["reclaimed_bytes"]) == (3, 0, 160)
+    assert stats["by_dir"] == {"uploads": 100, "derivatives": 10, "satellite": 50}
+    assert stats["quarantine"] is None
+    assert all(_exists(static, rel) for rel in files.values())
+    assert db.execute("SELECT COUNT(*) FROM upload_refs").fetchone()[0] == 4
+
+
+def test_quarantine_moves_orphans_out_of_static(db, static, files):
+    stats = sweep(db, static_dir=static)
+    assert (stats["removed"], stats["kept"], stats["reclaimed_bytes"]) == (3, 0, 160)
+    for key in ("orphan", "thumb", "crop"):
+        assert not _exists(static, files[key])
+        assert os.path.exists(os.path.join(stats["quarantine"], files[key]))
+    assert _exists(static, files["used"]) and _exists(static, files["young"])
+    assert {row[0] for row in db.execute("SELECT path FROM upload_refs")} == {files["used"], files["young"]}
+
+
+def test_delete_removes_orphans_for_good(db, static, files):
+    stats = sweep(db, delete=True, static_dir=static)
+    assert stats["removed"] == 3 and stats["quarantine"] is None
+    assert not _exists(static, files["orphan"]) and not os.path.exists(upload_gc.QUARANTINE_DIR)
+
+
+def test_file_re_used_after_the_scan_is_kept(db, static, files, monkeypatch):
+    scan = find_orphans(db, static_dir=static)
+    monkeypatch.setattr(upload_gc, "find_orphans", lambda *a, **k: scan)
+    insert_report(db, "R-2", image_path=files["orphan"])      # referenced between scan and batch
+    os.utime(os.path.join(static, files["crop"]))             # store_upload touched it
+    stats = sweep(db, static_dir=static)
+    assert (stats["removed"], stats["kept"]) == (0, 3)
+    assert all(_exists(static, rel) for rel in files.values())
+
+
+def test_full_walk_finds_files_that_were_never_registered(db, static, files):
+    stray = _write(static, "uploads/1234_old.jpg")
+    found = {rel for rel, _, _ in find_orphans(db, static_dir=static, full=True)}
+    assert stray in found and files["orphan"] in found
+    assert files["used"] not in found and files["young"] not in found
+
+
+def test_purge_drops_old_quarantine_folders(static):
+    old, new = (os.path.join(upload_gc.QUARANTINE_DIR, name) for name in ("20240101-030000", "20990101-030000"))
+    for path in (old, new):
+        os.makedirs(path)
+    os.utime(old, (OLD - 30 * 86400, OLD - 30 * 86400))
+    assert upload_gc.purge_quarantine() == 1
+    assert not os.path.exists(old) and os.path.exists(new)
@@ -0,0 +1,138 @@
+"""
+upload_store.py — byte-identical uploads are stored once at their content
+address, upload_refs counts every row pointing at a file, and ingestion
+refuses non-images, unsupported formats and oversized images or requests.
+"""
+
+import io
+import os
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+import upload_store
+from conftest import insert_report
+from image_hash_util import process_uploaded_image
+from upload_store import content_path, inspect_image, is_content_path, register_files, store_upload
+
+
+def _image(fmt: str = "JPEG", size=(64, 48), color=(200, 30, 30)) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, fmt)
+    return buf.getvalue()
+
+
+def _refs(db) -> dict:
+    return {row["path"]: row["refcount"] for row in db.execute("SELECT path, refcount FROM upload_refs")}
+
+
+def _files(static_dir) -> list:
+    return sorted(os.path.relpath(os.path.join(d, f), static_dir).replace(os.sep, "/")
+                  for d, _, names in os.walk(static_dir) for f in names)
+
+
+# ─────────────────────────────────────────────────────────────
+# CONTENT-ADDRESSED STORE
+# ─────────────────────────────────────────────────────────────
+def test_content_path_is_sharded_by_digest():
+    digest = "3fa2" + "0" * 60
+    assert content_path(digest, ".JPG") == f"uploads/3f/a2/{digest}.jpg"
+    assert is_content_path(content_path(digest, ".jpg"))
+    assert not is_content_path("uploads/1234_photo.jpg")
+    assert not is_content_path(f"uploads/aa/a2/{digest}.jpg")
+
+
+def test_identical_bytes_are_stored_once(db, tmp_path):
+    static = str(tmp_path / "static")
+    data   = _image()
+    first  = store_upload(io.BytesIO(data), ".jpg", static, db)
+    again  = store_upload(io.BytesIO(data), ".jpg", static, db)
+    other  = store_upload(io.BytesIO(_image(color=(0, 0, 255))), ".jpg", static, db)
+
+    assert first == again != other
+    assert is_content_path(first) and is_content_path(other)
+    assert _files(static) == sorted([first, other])           # no leftover .part files
+    with open(os.path.join(static, first), "rb") as f:
+        assert f.read() == data
+    assert _refs(db) == {first: 0, other: 0}                  # registered, not yet used
+
+
+def test_stream_is_left_rewound(db, tmp_path):
+    stream = io.BytesIO(_image())
+    store_upload(stream, ".jpg", str(tmp_path / "static"), db)
+    assert stream.tell() == 0
+
+
+# ─────────────────────────────────────────────────────────────
+# UPLOAD_REFS REFCOUNTS
+# ─────────────────────────────────────────────────────────────
+def test_report_writes_move_refcounts(db):
+    register_files(["uploads/aa/bb/a.jpg"], db)
+    r1 = insert_report(db, "R-1", image_path="uploads/aa/bb/a.jpg")
+    insert_report(db, "R-2", image_path="uploads/aa/bb/a.jpg")
+    insert_report(db, "R-3", image_path="")
+    assert _refs(db) == {"uploads/aa/bb/a.jpg": 2}
+
+    db.execute("UPDATE reports SET image_path = 'uploads/cc/dd/c.jpg' WHERE id = ?", (r1,))
+    db.execute("UPDATE reports SET title = 'Renamed'")
+    db.commit()
+    assert _refs(db) == {"uploads/aa/bb/a.jpg": 1, "uploads/cc/dd/c.jpg": 1}
+
+    db.execute("DELETE FROM reports")
+    db.commit()
+    assert _refs(db) == {"uploads/aa/bb/a.jpg": 0, "uploads/cc/dd/c.jpg": 0}
+
+
+def test_satellite_paths_are_counted_relative_to_static(db):
+    scan = db.execute("INSERT INTO satellite_scans (area_name, latitude, longitude, image_path) "
+                      "VALUES ('Downtown', 1, 2, 'static/satellite/scan_1.jpg')").lastrowid
+    db.execute("INSERT INTO satellite_issues (scan_id, issue_type, image_crop_path) "
+               "VALUES (?, 'pothole', 'static\\satellite\\crop_1.jpg')", (scan,))
+    db.execute("INSERT INTO satellite_issues (scan_id, issue_type, image_crop_path) "
+               "VALUES (?, 'pothole', 'satellite/crop_1.jpg')", (scan,))
+    db.commit()
+    assert _refs(db) == {"satellite/scan_1.jpg": 1, "satellite/crop_1.jpg": 2}
+
+    db.execute("DELETE FROM satellite_issues WHERE id = 1")
+    db.execute("UPDATE satellite_scans SET image_path = NULL")
+    db.commit()
+    assert _refs(db) == {"satellite/scan_1.jpg": 0, "satellite/crop_1.jpg": 1}
+
+
+# ─────────────────────────────────────────────────────────────
+# BOUNDED INGEST
+# ─────────────────────────────────────────────────────────────
+@pytest.mark.parametrize("fmt, ext", [("JPEG", ".jpg"), ("PNG", ".png"), ("GIF", ".gif"), ("WEBP", ".webp")])
+def test_inspect_image_reads_the_real_format(fmt, ext):
+    info = inspect_image(io.BytesIO(_image(fmt)))
+    assert (info["ok"], info["format"], info["ext"], info["width"], info["height"]) == (True, fmt, ext, 64, 48)
+
+
+def test_inspect_image_refusals(monkeypatch):
+    assert "not a readable image" in inspect_image(io.BytesIO(b"%PDF-1.4 not a photo"))["error"]
+    assert "BMP images are not supported" in inspect_image(io.BytesIO(_image("BMP")))["error"]
+    monkeypatch.setattr(upload_store, "MAX_IMAGE_PIXELS", 64 * 48 - 1)
+    info = inspect_image(io.BytesIO(_image()))
+    assert not info["ok"] and info["error"] == "Image is too large (64x48 px)."
+
+
+def test_refused_upload_is_never_hashed_or_written(db, tmp_path, monkeypatch):
+    import image_hash_util
+    monkeypatch.setattr(image_hash_util, "get_image_hashes", lambda _: pytest.fail("hashed a refused file"))
+    upload = FileStorage(stream=io.BytesIO(b"GIF89a-truncated"), filename="photo.gif")
+    result = process_uploaded_image(upload, str(tmp_path / "static" / "uploads"), db)
+    assert result["error"] and result["saved_path"] is None and not result["is_duplicate"]
+    assert not (tmp_path / "static").exists()
+
+
+def test_oversized_request_is_refused_before_the_body_is_read(db, monkeypatch):
+    from app import app
+    monkeypatch.setitem(app.config, "MAX_CONTENT_LENGTH", 1024)
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(user_id=2, role="citizen", username="citizen1")
+    resp = client.post("/citizen/report", content_type="multipart/form-data",
+                       data={"title": "Big", "image": (io.BytesIO(b"\0" * 4096), "big.jpg")})
+    assert resp.status_code == 302                            # 413 handler flashes and redirects
+    assert db.execute("SELECT COUNT(*) FROM reports").fetchone()[0] == 0
@@ -0,0 +1,81 @@
+"""
+user_report_summary (migration 007) — per-citizen totals stay equal to a
+recount of that user's reports through inserts, status changes,
+reassignment and deletes, and the migration backfills existing rows.
+"""
+
+import database
+import migrations
+from conftest import insert_report
+from report_store import get_user_summary
+
+COUNTS = ("total", "pending", "in_progress", "resolved")
+
+
+def _recount(db, user_id: int) -> dict:
+    row = db.execute("""
+        SELECT COUNT(*), COALESCE(SUM(status = 'Pending'), 0), COALESCE(SUM(status = 'In Progress'), 0),
+               COALESCE(SUM(status = 'Resolved'), 0)
+        FROM reports WHERE user_id = ?
+    """, (user_id,)).fetchone()
+    return dict(zip(COUNTS, row))
+
+
+def _counts(db, user_id: int) -> dict:
+    summary = get_user_summary(user_id, db)
+    return {k: summary[k] for k in COUNTS}
+
+
+def test_user_without_reports_gets_zeros(db):
+    assert get_user_summary(3, db) == {"user_id": 3, "total": 0, "pending": 0, "in_progress": 0,
+                                       "resolved": 0, "last_activity": None}
+
+
+def test_insert_counts_per_status(db):
+    insert_report(db, "R-1", status="Pending", created_at="2025-03-01 10:00:00")
+    insert_report(db, "R-2", status="In Progress", created_at="2025-03-05 10:00:00")
+    insert_report(db, "R-3", user_id=3, status="Resolved")
+    assert _counts(db, 2) == {"total": 2, "pending": 1, "in_progress": 1, "resolved": 0}
+    assert _counts(db, 3) == {"total": 1, "pending": 0, "in_progress": 0, "resolved": 1}
+    assert get_user_summary(2, db)["last_activity"] == "2025-03-05 10:00:00"
+
+
+def test_status_change_moves_one_count(db):
+    rid = insert_report(db, "R-1", status="Pending")
+    db.execute("UPDATE reports SET status = 'Resolved' WHERE id = ?", (rid,))
+    db.commit()
+    assert _counts(db, 2) == {"total": 1, "pending": 0, "in_progress": 0, "resolved": 1}
+
+
+def test_reassigning_a_report_moves_it_between_users(db):
+    rid = insert_report(db, "R-1", status="In Progress")
+    db.execute("UPDATE reports SET user_id = 3 WHERE id = ?", (rid,))
+    db.commit()
+    assert _counts(db, 2) == {"total": 0, "pending": 0, "in_progress": 0, "resolved": 0}
+    assert _counts(db, 3) == {"total": 1, "pending": 0, "in_progress": 1, "resolved": 0}
+
+
+def test_summary_matches_a_recount_after_mixed_writes(db):
+    for i in range(24):
+        insert_report(db, f"R-{i}", user_id=2 + i % 2,
+                      status=["Pending", "In Progress", "Resolved", None][i % 4], commit=False)
+    db.execute("UPDATE reports SET status = 'Resolved' WHERE id % 3 = 0")
+    db.execute("UPDATE reports SET user_id = 3 WHERE id % 5 = 0")
+    db.execute("DELETE FROM reports WHERE id % 7 = 0")
+    db.commit()
+    for user_id in (2, 3):
+        assert _counts(db, user_id) == _recount(db, user_id)
+
+
+def test_migration_backfills_existing_reports(db_path, monkeypatch):
+    db = database.get_db()
+    with monkeypatch.context() as m:          # schema as it was just before migration 007
+        m.setattr(migrations, "MIGRATIONS", [mig for mig in migrations.MIGRATIONS if mig[0] < 7])
+        migrations.run_migrations(db)
+    db.execute("INSERT INTO users (id, username, password) VALUES (2, 'citizen1', 'x')")
+    insert_report(db, "OLD-1", status="Pending", created_at="2025-01-01 08:00:00")
+    insert_report(db, "OLD-2", status="Resolved", created_at="2025-02-01 08:00:00")
+
+    migrations.run_migrations(db)
+    assert _counts(db, 2) == {"total": 2, "pending": 1, "in_progress": 0, "resolved": 1}
+    assert get_user_summary(2, db)["last_activity"] >= "2025-02-01 08:00:00"
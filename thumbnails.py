@@ -0,0 +1,81 @@
+"""
+thumbnails.py — Resized WebP derivatives of report images for CivicConnect
+=========================================================================
+Pages show small previews instead of the full-size phone photo. Each
+stored image (uploads or satellite crops) gets one WebP per size in
+DERIVATIVE_SIZES, cached on disk under static/derivatives/:
+
+    static/derivatives/thumb/ab/cd/abcd….webp      (key = SHA-1 of the source path)
+
+Derivatives are generated lazily (then cached) the first time an image
+is requested through the /media/<size>/<path> route in app.py, so the
+report submit path never decodes the photo twice. The cache is keyed by
+source path: a derivative older than its source (a rewritten scan image
+or crop) is rebuilt. Only content-addressed uploads can never change,
+so only they are served with a one-year immutable Cache-Control; every
+other image gets MUTABLE_MAX_AGE and is revalidated after that.
+"""
+
+import os
+import hashlib
+import tempfile
+from PIL import Image, ImageOps
+
+# ─────────────────────────────────────────────────────────────
+# CONFIG
+# ─────────────────────────────────────────────────────────────
+STATIC_DIR       = "static"
+DERIVATIVE_DIR   = "derivatives"                      # under STATIC_DIR
+DERIVATIVE_SIZES = {"thumb": 320, "medium": 960}      # longest edge in px
+SOURCE_DIRS      = ("uploads", "satellite")           # only these may be resized
+WEBP_QUALITY     = 80
+CACHE_MAX_AGE    = 31536000                           # one year — content-addressed uploads
+MUTABLE_MAX_AGE  = 3600                               # other sources, revalidated by Last-Modified
+
+
+def is_servable(rel: str) -> bool:
+    """Only stored report images — no traversal, no arbitrary static files."""
+    parts = rel.replace("\\", "/").split("/")
+    return len(parts) >= 2 and parts[0] in SOURCE_DIRS and ".." not in parts and "" not in parts
+
+
+def derivative_path(rel: str, size: str) -> str:
+    """Derivative location relative to static/ for a source image path."""
+    key = hashlib.sha1(rel.encode()).hexdigest()
+    return f"{DERIVATIVE_DIR}/{size}/{key[:2]}/{key[2:4]}/{key}.webp"
+
+
+# ─────────────────────────────────────────────────────────────
+# GENERATE
+# ─────────────────────────────────────────────────────────────
+def make_derivative(rel: str, size: str, static_dir: str = STATIC_DIR) -> str:
+    """
+    Create (if missing or older than the source) the `size` derivative
+    of static/<rel> and return its full path. JPEGs are decoded at reduced scale via draft mode; EXIF
+    orientation is applied so phone photos aren't sideways.
+    """
+    src  = os.path.join(static_dir, rel)
+    out  = os.path.join(static_dir, derivative_path(rel, size))
+    if os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(src):
+        return out
+
+    edge = DERIVATIVE_SIZES[size]
+    img  = Image.open(src)
+    img.draft("RGB", (edge, edge))
+    img  = ImageOps.exif_transpose(img)
+    img.thumbnail((edge, edge))
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(out), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            img.save(f, "WEBP", quality=WEBP_QUALITY, method=4)
+        os.replace(tmp, out)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return out
+
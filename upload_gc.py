@@ -0,0 +1,257 @@
+"""
+upload_gc.py — Orphaned upload and crop sweeper for CivicConnect
+================================================================
+Rejected uploads, failed inserts, re-pointed reports and per-issue
+satellite crops leave files behind in static/uploads, static/satellite
+and static/derivatives. upload_refs (upload_store.py) counts, per file,
+how many of these still point at it:
+
+  • reports.image_path
+  • satellite_issues.image_crop_path
+  • satellite_scans.image_path
+
+and every file is registered there when it is written, so the orphans
+are simply the rows with refcount 0 (idx_upload_refs_orphans) — no walk
+of the upload tree. Those older than MIN_AGE_HOURS are moved, with their
+derivatives (thumbnails.py), to QUARANTINE_DIR (outside static/, so no
+longer served) or deleted outright, in batches. Each batch holds the
+database write lock while it re-checks its refcounts and moves its files,
+so no report, crop or scan can start pointing at one mid-batch; a file
+touched by store_upload() since the scan (its mtime is refreshed on
+re-use) is put back. Quarantined sweeps older than QUARANTINE_DAYS are
+purged.
+
+--full also walks the disk for files that were never registered (written
+before upload_refs tracked them); run it once after upgrading.
+
+Scheduling: app.py starts the nightly sweep when SCHEDULE_UPLOAD_GC is
+set and it is run directly. Under gunicorn (or with the flag off) use cron:
+    0 3 * * *  cd /path/to/civic_connect && python upload_gc.py
+
+Usage:
+    python upload_gc.py [--dry-run] [--delete] [--full] [--batch N] [--min-age HOURS]
+"""
+
+import os
+import sys
+import time
+import shutil
+from datetime import datetime
+from database import get_db
+from thumbnails import DERIVATIVE_DIR, DERIVATIVE_SIZES, derivative_path
+from upload_store import static_rel
+
+# ─────────────────────────────────────────────────────────────
+# CONFIG
+# ─────────────────────────────────────────────────────────────
+STATIC_DIR      = "static"
+SWEEP_DIRS      = ("uploads", "satellite", DERIVATIVE_DIR)   # under STATIC_DIR
+QUARANTINE_DIR  = "quarantine"                               # project root, not served
+MIN_AGE_HOURS   = 24       # never touch files younger than this (in-flight uploads)
+QUARANTINE_DAYS = 14       # quarantined sweeps older than this are deleted
+BATCH_SIZE      = 200      # files moved per write-locked batch
+
+
+# ─────────────────────────────────────────────────────────────
+# RECONCILE
+# ─────────────────────────────────────────────────────────────
+def referenced_paths(db) -> set:
+    """Every file path (relative to static/) the database still points at, plus their derivatives."""
+    refs = {row[0] for row in db.execute("SELECT path FROM upload_refs WHERE refcount > 0")}
+    refs.update(derivative_path(rel, size) for rel in list(refs) for size in DERIVATIVE_SIZES)
+    return refs
+
+
+def _stat(full: str):
+    try:
+        return os.stat(full)
+    except OSError:
+        return None
+
+
+def find_orphans(db, min_age_hours: float = MIN_AGE_HOURS, static_dir: str = STATIC_DIR,
+                 full: bool = False) -> list:
+    """
+    (rel path, size in bytes, source path) of unreferenced files older than
+    min_age_hours. The source is the upload_refs path whose refcount decides
+    the file's fate (the file itself, or the image a derivative was made from);
+    size is None for a registered file that no longer exists on disk.
+    full=True walks SWEEP_DIRS instead, to catch files never registered.
+    """
+    cutoff  = time.time() - min_age_hours * 3600
+    orphans = []
+    if full:
+        refs = referenced_paths(db)
+        for sub in SWEEP_DIRS:
+            for root, _, files in os.walk(os.path.join(static_dir, sub)):
+                for name in files:
+                    full_path = os.path.join(root, name)
+                    rel = static_rel(os.path.relpath(full_path, static_dir))
+                    st  = None if rel in refs else _stat(full_path)
+                    if st is not None and st.st_mtime < cutoff:
+                        orphans.append((rel, st.st_size, None if rel.startswith(DERIVATIVE_DIR + "/") else rel))
+        return orphans
+
+    for (rel,) in db.execute("SELECT path FROM upload_refs WHERE refcount <= 0").fetchall():
+        st = _stat(os.path.join(static_dir, rel))
+        if st is not None and st.st_mtime >= cutoff:
+            continue
+        orphans.append((rel, st.st_size if st else None, rel))
+        for size in DERIVATIVE_SIZES:
+            deriv = derivative_path(rel, size)
+            dst   = _stat(os.path.join(static_dir, deriv))
+            if dst is not None:
+                orphans.append((deriv, dst.st_size, rel))
+    return orphans
+
+
+def _still_referenced(db, sources: list) -> set:
+    """Batch re-check of upload_refs (every referencing table) just before acting."""
+    if not sources:
+        return set()
+    marks = ",".join("?" * len(sources))
+    return {row[0] for row in db.execute(
+        f"SELECT path FROM upload_refs WHERE refcount > 0 AND path IN ({marks})", sources)}
+
+
+# ─────────────────────────────────────────────────────────────
+# SWEEP
+# ─────────────────────────────────────────────────────────────
+def _take(full_path: str, dest: str, cutoff: float) -> bool:
+    """
+    Move a file out of the way, then check it wasn't touched between the
+    age check and the move (store_upload re-using it); if it was, move it
+    back. Returns True when the file is gone from static/.
+    """
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    shutil.move(full_path, dest)
+    if os.stat(dest).st_mtime >= cutoff:
+        shutil.move(dest, full_path)
+        return False
+    return True
+
+
+def sweep(db=None, delete: bool = False, dry_run: bool = False, batch_size: int = BATCH_SIZE,
+          min_age_hours: float = MIN_AGE_HOURS, static_dir: str = STATIC_DIR, full: bool = False) -> dict:
+    """
+    Quarantine (default) or delete orphaned files in batches, then drop
+    their refcount-0 rows from upload_refs.
+
+    Returns:
+        {
+          "orphans"        : files found unreferenced,
+          "removed"        : files quarantined/deleted (0 on dry run),
+          "kept"           : files re-referenced or touched since the scan,
+          "reclaimed_bytes": bytes freed from static/,
+          "by_dir"         : {"uploads": bytes, "satellite": bytes, "derivatives": bytes},
+          "quarantine"     : folder this sweep moved files to (or None),
+          "purged"         : old quarantine folders deleted,
+        }
+    """
+    conn    = db or get_db()
+    orphans = find_orphans(conn, min_age_hours, static_dir, full)
+    stats   = {"orphans": sum(size is not None for _, size, _ in orphans), "removed": 0, "kept": 0,
+               "reclaimed_bytes": 0, "by_dir": {}, "quarantine": None, "purged": 0}
+    target  = None
+    if not delete and not dry_run:
+        target = os.path.join(QUARANTINE_DIR, datetime.now().strftime("%Y%m%d-%H%M%S"))
+        stats["quarantine"] = target
+
+    cutoff = time.time() - min_age_hours * 3600
+    kept_sources = set()
+    for start in range(0, len(orphans), batch_size):
+        batch = orphans[start:start + batch_size]
+        if not dry_run:
+            conn.execute("BEGIN IMMEDIATE")           # referencing inserts wait until this batch is done
+        try:
+            done = _sweep_batch(conn, batch, stats, kept_sources, cutoff, static_dir, target, delete, dry_run)
+            if done and not dry_run:
+                conn.executemany("DELETE FROM upload_refs WHERE path = ? AND refcount <= 0",
+                                 [(p,) for p in done])
+        finally:
+            if conn.in_transaction:
+                conn.commit()
+        print(f"  🧹 {min(start + batch_size, len(orphans))}/{len(orphans)} checked")
+
+    if not dry_run:
+        stats["purged"] = purge_quarantine()
+
+    verb = "Would reclaim" if dry_run else ("Deleted" if delete else "Quarantined")
+    print(f"✅ {verb} {stats['orphans'] - stats['kept']} orphaned file(s), "
+          f"{stats['reclaimed_bytes'] / (1024 * 1024):.2f} MB "
+          f"({', '.join(f'{k}: {v / 1024:.0f} KB' for k, v in stats['by_dir'].items()) or 'nothing to do'})")
+    return stats
+
+
+def _sweep_batch(conn, batch, stats, kept_sources, cutoff, static_dir, target, delete, dry_run) -> list:
+    """Re-check and remove one batch; returns the sources whose upload_refs row can go."""
+    live = _still_referenced(conn, sorted({src for _, _, src in batch if src}))
+    done = []
+    for rel, size, src in batch:
+        if src in live or src in kept_sources:        # re-used since the scan
+            stats["kept"] += 1
+            continue
+        if size is None:                              # registered, but already gone from disk
+            done.append(rel)
+            continue
+        full_path = os.path.join(static_dir, rel)
+        original  = src is None or src == rel
+        try:
+            fresh = original and os.stat(full_path).st_mtime >= cutoff          # touched since the scan
+            if not fresh and not dry_run:
+                dest  = os.path.join(target, rel) if target else full_path + ".gc"
+                fresh = not _take(full_path, dest, cutoff if original else float("inf"))
+                if not fresh and delete:
+                    os.remove(dest)
+        except OSError as e:
+            print(f"  ⚠️  {rel}: {e}")
+            continue
+        if fresh:
+            kept_sources.add(rel)
+            stats["kept"] += 1
+            continue
+        if src == rel:
+            done.append(rel)
+        top = rel.split("/", 1)[0]
+        stats["by_dir"][top] = stats["by_dir"].get(top, 0) + size
+        stats["reclaimed_bytes"] += size
+        if not dry_run:
+            stats["removed"] += 1
+    return done
+
+
+def purge_quarantine(days: float = QUARANTINE_DAYS) -> int:
+    """Delete quarantine folders older than `days`. Returns how many were removed."""
+    if not os.path.isdir(QUARANTINE_DIR):
+        return 0
+    cutoff, purged = time.time() - days * 86400, 0
+    for entry in os.scandir(QUARANTINE_DIR):
+        if entry.is_dir() and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            purged += 1
+    return purged
+
+
+# ─────────────────────────────────────────────────────────────
+# SCHEDULER
+# ─────────────────────────────────────────────────────────────
+def start_gc_scheduler(hour: int = 3):
+    """Run the sweeper (quarantine mode) every night at `hour`:00."""
+    try:
+        from apscheduler.schedulers.background import BackgroundScheduler
+        scheduler = BackgroundScheduler()
+        scheduler.add_job(sweep, 'cron', hour=hour, minute=0)
+        scheduler.start()
+        print(f"✅ Upload sweeper scheduled — runs daily at {hour:02d}:00")
+        return scheduler
+    except ImportError:
+        print("APScheduler not installed. Run: pip install APScheduler")
+        return None
+
+
+if __name__ == "__main__":
+    args = sys.argv
+    batch   = int(args[args.index("--batch") + 1]) if "--batch" in args else BATCH_SIZE
+    min_age = float(args[args.index("--min-age") + 1]) if "--min-age" in args else MIN_AGE_HOURS
+    sweep(delete="--delete" in args, dry_run="--dry-run" in args, batch_size=batch, min_age_hours=min_age,
+          full="--full" in args)
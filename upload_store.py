@@ -0,0 +1,214 @@
+"""
+upload_store.py — Content-addressed upload storage for CivicConnect
+===================================================================
+Uploads are stored by the SHA-256 of their bytes in two-level sharded
+directories:
+
+    static/uploads/3f/a2/3fa2…e9.jpg      (reports.image_path = 'uploads/3f/a2/3fa2…e9.jpg')
+
+Identical bytes map to the same path, so a re-uploaded file is never
+written twice, and no directory holds more than a sliver of the files.
+How many rows point at each stored file is kept in upload_refs by
+triggers on reports.image_path and on the satellite crop and scan image
+paths (migration 012). Every file is registered there when
+it is written (register_files), so a file whose refcount is zero — never
+used, or no longer used — is found by upload_gc without walking the disk.
+
+Ingestion is bounded: requests over MAX_UPLOAD_BYTES are refused (413)
+before they are read, Werkzeug's default stream factory already spools
+file parts over 500 KB (sized or chunked) to a temp file, and
+inspect_image() checks the format and dimensions from the header alone
+before anything is decoded.
+
+CLI — move existing flat uploads into the sharded layout:
+    python upload_store.py --migrate
+"""
+
+import os
+import sys
+import hashlib
+import tempfile
+from PIL import Image, UnidentifiedImageError
+from database import get_db
+
+# ─────────────────────────────────────────────────────────────
+# CONFIG
+# ─────────────────────────────────────────────────────────────
+STATIC_DIR  = "static"
+UPLOAD_DIR  = "uploads"          # under STATIC_DIR
+CHUNK_SIZE  = 1 << 16
+
+MAX_UPLOAD_BYTES   = 16 * 1024 * 1024    # whole request (MAX_CONTENT_LENGTH)
+MAX_IMAGE_PIXELS   = 40_000_000          # refuse decompression bombs from the header
+IMAGE_FORMATS      = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp"}
+
+
+def content_path(digest: str, ext: str) -> str:
+    """'3fa2…', '.JPG' → 'uploads/3f/a2/3fa2….jpg' (relative to static/)."""
+    return f"{UPLOAD_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}"
+
+
+def is_content_path(rel: str) -> bool:
+    parts = rel.split("/")
+    return (len(parts) == 4 and parts[0] == UPLOAD_DIR
+            and parts[3][:2] == parts[1] and parts[3][2:4] == parts[2])
+
+
+def sha256_stream(stream) -> str:
+    """SHA-256 of a binary stream from its start; leaves it rewound."""
+    stream.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+# ─────────────────────────────────────────────────────────────
+# INGEST — bounded memory, header-only validation
+# ─────────────────────────────────────────────────────────────
+def inspect_image(stream) -> dict:
+    """
+    Identify an upload from its header without decoding pixel data.
+
+    Returns:
+        {
+          "ok"     : True/False,
+          "format" : 'JPEG' / 'PNG' / 'GIF' / 'WEBP' (or None),
+          "ext"    : storage extension for the real format, e.g. '.jpg' (or None),
+          "width"  : px, "height": px,
+          "error"  : reason the upload was refused (or None),
+        }
+    """
+    result = {"ok": False, "format": None, "ext": None, "width": 0, "height": 0, "error": None}
+    stream.seek(0)
+    try:
+        with Image.open(stream) as img:
+            result.update(format=img.format, width=img.width, height=img.height)
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError):
+        result["error"] = "The uploaded file is not a readable image."
+        return result
+    finally:
+        stream.seek(0)
+
+    if result["format"] not in IMAGE_FORMATS:
+        result["error"] = f"{result['format']} images are not supported — please upload JPG, PNG, GIF or WebP."
+    elif result["width"] * result["height"] > MAX_IMAGE_PIXELS:
+        result["error"] = f"Image is too large ({result['width']}x{result['height']} px)."
+    else:
+        result.update(ok=True, ext=IMAGE_FORMATS[result["format"]])
+    return result
+
+
+# ─────────────────────────────────────────────────────────────
+# STORE
+# ─────────────────────────────────────────────────────────────
+def store_upload(stream, ext: str, static_dir: str = STATIC_DIR, db=None) -> str:
+    """
+    Write a binary stream to its content address unless identical bytes
+    are already stored. The stream is copied in CHUNK_SIZE pieces to a
+    temp file in the shard directory and atomically renamed into place,
+    so memory stays flat and readers never see a partial file. The path
+    is registered in upload_refs, so the sweeper finds it if no report
+    ever points at it. Returns the path relative to static/ (for reports.image_path).
+    """
+    rel  = content_path(sha256_stream(stream), ext)
+    full = os.path.join(static_dir, rel)
+    if os.path.exists(full):
+        try:
+            os.utime(full)          # fresh mtime keeps the sweeper (upload_gc) off a re-used file
+            register_files([rel], db)
+            return rel
+        except FileNotFoundError:
+            pass                    # swept between the two calls — write it again
+
+    shard = os.path.dirname(full)
+    os.makedirs(shard, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=shard, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                out.write(chunk)
+        os.replace(tmp, full)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        stream.seek(0)
+    register_files([rel], db)
+    return rel
+
+
+def static_rel(path: str) -> str:
+    """'static\\satellite\\x.jpg' / 'static/uploads/x.jpg' / 'uploads/x.jpg' → path relative to static/."""
+    path = path.replace("\\", "/")
+    prefix = STATIC_DIR + "/"
+    return path[len(prefix):] if path.startswith(prefix) else path
+
+
+def register_files(paths: list, db=None):
+    """Record newly written files in upload_refs (refcount 0 until a row points at them)."""
+    conn = db or get_db()
+    conn.executemany("INSERT INTO upload_refs (path, refcount) VALUES (?, 0) ON CONFLICT(path) DO NOTHING",
+                     [(static_rel(p),) for p in paths if p])
+    conn.commit()
+
+
+# ─────────────────────────────────────────────────────────────
+# MIGRATE — flat uploads/<uuid>_<name> → sharded content paths
+# ─────────────────────────────────────────────────────────────
+def migrate_flat_uploads(db=None, static_dir: str = STATIC_DIR) -> dict:
+    """
+    Move every report image still stored as a flat upload into the
+    content-addressed layout and repoint reports.image_path. Byte-identical
+    uploads collapse into one file. Old files are removed after commit.
+    """
+    conn  = db or get_db()
+    stats = {"moved": 0, "deduplicated": 0, "missing": 0}
+    rows  = conn.execute(
+        "SELECT DISTINCT image_path FROM reports WHERE image_path LIKE ?", (f"{UPLOAD_DIR}/%",)
+    ).fetchall()
+
+    moves = []
+    for row in rows:
+        old = row["image_path"]
+        if is_content_path(old):
+            continue
+        full = os.path.join(static_dir, old)
+        if not os.path.exists(full):
+            stats["missing"] += 1
+            continue
+        with open(full, "rb") as f:
+            new = content_path(sha256_stream(f), os.path.splitext(old)[1])
+            if os.path.exists(os.path.join(static_dir, new)):
+                stats["deduplicated"] += 1
+            else:
+                store_upload(f, os.path.splitext(old)[1], static_dir, conn)
+        moves.append((new, old))
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany("UPDATE reports SET image_path = ? WHERE image_path = ?", moves)
+        conn.executemany("UPDATE OR REPLACE image_files SET path = ? WHERE path = ?", moves)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    for _, old in moves:
+        os.remove(os.path.join(static_dir, old))
+        stats["moved"] += 1
+    return stats
+
+
+if __name__ == "__main__":
+    if "--migrate" in sys.argv:
+        from migrations import run_migrations
+        db = get_db()
+        run_migrations(db)
+        stats = migrate_flat_uploads(db)
+        print(f"✅ Moved {stats['moved']} upload(s) into content-addressed storage "
+              f"({stats['deduplicated']} duplicate(s) collapsed, {stats['missing']} missing)")
+    else:
+        print(__doc__)